@@ -1,8 +1,12 @@
 """Les Pages d'admin commons"""
 from django.contrib import admin
+from django.utils import timezone
 from django.utils.text import Truncator
 from markdownx.admin import MarkdownxModelAdmin
 
+from . import jobs, search
+from .models import Job, touch_articles
+
 
 class SiteArticleAdmin(admin.ModelAdmin):
     """
@@ -52,8 +56,37 @@ class SiteArticleCommentAdmin(MarkdownxModelAdmin):
     actions = ['approve_comments']
 
     def approve_comments(self, request, queryset):
+        # les articles sont relevés avant la mise à jour, qui peut vider le queryset filtré sur `active`
+        article_ids = list(queryset.values_list('article_id', flat=True).distinct())
         queryset.update(active=True)
+        touch_articles(article_ids)
+        # update() n'envoie pas post_save : l'index de recherche est mis à jour ici
+        for article_id in article_ids:
+            search.index_article(article_id)
 
     def save_model(self, request, obj, form, change):
         obj.auteur = request.user
         super().save_model(request, obj, form, change)
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'priority', 'attempts', 'created', 'started', 'finished')
+    list_filter = ('status', 'name')
+    ordering = ('-created',)
+    search_fields = ('name', 'error')
+    readonly_fields = ('created', 'started', 'finished', 'error')
+    actions = ['retry_jobs']
+
+    def get_exclude(self, request, obj=None):
+        # les arguments des tâches privées (courriels) ne sont pas affichés
+        if obj is not None and jobs.is_private(obj.name):
+            return ('arguments',)
+        return super().get_exclude(request, obj)
+
+    def retry_jobs(self, request, queryset):
+        queryset.exclude(status=Job.RUNNING).update(status=Job.PENDING, attempts=0, run_after=timezone.now())
+
+    retry_jobs.short_description = "Relancer les tâches sélectionnées"
+
+
+admin.site.register(Job, JobAdmin)
@@ -1,5 +1,16 @@
 from django.apps import AppConfig
+from django.contrib.auth import get_user_model
+from django.db.models.signals import m2m_changed
 
 
 class CommonConfig(AppConfig):
     name = 'common'
+
+    def ready(self):
+        # Connexion du signal d'invalidation des groupes gardés sur l'user
+        from .user_utils import forget_user_groups
+        m2m_changed.connect(forget_user_groups, sender=get_user_model().groups.through)
+        # Connexion des signaux de l'index de recherche
+        from . import search  # noqa: F401
+        # Déclaration des tâches de fond communes, pour le worker `run_jobs`
+        from . import thumbnails  # noqa: F401
@@ -0,0 +1,227 @@
+"""
+Mesure du temps passé dans chaque requête.
+
+Le middleware compte les requêtes SQL et leur durée, le temps de rendu des
+templates et celui du markdown. Ces durées sont renvoyées au navigateur dans
+l'en-tête `Server-Timing` (visible dans l'onglet réseau des outils de
+développement). Les requêtes HTTP et SQL plus lentes que les seuils
+`INSTRUMENTATION_SLOW_REQUEST_MS` et `INSTRUMENTATION_SLOW_QUERY_MS` sont
+journalisées avec le nom de leur vue.
+
+Chaque worker garde les dernières durées de chaque vue et les publie
+régulièrement dans le cache, où la page des performances les rassemble
+pour en tirer des percentiles.
+"""
+import logging
+import os
+import time
+from collections import defaultdict, deque
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+logger = logging.getLogger(__name__)
+
+SAMPLES_PER_VIEW = 500  # Nombre de durées gardées par vue
+FLUSH_INTERVAL = 30  # Délai (en secondes) entre deux publications des durées d'un worker
+SAMPLES_TIMEOUT = 24 * 3600  # Durée de vie dans le cache des durées publiées
+WORKERS_CACHE_KEY = "instrumentation:workers"
+PERCENTILES = (50, 90, 99)
+
+# Catégories mesurées et leur description dans Server-Timing (en ASCII, c'est un en-tête)
+TIMINGS = (
+    ("db", "SQL"),
+    ("tpl", "Templates"),
+    ("md", "Markdown"),
+)
+
+_current = ContextVar("request_timings", default=None)
+_samples = defaultdict(lambda: deque(maxlen=SAMPLES_PER_VIEW))
+_last_flush = time.monotonic()
+
+
+class RequestTimings:
+    """
+    Durées mesurées pendant une requête, en millisecondes.
+    """
+
+    def __init__(self):
+        self.view = "-"
+        self.queries = 0
+        self.durations = dict.fromkeys((name for name, _ in TIMINGS), 0.0)
+        self.depth = dict.fromkeys(self.durations, 0)
+
+    def header(self, total):
+        """
+        Valeur de l'en-tête Server-Timing.
+         :param total: La durée totale de la requête.
+         :return : Les mesures au format Server-Timing.
+        """
+        metrics = [f'total;dur={total:.1f}']
+        for name, description in TIMINGS:
+            if name == "db":
+                description = f"{self.queries} {description}"
+            metrics.append(f'{name};dur={self.durations[name]:.1f};desc="{description}"')
+        return ", ".join(metrics)
+
+
+@contextmanager
+def timed(name):
+    """
+    Ajoute la durée du bloc à une catégorie de la requête en cours. Les blocs
+    imbriqués de la même catégorie (templates inclus) ne sont comptés qu'une fois.
+     :param name: La catégorie ('tpl' ou 'md').
+    """
+    timings = _current.get()
+    if timings is None or timings.depth[name]:
+        yield
+        return
+    timings.depth[name] += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.durations[name] += (time.perf_counter() - start) * 1000
+        timings.depth[name] -= 1
+
+
+def _time_query(execute, sql, params, many, context):
+    """Wrapper d'exécution SQL : compte et chronomètre chaque requête."""
+    timings = _current.get()
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = (time.perf_counter() - start) * 1000
+        timings.queries += 1
+        timings.durations["db"] += elapsed
+        if elapsed >= settings.INSTRUMENTATION_SLOW_QUERY_MS:
+            logger.warning("Requête SQL lente (%.0f ms) dans %s : %s", elapsed, timings.view, sql)
+
+
+class TimedTemplate(Template):
+    """
+    Template dont le rendu est chronométré.
+    """
+
+    def render(self, context=None, request=None):
+        with timed("tpl"):
+            return super().render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    Moteur de templates Django qui chronomètre le rendu de ses templates.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+def _flush_samples():
+    """Publie dans le cache les durées gardées par ce worker."""
+    global _last_flush
+    _last_flush = time.monotonic()
+    pid = os.getpid()
+    cache.set(f"instrumentation:{pid}", {view: list(samples) for view, samples in _samples.items()},
+              SAMPLES_TIMEOUT)
+    workers = cache.get(WORKERS_CACHE_KEY, set())
+    if pid not in workers:
+        cache.set(WORKERS_CACHE_KEY, workers | {pid}, SAMPLES_TIMEOUT)
+
+
+def record(view, total, queries):
+    """
+    Garde la durée d'une requête pour les percentiles de sa vue.
+     :param view: Le nom de la vue.
+     :param total: La durée de la requête en millisecondes.
+     :param queries: Le nombre de requêtes SQL.
+    """
+    _samples[view].append((total, queries))
+    if time.monotonic() - _last_flush >= FLUSH_INTERVAL:
+        _flush_samples()
+
+
+def percentile(values, rank):
+    """
+    Percentile (au rang le plus proche) d'une liste triée.
+     :param values: Les valeurs triées.
+     :param rank: Le rang, entre 0 et 100.
+     :return : La valeur.
+    """
+    index = max(0, -(-len(values) * rank // 100) - 1)
+    return values[min(index, len(values) - 1)]
+
+
+def view_percentiles():
+    """
+    Percentiles des durées de chaque vue, tous workers confondus.
+     :return : Une liste de dictionnaires `view`, `count`, `p50`, `p90`, `p99`, `max`
+      et `queries` (nombre moyen de requêtes SQL), la vue la plus lente en premier.
+    """
+    _flush_samples()
+    merged = defaultdict(list)
+    workers = cache.get(WORKERS_CACHE_KEY, set())
+    published = cache.get_many([f"instrumentation:{pid}" for pid in workers])
+    for samples in published.values():
+        for view, values in samples.items():
+            merged[view].extend(values)
+    if len(published) < len(workers):
+        # les workers arrêtés ont expiré
+        cache.set(WORKERS_CACHE_KEY, {int(key.rsplit(":", 1)[1]) for key in published}, SAMPLES_TIMEOUT)
+    rows = []
+    for view, values in merged.items():
+        durations = sorted(total for total, _ in values)
+        row = {f"p{rank}": percentile(durations, rank) for rank in PERCENTILES}
+        row.update(view=view, count=len(values), max=durations[-1],
+                   queries=sum(queries for _, queries in values) / len(values))
+        rows.append(row)
+    return sorted(rows, key=lambda row: row["p90"], reverse=True)
+
+
+class InstrumentationMiddleware:
+    """
+    Mesure chaque requête et ajoute l'en-tête Server-Timing à la réponse.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = RequestTimings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(_time_query))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = (time.perf_counter() - start) * 1000
+        response["Server-Timing"] = timings.header(total)
+        record(timings.view, total, timings.queries)
+        if total >= settings.INSTRUMENTATION_SLOW_REQUEST_MS:
+            logger.warning(
+                "Requête lente (%.0f ms) %s %s dans %s : %d requêtes SQL (%.0f ms), "
+                "templates %.0f ms, markdown %.0f ms",
+                total, request.method, request.get_full_path(), timings.view, timings.queries,
+                timings.durations["db"], timings.durations["tpl"], timings.durations["md"])
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timings = _current.get()
+        if timings is not None:
+            match = request.resolver_match
+            timings.view = match.view_name if match else view_func.__name__
@@ -0,0 +1,165 @@
+"""
+File de tâches de fond, stockée dans la base de données du site.
+
+Les traitements longs (miniatures, découpage des datalogs, envoi des
+courriels) sont déclarés avec le décorateur `task` dans le module qui les
+porte, puis mis en file par `enqueue` au lieu d'être exécutés pendant la
+requête. La commande `run_jobs` les exécute dans un groupe de processus, par
+priorité décroissante, en réessayant plus tard celles qui échouent.
+
+Avec `JOBS_EAGER` (tests, développement sans worker), `enqueue` exécute la
+tâche immédiatement.
+"""
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+RETRY_DELAY = 30  # Délai (en secondes) avant le premier nouvel essai, doublé à chaque échec
+STALE_AFTER = 3600  # Durée (en secondes) après laquelle une tâche en cours est jugée abandonnée
+
+TASKS = {}
+
+
+def task(name, priority=0, max_attempts=3, private=False):
+    """
+    Décorateur qui déclare une fonction comme tâche de fond.
+     :param name: Le nom unique de la tâche.
+     :param priority: La priorité par défaut (la plus haute est exécutée d'abord).
+     :param max_attempts: Le nombre maximal d'essais.
+     :param private: Les arguments (adresses, contenus) ne sont pas montrés dans l'administration.
+     :return : Le décorateur, qui renvoie la fonction inchangée.
+    """
+
+    def decorator(function):
+        function.job_options = {"priority": priority, "max_attempts": max_attempts, "private": private}
+        TASKS[name] = function
+        return function
+
+    return decorator
+
+
+def enqueue(name, priority=None, **arguments):
+    """
+    Met une tâche en file. Une tâche identique déjà en attente n'est pas dupliquée.
+     :param name: Le nom de la tâche.
+     :param priority: La priorité, sinon celle de la déclaration.
+     :param arguments: Les arguments de la tâche (sérialisables en JSON).
+     :return : La tâche en file, ou None si elle a été exécutée immédiatement.
+    """
+    function = TASKS[name]
+    if settings.JOBS_EAGER:
+        function(**arguments)
+        return None
+    options = function.job_options
+    if priority is None:
+        priority = options["priority"]
+    pending = Job.objects.filter(name=name, arguments=arguments, status=Job.PENDING).first()
+    if pending is not None:
+        if priority > pending.priority:
+            Job.objects.filter(pk=pending.pk).update(priority=priority)
+        return pending
+    return Job.objects.create(name=name, arguments=arguments, priority=priority,
+                              max_attempts=options["max_attempts"])
+
+
+def release_stale_jobs():
+    """
+    Remet en attente les tâches restées en cours après l'arrêt brutal d'un worker.
+     :return : Le nombre de tâches remises en attente.
+    """
+    limit = timezone.now() - timedelta(seconds=STALE_AFTER)
+    return Job.objects.filter(status=Job.RUNNING, started__lt=limit).update(status=Job.PENDING)
+
+
+def claim_job():
+    """
+    Réserve la prochaine tâche à exécuter. La réservation est une mise à jour
+    conditionnelle : deux workers ne peuvent pas prendre la même tâche.
+     :return : La clé primaire de la tâche, ou None si aucune n'est prête.
+    """
+    while True:
+        now = timezone.now()
+        pk = Job.objects.filter(status=Job.PENDING, run_after__lte=now).order_by(
+            '-priority', 'run_after', 'pk').values_list('pk', flat=True).first()
+        if pk is None:
+            return None
+        if Job.objects.filter(pk=pk, status=Job.PENDING).update(
+                status=Job.RUNNING, started=now, attempts=F('attempts') + 1):
+            return pk
+
+
+def execute(job_id):
+    """
+    Exécute une tâche réservée et enregistre son résultat. Une tâche qui
+    échoue est remise en attente avec un délai croissant, jusqu'à son nombre
+    maximal d'essais.
+     :param job_id: La clé primaire de la tâche.
+     :return : True si la tâche a réussi.
+    """
+    job = Job.objects.get(pk=job_id)
+    try:
+        function = TASKS[job.name]
+        function(**job.arguments)
+    except Exception as err:  # noqa: BLE001 -- toute erreur de la tâche est enregistrée
+        logger.warning("Tâche %s en échec (essai %d/%d): %s", job, job.attempts, job.max_attempts, err)
+        update = {"error": traceback.format_exc(), "finished": timezone.now()}
+        if job.attempts < job.max_attempts:
+            update.update(status=Job.PENDING,
+                          run_after=timezone.now() + timedelta(seconds=RETRY_DELAY * 2 ** (job.attempts - 1)))
+        else:
+            update.update(status=Job.FAILED)
+        Job.objects.filter(pk=job.pk).update(**update)
+        return False
+    Job.objects.filter(pk=job.pk).update(status=Job.DONE, finished=timezone.now(), error="")
+    return True
+
+
+def is_private(name):
+    """
+    Les arguments de la tâche sont-ils à cacher ?
+     :param name: Le nom de la tâche.
+     :return : True pour une tâche déclarée `private` (ou inconnue).
+    """
+    function = TASKS.get(name)
+    return function is None or function.job_options["private"]
+
+
+def run_pending(limit=None):
+    """
+    Exécute dans ce processus les tâches prêtes.
+     :param limit: Le nombre maximal de tâches, sinon toutes.
+     :return : Le nombre de tâches exécutées.
+    """
+    count = 0
+    while limit is None or count < limit:
+        job_id = claim_job()
+        if job_id is None:
+            break
+        execute(job_id)
+        count += 1
+    return count
+
+
+@task("common.send_mail", priority=10, max_attempts=5, private=True)
+def send_mail(subject, body, from_email, to, html=None):
+    """
+    Envoi d'un courriel déjà rendu, hors de la requête qui l'a demandé.
+     :param subject: Le sujet.
+     :param body: Le texte.
+     :param from_email: L'expéditeur.
+     :param to: La liste des destinataires.
+     :param html: La version html, facultative.
+    """
+    message = EmailMultiAlternatives(subject, body, from_email, to)
+    if html:
+        message.attach_alternative(html, "text/html")
+    message.send()
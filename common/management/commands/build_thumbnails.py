@@ -0,0 +1,32 @@
+"""Management command to build the reduced variants of every uploaded image."""
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import models
+from PIL import UnidentifiedImageError
+
+from common.thumbnails import build_variants
+
+
+class Command(BaseCommand):
+    help = "Génère les miniatures et variantes webp des images téléversées."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force", action="store_true",
+            help="Régénère aussi les variantes existantes.")
+
+    def handle(self, *args, **options):
+        for model in apps.get_models():
+            fields = [f.name for f in model._meta.get_fields()
+                      if isinstance(f, models.ImageField) and f.model is model]
+            if not fields:
+                continue
+            written = 0
+            for instance in model.objects.only("pk", *fields).iterator():
+                for field in fields:
+                    try:
+                        written += build_variants(getattr(instance, field), force=options["force"])
+                    except (OSError, UnidentifiedImageError) as err:
+                        self.stderr.write(self.style.WARNING(f"{model.__name__} {instance.pk}.{field}: {err}"))
+            self.stdout.write(f"{model._meta.verbose_name}: {written} variante(s) écrite(s).")
+        self.stdout.write(self.style.SUCCESS("Miniatures à jour."))
@@ -0,0 +1,35 @@
+"""Management command to warm or rebuild the rendered Markdown cache."""
+from django.core.management.base import BaseCommand
+
+from common.models import SiteArticle, SiteArticleComment
+
+CACHE_FIELDS = ('contenu_hash', 'contenu_html', 'contenu_html_court')
+
+
+class Command(BaseCommand):
+    help = "Calcule le rendu html des articles et commentaires dont le contenu a changé."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force", action="store_true",
+            help="Recalcule tous les rendus, même ceux qui sont à jour.")
+        parser.add_argument(
+            "--batch-size", type=int, default=200,
+            help="Nombre d'objets enregistrés par requête.")
+
+    def handle(self, *args, **options):
+        for model in (SiteArticle, SiteArticleComment):
+            batch = []
+            updated = 0
+            for obj in model.objects.order_by('pk').iterator(chunk_size=options["batch_size"]):
+                if obj.refresh_markdown_cache(force=options["force"]):
+                    batch.append(obj)
+                if len(batch) >= options["batch_size"]:
+                    model.objects.bulk_update(batch, CACHE_FIELDS)
+                    updated += len(batch)
+                    batch = []
+            if batch:
+                model.objects.bulk_update(batch, CACHE_FIELDS)
+                updated += len(batch)
+            self.stdout.write(f"{model._meta.verbose_name}: {updated} rendu(s) mis à jour.")
+        self.stdout.write(self.style.SUCCESS("Cache markdown à jour."))
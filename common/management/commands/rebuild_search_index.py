@@ -0,0 +1,20 @@
+"""Management command to rebuild the full-text search index."""
+from django.core.management.base import BaseCommand
+
+from common import search
+
+
+class Command(BaseCommand):
+    help = "Reconstruit l'index de recherche plein texte des articles et commentaires."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=500,
+            help="Nombre d'articles insérés par requête.")
+
+    def handle(self, *args, **options):
+        if not search.search_available():
+            self.stdout.write(self.style.WARNING("Pas d'index plein texte pour cette base de données."))
+            return
+        count = search.rebuild(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"{count} article(s) indexé(s)."))
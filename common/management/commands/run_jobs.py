@@ -0,0 +1,86 @@
+"""Management command running the background jobs queued in the database."""
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from common import jobs
+
+
+def _init_process():
+    """Initialisation d'un processus du groupe : Django, et pas de connexion héritée."""
+    django.setup()
+    connections.close_all()
+
+
+def _execute(job_id):
+    """Exécution d'une tâche dans un processus du groupe."""
+    close_old_connections()
+    try:
+        return jobs.execute(job_id)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = ("Exécute les tâches de fond en file dans la base (miniatures, datalogs, courriels), "
+            "par priorité, dans un groupe de processus.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes", type=int, default=2,
+            help="Nombre de processus exécutant les tâches (1 : dans ce processus).")
+        parser.add_argument(
+            "--poll", type=float, default=2.0,
+            help="Délai (en secondes) entre deux recherches de tâches lorsque la file est vide.")
+        parser.add_argument(
+            "--once", action="store_true",
+            help="Exécute les tâches prêtes puis s'arrête.")
+
+    def handle(self, *args, **options):
+        released = jobs.release_stale_jobs()
+        if released:
+            self.stdout.write(f"{released} tâche(s) abandonnée(s) remise(s) en attente.")
+        if options["processes"] <= 1:
+            self.run_inline(options)
+        else:
+            self.run_pool(options)
+
+    def run_inline(self, options):
+        """Exécution des tâches les unes après les autres, dans ce processus."""
+        while True:
+            count = jobs.run_pending()
+            if count:
+                self.stdout.write(f"{count} tâche(s) exécutée(s).")
+            if options["once"]:
+                return
+            close_old_connections()
+            time.sleep(options["poll"])
+
+    def run_pool(self, options):
+        """Exécution des tâches dans un groupe de processus, une réservation par processus libre."""
+        size = options["processes"]
+        # les processus du groupe ouvrent leurs propres connexions
+        connections.close_all()
+        running = set()
+        done = 0
+        with ProcessPoolExecutor(max_workers=size, initializer=_init_process) as pool:
+            while True:
+                while len(running) < size:
+                    job_id = jobs.claim_job()
+                    if job_id is None:
+                        break
+                    running.add(pool.submit(_execute, job_id))
+                close_old_connections()
+                if not running:
+                    if options["once"]:
+                        break
+                    time.sleep(options["poll"])
+                    continue
+                finished, running = wait(running, timeout=options["poll"], return_when=FIRST_COMPLETED)
+                for future in finished:
+                    future.result()
+                    done += 1
+        self.stdout.write(f"{done} tâche(s) exécutée(s).")
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.15 on 2026-10-18 11:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0002_alter_sitearticle_id_alter_sitearticlecomment_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sitearticle',
+            name='contenu_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=40, verbose_name='Empreinte du contenu rendu'),
+        ),
+        migrations.AddField(
+            model_name='sitearticle',
+            name='contenu_html',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='Rendu html du contenu'),
+        ),
+        migrations.AddField(
+            model_name='sitearticle',
+            name='contenu_html_court',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='Rendu html tronqué du contenu'),
+        ),
+        migrations.AddField(
+            model_name='sitearticlecomment',
+            name='contenu_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=40, verbose_name='Empreinte du contenu rendu'),
+        ),
+        migrations.AddField(
+            model_name='sitearticlecomment',
+            name='contenu_html',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='Rendu html du contenu'),
+        ),
+        migrations.AddField(
+            model_name='sitearticlecomment',
+            name='contenu_html_court',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='Rendu html tronqué du contenu'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.15 on 2026-10-18 11:55
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0003_markdown_cache'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sitearticle',
+            index=models.Index(fields=['date', 'id'], name='article_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sitearticle',
+            index=models.Index(fields=['titre', 'id'], name='article_titre_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.15 on 2026-10-18 12:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0004_article_list_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sitearticle',
+            index=models.Index(fields=['private', 'date', 'id'], name='article_private_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sitearticle',
+            index=models.Index(fields=['developper', 'staff', 'superprivate', 'date'], name='article_flags_date_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations
+
+SEARCH_TABLE = "common_search"
+
+
+def create_search_index(apps, schema_editor):
+    """Table virtuelle FTS5, remplie avec les articles existants (SQLite uniquement)."""
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    article = apps.get_model("common", "SiteArticle")._meta.db_table
+    comment = apps.get_model("common", "SiteArticleComment")._meta.db_table
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+        f"titre, contenu, commentaires, tokenize = 'unicode61 remove_diacritics 2')")
+    schema_editor.execute(
+        f"INSERT INTO {SEARCH_TABLE} (rowid, titre, contenu, commentaires) "
+        f"SELECT a.id, a.titre, a.contenu, COALESCE((SELECT group_concat(c.contenu, char(10)) "
+        f"FROM {comment} c WHERE c.article_id = a.id AND c.active), '') FROM {article} a")
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0005_article_visibility_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
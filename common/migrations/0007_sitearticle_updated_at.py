@@ -0,0 +1,19 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0006_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sitearticle',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now,
+                                       verbose_name='Dernière modification'),
+            preserve_default=False,
+        ),
+    ]
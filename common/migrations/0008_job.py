@@ -0,0 +1,37 @@
+# Generated by Django 5.1.15 on 2026-10-18 12:32
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0007_sitearticle_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Tâche')),
+                ('arguments', models.JSONField(blank=True, default=dict, verbose_name='Arguments')),
+                ('priority', models.IntegerField(default=0, verbose_name="Priorité (la plus haute d'abord)")),
+                ('status', models.CharField(choices=[('pending', 'En attente'), ('running', 'En cours'), ('done', 'Terminée'), ('failed', 'Échouée')], default='pending', max_length=10, verbose_name='État')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Essais')),
+                ('max_attempts', models.PositiveIntegerField(default=3, verbose_name="Nombre maximal d'essais")),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Pas avant')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Créée le')),
+                ('started', models.DateTimeField(blank=True, null=True, verbose_name='Commencée le')),
+                ('finished', models.DateTimeField(blank=True, null=True, verbose_name='Finie le')),
+                ('error', models.TextField(blank=True, default='', verbose_name='Dernière erreur')),
+            ],
+            options={
+                'verbose_name': 'Tâche de fond',
+                'verbose_name_plural': 'Tâches de fond',
+                'ordering': ['-created'],
+                'indexes': [models.Index(fields=['status', '-priority', 'run_after'], name='job_queue_idx')],
+            },
+        ),
+    ]
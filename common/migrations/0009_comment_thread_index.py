@@ -0,0 +1,19 @@
+# Generated by Django 5.1.15 on 2026-10-18 12:37
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0008_job'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sitearticlecomment',
+            index=models.Index(fields=['article', 'active', 'date', 'id'], name='comment_thread_idx'),
+        ),
+    ]
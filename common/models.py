@@ -1,18 +1,152 @@
 """Modèles communs à toutes les apps"""
+import hashlib
+
 from django.conf import settings
 from django.db import models
+from django.db.models import Count, Max, Prefetch, Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils import timezone
 from markdownx.models import MarkdownxField
 from markdownx.utils import markdownify
 from django.utils.text import Truncator
 
+from .instrumentation import timed
+from .user_utils import user_is_developper, user_is_validated
+
 
 TRUNCATION = 200  # Longueur de la troncature dans les articles
 COMMENT_TRUNCATION = 100  # Longueur de la troncature dans les commentaires
 NB_LAST_COMMENTS = 3  # Le nombre de commentaires à renvoyer en mode tronqué
 
 
-class SiteArticle(models.Model):
+def markdown_hash(text):
+    """
+    Empreinte d'un contenu markdown, qui tient compte des extensions de rendu.
+     :param text: Le contenu markdown.
+     :return : L'empreinte hexadécimale.
+    """
+    digest = hashlib.sha1(repr(settings.MARKDOWNX_MARKDOWN_EXTENSIONS).encode())
+    digest.update(str(text).encode())
+    return digest.hexdigest()
+
+
+class RenderedMarkdownModel(models.Model):
+    """
+    Base abstraite qui conserve en base le rendu html du champ `contenu`.
+    Le rendu n'est recalculé que lorsque l'empreinte du contenu change.
+    """
+    truncation = TRUNCATION
+
+    contenu_hash = models.CharField(
+        max_length=40, blank=True, default="", editable=False,
+        verbose_name="Empreinte du contenu rendu")
+    contenu_html = models.TextField(
+        blank=True, default="", editable=False,
+        verbose_name="Rendu html du contenu")
+    contenu_html_court = models.TextField(
+        blank=True, default="", editable=False,
+        verbose_name="Rendu html tronqué du contenu")
+
+    class Meta:
+        abstract = True
+
+    def refresh_markdown_cache(self, force=False):
+        """
+        Recalcule le rendu html si le contenu a changé depuis le dernier rendu.
+         :param force: Recalcule même si l'empreinte est inchangée.
+         :return : True si le rendu a été recalculé.
+        """
+        digest = markdown_hash(self.contenu)
+        if not force and digest == self.contenu_hash:
+            return False
+        with timed("md"):
+            html = markdownify(str(self.contenu))
+        self.contenu_html = html
+        self.contenu_html_court = Truncator(html).chars(self.truncation, truncate='...', html=True)
+        self.contenu_hash = digest
+        return True
+
+    def _markdown_cache(self):
+        """
+        S'assure que le rendu est à jour, et l'enregistre s'il ne l'était pas
+        (objet modifié par `update()` ou antérieur au cache).
+        """
+        if self.refresh_markdown_cache() and self.pk is not None:
+            model = self._meta.get_field('contenu_hash').model
+            model._base_manager.filter(pk=self.pk).update(
+                contenu_hash=self.contenu_hash,
+                contenu_html=self.contenu_html,
+                contenu_html_court=self.contenu_html_court)
+
+    def contenu_md(self):
+        """
+        Rendu tronqué du contenu markdown.
+         :return : La sortie html.
+        """
+        self._markdown_cache()
+        return self.contenu_html_court
+
+    def contenu_all_md(self):
+        """
+        Rendu complet du contenu markdown.
+         :return : La sortie html.
+        """
+        self._markdown_cache()
+        return self.contenu_html
+
+    def save(self, *args, **kwargs):
+        """
+        Surcharge de l'opérateur save pour mettre à jour le rendu html.
+        """
+        update_fields = kwargs.get('update_fields')
+        if self.refresh_markdown_cache() and update_fields is not None:
+            kwargs['update_fields'] = {
+                *update_fields, 'contenu_hash', 'contenu_html', 'contenu_html_court'}
+        super().save(*args, **kwargs)
+
+
+class SiteArticleQuerySet(models.QuerySet):
+    """
+    Requêtes sur les articles
+    """
+
+    def visible_to(self, user):
+        """
+        Restreint aux articles que l'utilisateur a le droit de voir, le filtre
+        est fait par la base de données.
+         :param user: L'utilisateur (éventuellement anonyme).
+         :return : Le queryset filtré.
+        """
+        if not user.is_authenticated:
+            return self.filter(private=False)
+        if user.is_superuser:
+            return self
+        visible = Q()
+        if not user_is_validated(user):
+            visible &= Q(superprivate=False) | Q(auteur=user)
+        if not user.is_staff:
+            visible &= Q(staff=False) | Q(auteur=user)
+        if not user_is_developper(user):
+            visible &= Q(developper=False)
+        return self.filter(visible)
+
+    def with_comments(self):
+        """
+        Annote le nombre de commentaires actifs et précharge les `NB_LAST_COMMENTS`
+        derniers, avec leur auteur, pour les pages de liste.
+         :return : Le queryset enrichi.
+        """
+        last_comments = SiteArticleComment.objects.filter(
+            active=True).select_related('auteur').order_by('-date')[:NB_LAST_COMMENTS]
+        return self.select_related('auteur').annotate(
+            nb_active_comments=Count('comments', filter=Q(comments__active=True)),
+            last_comment_date=Max('comments__date', filter=Q(comments__active=True)),
+        ).prefetch_related(
+            Prefetch('comments', queryset=last_comments, to_attr='last_comments'))
+
+
+class SiteArticle(RenderedMarkdownModel):
     """
     Objet de manipulation des articles
     """
@@ -31,6 +165,9 @@ class SiteArticle(models.Model):
     date = models.DateTimeField(
         default=timezone.now,
         verbose_name="Date de parution")
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Dernière modification")
     private = models.BooleanField(
         default=False,
         verbose_name="Nécessite un utilisateur pour être vu")
@@ -44,32 +181,26 @@ class SiteArticle(models.Model):
             default=False,
             verbose_name="Nécessite un utilisateur 'développeur' pour être vu")
 
-    def contenu_md(self):
-        """
-        Rendu tronqué du contenu markdown.
-         :return : La sortie html.
-        """
-        return Truncator(markdownify(str(self.contenu))).chars(TRUNCATION, truncate='...', html=True)
-
-    def contenu_all_md(self):
-        """
-        Rendu complet du contenu markdown.
-         :return : La sortie html.
-        """
-        return markdownify(str(self.contenu))
+    objects = SiteArticleQuerySet.as_manager()
 
     def nb_comments(self):
         """
         Obtient le nombre de commentaires associés à l'article.
+        Utilise l'annotation de `with_comments()` si elle est présente.
          :return : Nombre de commentaires.
         """
-        return len(self.get_all_comments())
+        if hasattr(self, 'nb_active_comments'):
+            return self.nb_active_comments
+        return self.get_all_comments().count()
 
     def get_comments(self):
         """
         Fonction qui renvoie les `NB_LAST_COMMENTS` derniers commentaires.
+        Utilise le préchargement de `with_comments()` s'il est présent.
          :return : Les NB_LAST_COMMENTS derniers commentaires.
         """
+        if hasattr(self, 'last_comments'):
+            return self.last_comments
         return self.get_all_comments()[:NB_LAST_COMMENTS]
 
     def get_all_comments(self):
@@ -77,7 +208,7 @@ class SiteArticle(models.Model):
         Renvoie la liste de tous les commentaires.
          :return : Tous les commentaires
         """
-        return self.comments.filter(active=True).order_by("-date")
+        return self.comments.filter(active=True).select_related('auteur').order_by("-date")
 
     def save(self, *args, **kwargs):
         """
@@ -93,15 +224,25 @@ class SiteArticle(models.Model):
     class Meta:
         verbose_name = "article"
         ordering = ['-date']
+        indexes = [
+            # Curseurs des pages de liste, départagés par la clé primaire.
+            models.Index(fields=['date', 'id'], name='article_date_idx'),
+            models.Index(fields=['titre', 'id'], name='article_titre_idx'),
+            # Filtre de visibilité, suivi du tri par date.
+            models.Index(fields=['private', 'date', 'id'], name='article_private_date_idx'),
+            models.Index(fields=['developper', 'staff', 'superprivate', 'date'], name='article_flags_date_idx'),
+        ]
 
     def __str__(self):
         return self.titre
 
 
-class SiteArticleComment(models.Model):
+class SiteArticleComment(RenderedMarkdownModel):
     """
     Objet de stockage des commentaires
     """
+    truncation = COMMENT_TRUNCATION
+
     article = models.ForeignKey(
         SiteArticle, on_delete=models.CASCADE,
         verbose_name="Article lié",
@@ -118,23 +259,78 @@ class SiteArticleComment(models.Model):
     active = models.BooleanField(
         default=False)
 
-    def contenu_md(self):
-        """
-        Rendu tronqué du contenu markdown.
-         :return : La sortie html.
-        """
-        return Truncator(markdownify(str(self.contenu))).chars(COMMENT_TRUNCATION, truncate='...', html=True)
-
-    def contenu_all_md(self):
-        """
-        Rendu complet du contenu markdown.
-         :return : La sortie html.
-        """
-        return markdownify(str(self.contenu))
-
     class Meta:
         verbose_name = "Commentaire d'article"
         ordering = ['-date']
+        indexes = [
+            # Fil des commentaires d'un article, paginé par curseur sur la date.
+            models.Index(fields=['article', 'active', 'date', 'id'], name='comment_thread_idx'),
+        ]
 
     def __str__(self):
         return f"{self.auteur}_{self.date}"
+
+
+def touch_articles(article_ids):
+    """
+    Marque des articles comme modifiés, pour les écritures qui contournent `save()`
+    (et donc `auto_now`) : les fragments de page en cache sont alors renouvelés.
+     :param article_ids: Les clés primaires des articles.
+    """
+    SiteArticle.objects.filter(pk__in=article_ids).update(updated_at=timezone.now())
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def comment_changed(sender, instance, **kwargs):
+    """Un commentaire ajouté, modifié ou supprimé modifie aussi son article."""
+    if isinstance(instance, SiteArticleComment):
+        touch_articles([instance.article_id])
+
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def author_changed(sender, instance, update_fields=None, **kwargs):
+    """Le nom d'un utilisateur est affiché avec ses articles et ses commentaires."""
+    if kwargs.get("created") or update_fields == frozenset({"last_login"}):
+        return
+    touch_articles(SiteArticle.objects.filter(
+        Q(auteur=instance) | Q(comments__auteur=instance)).values('pk'))
+
+class Job(models.Model):
+    """
+    Tâche de fond en attente ou exécutée par la commande `run_jobs` (voir `common.jobs`).
+    """
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUSES = (
+        (PENDING, "En attente"),
+        (RUNNING, "En cours"),
+        (DONE, "Terminée"),
+        (FAILED, "Échouée"),
+    )
+
+    name = models.CharField(max_length=100, verbose_name="Tâche")
+    arguments = models.JSONField(blank=True, default=dict, verbose_name="Arguments")
+    priority = models.IntegerField(default=0, verbose_name="Priorité (la plus haute d'abord)")
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING, verbose_name="État")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Essais")
+    max_attempts = models.PositiveIntegerField(default=3, verbose_name="Nombre maximal d'essais")
+    run_after = models.DateTimeField(default=timezone.now, verbose_name="Pas avant")
+    created = models.DateTimeField(auto_now_add=True, verbose_name="Créée le")
+    started = models.DateTimeField(null=True, blank=True, verbose_name="Commencée le")
+    finished = models.DateTimeField(null=True, blank=True, verbose_name="Finie le")
+    error = models.TextField(blank=True, default="", verbose_name="Dernière erreur")
+
+    class Meta:
+        verbose_name = "Tâche de fond"
+        verbose_name_plural = "Tâches de fond"
+        ordering = ['-created']
+        indexes = [
+            models.Index(fields=['status', '-priority', 'run_after'], name='job_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk}"
@@ -0,0 +1,106 @@
+"""
+Profilage à la demande d'une requête, réservé à l'équipe.
+
+Un membre de l'équipe ajoute `?_profile` à n'importe quelle adresse : la
+requête est exécutée sous cProfile et tracemalloc, et le rapport (arbre des
+appels trié par temps cumulé et plus grosses allocations mémoire) est
+enregistré dans `PROFILE_DIR`. Avec `?_profile=show`, le rapport est renvoyé
+à la place de la page.
+"""
+import cProfile
+import io
+import pstats
+import re
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.http import HttpResponse
+
+PROFILE_PARAMETER = "_profile"
+PROFILE_KEEP = 50  # Nombre de rapports gardés, les plus anciens sont supprimés
+PROFILE_STATS = 60  # Nombre de fonctions dans le rapport
+PROFILE_ALLOCATIONS = 25  # Nombre d'allocations dans le rapport
+PROFILE_NAME = re.compile(r"^[\w.-]+\.txt$")
+
+
+def profile_reports():
+    """
+    Rapports enregistrés, le plus récent en premier.
+     :return : La liste des chemins des rapports.
+    """
+    if not settings.PROFILE_DIR.is_dir():
+        return []
+    return sorted(settings.PROFILE_DIR.glob("*.txt"), reverse=True)
+
+
+def profile_report(name):
+    """
+    Chemin d'un rapport enregistré.
+     :param name: Le nom du fichier.
+     :return : Le chemin, ou None si le rapport n'existe pas.
+    """
+    if not PROFILE_NAME.match(name):
+        return None
+    path = settings.PROFILE_DIR / name
+    return path if path.is_file() else None
+
+
+def _report(request, elapsed, profiler, snapshot):
+    """Texte du rapport de profilage."""
+    out = io.StringIO()
+    out.write(f"{request.method} {request.get_full_path()}\n")
+    match = request.resolver_match
+    out.write(f"Vue : {match.view_name if match else '-'}\n")
+    out.write(f"Durée : {elapsed:.1f} ms\n\n")
+    stats = pstats.Stats(profiler, stream=out)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(PROFILE_STATS)
+    stats.print_callees(PROFILE_STATS // 3)
+    out.write(f"\nAllocations mémoire (top {PROFILE_ALLOCATIONS}) :\n")
+    for stat in snapshot.statistics("lineno")[:PROFILE_ALLOCATIONS]:
+        out.write(f"{stat}\n")
+    return out.getvalue()
+
+
+def _save(request, report):
+    """Enregistre le rapport et supprime les plus anciens."""
+    settings.PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    match = request.resolver_match
+    view = re.sub(r"[^\w.-]", "_", match.view_name if match else "page")
+    path = settings.PROFILE_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}-{time.time_ns() % 10 ** 6:06d}-{view}.txt"
+    path.write_text(report, encoding="utf-8")
+    for old in profile_reports()[PROFILE_KEEP:]:
+        old.unlink(missing_ok=True)
+    return path
+
+
+class ProfilingMiddleware:
+    """
+    Profile les requêtes de l'équipe qui portent le paramètre `_profile`.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        flag = request.GET.get(PROFILE_PARAMETER)
+        if flag is None or not request.user.is_staff:
+            return self.get_response(request)
+        profiler = cProfile.Profile()
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            response = profiler.runcall(self.get_response, request)
+            snapshot = tracemalloc.take_snapshot()
+        finally:
+            if not tracing:
+                tracemalloc.stop()
+        elapsed = (time.perf_counter() - start) * 1000
+        report = _report(request, elapsed, profiler, snapshot)
+        path = _save(request, report)
+        if flag == "show":
+            return HttpResponse(report, content_type="text/plain; charset=utf-8")
+        response["X-Profile"] = path.name
+        return response
@@ -0,0 +1,183 @@
+"""
+Recherche plein texte dans les articles et leurs commentaires.
+
+Avec SQLite, l'index est une table virtuelle FTS5 (créée par la migration
+`0006_search_index`) dont chaque ligne a pour rowid la clé primaire de
+l'article : titre, contenu et commentaires actifs concaténés. Les signaux
+ci-dessous la tiennent à jour, `rebuild_search_index` la reconstruit.
+Avec une autre base, la recherche se rabat sur un filtre `icontains`.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.html import escape
+
+from .models import SiteArticle, SiteArticleComment
+
+SEARCH_TABLE = "common_search"
+SEARCH_LIMIT = 50  # Nombre maximal de résultats renvoyés
+SNIPPET_TOKENS = 24  # Longueur des extraits, en mots
+# Poids bm25 des colonnes titre, contenu et commentaires
+WEIGHTS = (10.0, 1.0, 0.5)
+# Délimiteurs des termes trouvés, remplacés par <mark> une fois le texte échappé
+MARK_START, MARK_END = "\x02", "\x03"
+WORD = re.compile(r"\w+")
+
+
+def search_available():
+    """
+    Indique si l'index plein texte est utilisable.
+     :return : True si la base est SQLite (FTS5).
+    """
+    return connection.vendor == "sqlite"
+
+
+def _highlight(text):
+    """Échappe le texte et transforme les délimiteurs en balises <mark>."""
+    return escape(text).replace(MARK_START, "<mark>").replace(MARK_END, "</mark>")
+
+
+def fts_query(text):
+    """
+    Transforme la saisie de l'utilisateur en requête FTS5 : chaque mot est
+    une chaîne exacte, le dernier est un préfixe.
+     :param text: La saisie.
+     :return : La requête, vide si la saisie ne contient aucun mot.
+    """
+    words = WORD.findall(text)
+    if not words:
+        return ""
+    return " ".join(f'"{w}"' for w in words) + "*"
+
+
+def _document(article_id):
+    """Colonnes indexées d'un article."""
+    titre, contenu = SiteArticle.objects.filter(pk=article_id).values_list("titre", "contenu").get()
+    comments = SiteArticleComment.objects.filter(
+        article_id=article_id, active=True).order_by("date").values_list("contenu", flat=True)
+    return article_id, titre, contenu, "\n".join(comments)
+
+
+def index_article(article_id):
+    """
+    Met à jour la ligne de l'index d'un article.
+     :param article_id: La clé primaire de l'article.
+    """
+    if not search_available():
+        return
+    try:
+        document = _document(article_id)
+    except SiteArticle.DoesNotExist:
+        remove_article(article_id)
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [article_id])
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE} (rowid, titre, contenu, commentaires) "
+                       f"VALUES (%s, %s, %s, %s)", document)
+
+
+def remove_article(article_id):
+    """
+    Retire un article de l'index.
+     :param article_id: La clé primaire de l'article.
+    """
+    if not search_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [article_id])
+
+
+def rebuild(batch_size=500):
+    """
+    Reconstruit tout l'index.
+     :param batch_size: Nombre d'articles insérés par requête.
+     :return : Le nombre d'articles indexés.
+    """
+    if not search_available():
+        return 0
+    comments = {}
+    for article_id, contenu in SiteArticleComment.objects.filter(
+            active=True).order_by("date").values_list("article_id", "contenu").iterator():
+        comments.setdefault(article_id, []).append(contenu)
+    count = 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        batch = []
+        articles = SiteArticle.objects.order_by("pk").values_list("pk", "titre", "contenu")
+        for pk, titre, contenu in articles.iterator(chunk_size=batch_size):
+            batch.append((pk, titre, contenu, "\n".join(comments.get(pk, []))))
+            if len(batch) >= batch_size:
+                cursor.executemany(f"INSERT INTO {SEARCH_TABLE} (rowid, titre, contenu, commentaires) "
+                                   f"VALUES (%s, %s, %s, %s)", batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            cursor.executemany(f"INSERT INTO {SEARCH_TABLE} (rowid, titre, contenu, commentaires) "
+                               f"VALUES (%s, %s, %s, %s)", batch)
+            count += len(batch)
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+    return count
+
+
+def search(text, articles=None, limit=SEARCH_LIMIT):
+    """
+    Recherche des articles, classés par pertinence (bm25).
+     :param text: La saisie de l'utilisateur.
+     :param articles: Queryset d'articles auquel restreindre la recherche (p.ex. `visible_to`).
+     :param limit: Le nombre maximal de résultats.
+     :return : Une liste de dictionnaires `id`, `titre` et `extrait` (html surligné).
+    """
+    if articles is None:
+        articles = SiteArticle.objects.all()
+    if not search_available():
+        words = WORD.findall(text)
+        if not words:
+            return []
+        match = Q()
+        for word in words:
+            match &= Q(titre__icontains=word) | Q(contenu__icontains=word)
+        return [
+            {"id": pk, "titre": escape(titre), "extrait": escape(contenu[:200])}
+            for pk, titre, contenu in articles.filter(match).values_list("pk", "titre", "contenu")[:limit]
+        ]
+    query = fts_query(text)
+    if not query:
+        return []
+    visible, visible_params = articles.order_by().values("pk").query.sql_with_params()
+    marks = f"'{MARK_START}', '{MARK_END}'"
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid, highlight({SEARCH_TABLE}, 0, {marks}), "
+            f"snippet({SEARCH_TABLE}, 1, {marks}, '…', {SNIPPET_TOKENS}), "
+            f"snippet({SEARCH_TABLE}, 2, {marks}, '…', {SNIPPET_TOKENS}) "
+            f"FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s AND rowid IN ({visible}) "
+            f"ORDER BY bm25({SEARCH_TABLE}, {', '.join(map(str, WEIGHTS))}) LIMIT %s",
+            [query, *visible_params, limit])
+        rows = cursor.fetchall()
+    results = []
+    for pk, titre, contenu, commentaires in rows:
+        # l'extrait vient du contenu, ou des commentaires si seuls eux correspondent
+        extrait = contenu if MARK_START in contenu or MARK_START not in commentaires else commentaires
+        results.append({"id": pk, "titre": _highlight(titre), "extrait": _highlight(extrait)})
+    return results
+
+
+@receiver(post_save)
+def index_saved_article(sender, instance, **kwargs):
+    """Les articles (toutes classes filles) et commentaires enregistrés sont réindexés."""
+    if isinstance(instance, SiteArticle):
+        index_article(instance.pk)
+    elif isinstance(instance, SiteArticleComment):
+        index_article(instance.article_id)
+
+
+@receiver(post_delete)
+def index_deleted_article(sender, instance, **kwargs):
+    """Les articles supprimés sortent de l'index, les commentaires supprimés aussi."""
+    if isinstance(instance, SiteArticle):
+        remove_article(instance.pk)
+    elif isinstance(instance, SiteArticleComment):
+        index_article(instance.article_id)
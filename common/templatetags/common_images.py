@@ -0,0 +1,29 @@
+"""common.templatetags.common_images"""
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from common.thumbnails import variants
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(image, sizes="100vw", alt=""):
+    """
+    render an image with its reduced variants in `srcset`, webp first
+    """
+    if not image:
+        return ""
+    webp = variants(image, "webp")
+    jpeg = variants(image, "jpg")
+    if not jpeg:
+        return format_html('<img src="{}" alt="{}" loading="lazy">', image.url, alt)
+    srcset = {
+        name: format_html_join(", ", "{} {}w", ((url, width) for width, url in found))
+        for name, found in (("webp", webp), ("jpeg", jpeg))
+    }
+    source = format_html(
+        '<source type="image/webp" srcset="{}" sizes="{}">', srcset["webp"], sizes) if webp else ""
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" alt="{}" loading="lazy"></picture>',
+        source, jpeg[-1][1], srcset["jpeg"], sizes, alt)
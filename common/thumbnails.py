@@ -0,0 +1,117 @@
+"""Variantes réduites des images téléversées, pour les attributs `srcset`"""
+import logging
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.apps import apps
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .jobs import task
+from .models import SiteArticle, touch_articles
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_WIDTHS = (160, 320, 640, 1280)  # Largeurs des variantes en pixels
+VARIANT_DIR = "thumbs"  # Sous-répertoire des variantes, à côté de l'original
+# Extension, format Pillow et options d'enregistrement des variantes
+VARIANT_FORMATS = (
+    ("webp", "WEBP", {"quality": 80, "method": 4}),
+    ("jpg", "JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+)
+
+
+def variant_name(name, width, extension):
+    """
+    Nom de stockage d'une variante.
+     :param name: Le nom de stockage de l'image originale.
+     :param width: La largeur de la variante.
+     :param extension: L'extension du format de la variante.
+     :return : Le nom de stockage de la variante.
+    """
+    path = PurePosixPath(name)
+    return str(path.parent / VARIANT_DIR / f"{path.stem}-{width}.{extension}")
+
+
+def variants(field_file, extension):
+    """
+    Variantes existantes d'une image dans un format.
+     :param field_file: L'image (valeur d'un ImageField).
+     :param extension: L'extension du format voulu.
+     :return : La liste des couples (largeur, url), par largeur croissante.
+    """
+    storage = field_file.storage
+    found = []
+    for width in THUMBNAIL_WIDTHS:
+        name = variant_name(field_file.name, width, extension)
+        if not storage.exists(name):
+            break
+        found.append((width, storage.url(name)))
+    return found
+
+
+def build_variants(field_file, force=False):
+    """
+    Génère les variantes manquantes d'une image, sans jamais l'agrandir.
+     :param field_file: L'image (valeur d'un ImageField).
+     :param force: Régénère aussi les variantes existantes.
+     :return : Le nombre de variantes écrites.
+    """
+    if not field_file:
+        return 0
+    storage = field_file.storage
+    with field_file.open("rb") as f:
+        image = Image.open(f)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    written = 0
+    for width in THUMBNAIL_WIDTHS:
+        if width >= image.width:
+            break
+        resized = None
+        for extension, image_format, options in VARIANT_FORMATS:
+            name = variant_name(field_file.name, width, extension)
+            if storage.exists(name):
+                if not force:
+                    continue
+                storage.delete(name)
+            if resized is None:
+                height = round(image.height * width / image.width)
+                resized = image.resize((width, height), Image.Resampling.LANCZOS)
+            output = resized if image_format == "WEBP" or resized.mode == "RGB" else resized.convert("RGB")
+            buffer = BytesIO()
+            output.save(buffer, image_format, **options)
+            storage.save(name, ContentFile(buffer.getvalue()))
+            written += 1
+    return written
+
+
+def build_instance_variants(instance, *field_names):
+    """
+    Génère les variantes des images d'un objet, sans faire échouer son
+    enregistrement si une image est illisible.
+     :param instance: L'objet qui porte les images.
+     :param field_names: Les noms des champs ImageField.
+    """
+    for field_name in field_names:
+        try:
+            build_variants(getattr(instance, field_name))
+        except (OSError, UnidentifiedImageError) as err:
+            logger.warning("Variantes de %s.%s non générées: %s", instance, field_name, err)
+
+
+@task("common.thumbnails")
+def build_variants_job(model, pk, fields):
+    """
+    Tâche de fond : variantes des images d'un objet. Les articles sont marqués
+    modifiés, pour que les fragments de page en cache montrent les miniatures.
+     :param model: Le modèle de l'objet ('app.Model').
+     :param pk: La clé primaire de l'objet.
+     :param fields: Les noms des champs ImageField.
+    """
+    instance = apps.get_model(model)._base_manager.filter(pk=pk).first()
+    if instance is None:
+        return
+    build_instance_variants(instance, *fields)
+    if isinstance(instance, SiteArticle):
+        touch_articles([pk])
@@ -1,6 +1,32 @@
 """Quelques fonctions utiles pour la gestion des utilisateurs"""
 
 
+def user_groups(user):
+    """
+    Noms des groupes de l’user, chargés une seule fois puis gardés sur l’objet user
+    (donc pour la durée de la requête).
+    :param user: L'user à tester
+    :return: L’ensemble des noms de groupes.
+    """
+    if not user.is_authenticated:
+        return frozenset()
+    names = getattr(user, "_group_names", None)
+    if names is None:
+        names = frozenset(user.groups.values_list("name", flat=True))
+        user._group_names = names
+    return names
+
+
+def user_has_group(user, group_name):
+    """
+    Teste si l’user fait partie d’un groupe
+    :param user: L'user à tester
+    :param group_name: Le nom du groupe
+    :return: True si l’user fait partie du groupe.
+    """
+    return group_name in user_groups(user)
+
+
 def user_is_validated(user):
     """
     Teste si l’user est bien dans le groupe des validated
@@ -11,7 +37,7 @@ def user_is_validated(user):
         return True
     if user.is_staff:
         return True
-    return user.groups.filter(name="validated").exists()
+    return user_has_group(user, "validated")
 
 
 def user_is_developper(user):
@@ -22,7 +48,7 @@ def user_is_developper(user):
     """
     if user.is_superuser:
         return True
-    return user.groups.filter(name="developper").exists()
+    return user_has_group(user, "developper")
 
 
 def user_is_moderator(user):
@@ -33,4 +59,10 @@ def user_is_moderator(user):
     """
     if user.is_superuser:
         return True
-    return user.groups.filter(name="moderator").exists()
+    return user_has_group(user, "moderator")
+
+
+def forget_user_groups(sender, instance, action, reverse, **kwargs):
+    """Les groupes gardés sur l’user sont oubliés dès que ses groupes changent."""
+    if action.startswith("post_") and not reverse:
+        instance.__dict__.pop("_group_names", None)
@@ -1,6 +1,8 @@
 """Fichier UserProfile.users.forms.py les formulaires utilisateur"""
 from django import forms
-from django.contrib.auth.forms import UserCreationForm, UserChangeForm
+from django.contrib.auth.forms import PasswordResetForm, UserCreationForm, UserChangeForm
+
+from common.jobs import enqueue
 from .models import UserProfile
 
 
@@ -48,3 +50,21 @@ class CustomUserChangeForm(UserChangeForm):
         Meta informations
         """
         fields = ('email', 'first_name', 'last_name', 'password')
+
+
+class QueuedPasswordResetForm(PasswordResetForm):
+    """
+    Formulaire de réinitialisation du mot de passe dont le courriel est rendu
+    et envoyé par une tâche de fond. Seul l'utilisateur est mis en file, pas
+    le lien de réinitialisation.
+    """
+
+    def send_mail(self, subject_template_name, email_template_name, context, from_email, to_email,
+                  html_email_template_name=None):
+        """
+        Met en file l'envoi du courriel au lieu d'attendre le serveur SMTP.
+        """
+        enqueue("connector.password_reset_mail", user_id=context["user"].pk, domain=context["domain"],
+                site_name=context["site_name"], use_https=context["protocol"] == "https",
+                from_email=from_email, subject_template_name=subject_template_name,
+                email_template_name=email_template_name, html_email_template_name=html_email_template_name)
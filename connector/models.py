@@ -1,8 +1,14 @@
 """Fichier UserProfile.models.py pour les modèles d’utilisateurs"""
 from django.db import models
 from django.contrib.auth.models import User
+from django.contrib.auth.tokens import default_token_generator
 from django.db.models.signals import post_save
 from django.dispatch import receiver
+from django.template import loader
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from common.jobs import enqueue, send_mail, task
 
 
 class UserProfile(models.Model):
@@ -23,3 +29,46 @@ def create_user_profile(sender, instance, created, **kwargs):
 def save_user_profile(sender, instance, **kwargs):
     """Lorsque l’on sauve un `User` on le fait aussi pour son profil."""
     instance.userprofile.save()
+
+
+@receiver(post_save, sender=UserProfile)
+def build_avatar_variants(sender, instance, **kwargs):
+    """Lorsque l’on sauve un profil, les miniatures de son avatar sont mises en file."""
+    if instance.avatar:
+        enqueue("common.thumbnails", model=instance._meta.label, pk=instance.pk, fields=['avatar'])
+
+
+@task("connector.password_reset_mail", priority=10, max_attempts=5, private=True)
+def send_password_reset_mail(user_id, domain, site_name, use_https, from_email, subject_template_name,
+                             email_template_name, html_email_template_name=None):
+    """
+    Rendu et envoi du courriel de réinitialisation du mot de passe. Le lien et
+    son jeton ne sont fabriqués qu'ici : ils ne sont jamais stockés dans la file.
+     :param user_id: La clé primaire de l'utilisateur.
+     :param domain: Le domaine du site, pour le lien.
+     :param site_name: Le nom du site.
+     :param use_https: Lien en https.
+     :param from_email: L'expéditeur.
+     :param subject_template_name: Le gabarit du sujet.
+     :param email_template_name: Le gabarit du texte.
+     :param html_email_template_name: Le gabarit de la version html, facultatif.
+    """
+    user = User.objects.filter(pk=user_id, is_active=True).first()
+    if user is None:
+        return
+    email = getattr(user, User.get_email_field_name())
+    context = {
+        "email": email,
+        "domain": domain,
+        "site_name": site_name,
+        "uid": urlsafe_base64_encode(force_bytes(user.pk)),
+        "user": user,
+        "token": default_token_generator.make_token(user),
+        "protocol": "https" if use_https else "http",
+    }
+    subject = "".join(loader.render_to_string(subject_template_name, context).splitlines())
+    body = loader.render_to_string(email_template_name, context)
+    html = None
+    if html_email_template_name is not None:
+        html = loader.render_to_string(html_email_template_name, context)
+    send_mail(subject, body, from_email, [email], html)
@@ -3,7 +3,7 @@ from django.contrib.auth import login
 from django.contrib.auth.views import PasswordResetView
 from django.contrib.auth.forms import AuthenticationForm
 from django.shortcuts import render, redirect, reverse
-from .forms import CustomUserCreationForm, CustomUserChangeForm, ProfileForm
+from .forms import CustomUserCreationForm, CustomUserChangeForm, ProfileForm, QueuedPasswordResetForm
 from . import settings
 
 
@@ -65,5 +65,6 @@ class CustomPasswordResetView(PasswordResetView):
     """
     Custom class for password reset.
     """
+    form_class = QueuedPasswordResetForm
     from_email = "webmaster@argawaen.net"
     html_email_template_name = 'registration/password_reset_email.html'
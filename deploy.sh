@@ -112,15 +112,16 @@ env_value() {
     fi
 }
 
-# The three bind-mounted directories must exist *before* the first `up`: Docker
-# creates a missing bind-mount source itself, as root, and the owner can then no
-# longer clean or back up what is in it. All three matter here -- db/ holds the only
-# copy of the database, media/ the uploads, static/ what collectstatic writes.
+# The bind-mounted directories must exist *before* the first `up`: Docker creates a
+# missing bind-mount source itself, as root, and the owner can then no longer clean
+# or back up what is in it. db/ holds the only copy of the database, media/ the
+# uploads, static/ what collectstatic writes, cache/ the cache shared by web and worker.
 prepare_directories() {
     local key dir
     for key in PATH_DATABASE:./docker_data/db/ \
                PATH_MEDIA:./docker_data/media/ \
-               PATH_STATIC:./docker_data/static/; do
+               PATH_STATIC:./docker_data/static/ \
+               PATH_CACHE:./docker_data/cache/; do
         dir="$(env_value "${key%%:*}" "${key#*:}")"
         if [ ! -d "$dir" ]; then
             run mkdir -p "$dir"
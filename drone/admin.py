@@ -2,11 +2,13 @@
 from django.contrib import admin
 from .base_admin import SiteArticleAdmin, SiteArticleCommentAdmin
 from .models import (
+    ChunkedUpload,
     DroneArticle,
     DroneArticleComment,
     DroneComponent,
     DroneComponentCategory,
     DroneComponentComment,
+    DroneComponentSpec,
     DroneConfiguration,
     DroneConfigurationComment,
     DroneFlight,
@@ -34,7 +36,19 @@ class DroneArticleAdmin(SiteArticleAdmin):
     )
 
 
+class DroneComponentSpecInline(admin.TabularInline):
+    model = DroneComponentSpec
+    fields = ('key', 'value')
+    readonly_fields = ('key', 'value')
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
 class DroneComponentAdmin(SiteArticleAdmin):
+    inlines = (DroneComponentSpecInline,)
     list_display = ('titre', 'category')
     list_filter = ('titre', 'category')
     search_fields = ('titre', 'category')
@@ -97,6 +111,12 @@ class DroneFlightAdmin(SiteArticleAdmin):
     )
 
 
+class ChunkedUploadAdmin(admin.ModelAdmin):
+    list_display = ('filename', 'flight', 'field', 'user', 'offset', 'size', 'completed', 'updated')
+    list_filter = ('completed', 'field')
+    readonly_fields = ('offset', 'completed')
+
+
 admin.site.register(DroneComponentCategory)
 admin.site.register(DroneArticle, DroneArticleAdmin)
 admin.site.register(DroneComponent, DroneComponentAdmin)
@@ -107,3 +127,4 @@ admin.site.register(DroneArticleComment, SiteArticleCommentAdmin)
 admin.site.register(DroneComponentComment, SiteArticleCommentAdmin)
 admin.site.register(DroneConfigurationComment, SiteArticleCommentAdmin)
 admin.site.register(DroneFlightComment, SiteArticleCommentAdmin)
+admin.site.register(ChunkedUpload, ChunkedUploadAdmin)
@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class DroneConfig(AppConfig):
     name = 'drone'
+
+    def ready(self):
+        # Connexion des signaux d'invalidation des statistiques
+        from . import statistics  # noqa: F401
+        # Connexion des signaux des totaux de poids et de prix des configurations
+        from . import rollup  # noqa: F401
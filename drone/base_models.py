@@ -4,4 +4,4 @@ Réexporte depuis common.models.
 Lors de l'extraction en projet autonome, remplacer ces imports
 par les définitions complètes (copier depuis common/models.py).
 """
-from common.models import SiteArticle, SiteArticleComment  # noqa: F401
+from common.models import SiteArticle, SiteArticleComment, touch_articles  # noqa: F401
@@ -0,0 +1,165 @@
+"""
+Mesure du temps de réponse et du nombre de requêtes SQL des pages du site.
+
+Chaque page de `drone.urls` et `connector.urls` est demandée par le client de
+test de Django : une première fois à froid (caches vides) puis plusieurs
+fois à chaud. Le nombre de requêtes SQL de la requête à froid est comparé au
+budget de la page : il ne doit pas croître avec le volume de données.
+"""
+import statistics
+import time
+from importlib import import_module
+
+from django.core.cache import caches
+from django.db import connection, reset_queries
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, reverse
+
+from .models import DroneArticle, DroneComponent, DroneConfiguration, DroneFlight
+
+# Modules d'urls mesurés
+URL_MODULES = ("drone.urls", "connector.urls")
+
+# Objets utilisés pour les paramètres des urls, le premier venu (les vols avec un datalog d'abord)
+URL_OBJECTS = {
+    "article_id": DroneArticle.objects.order_by("pk"),
+    "vol_id": DroneFlight.objects.order_by("-datalog", "pk"),
+    "conf_id": DroneConfiguration.objects.order_by("pk"),
+    "comp_id": DroneComponent.objects.order_by("pk"),
+}
+
+# Paramètres GET ajoutés à certaines pages
+URL_QUERIES = {
+    "search": lambda: {"q": "drone"},
+    "diff_confs": lambda: dict(zip(("from", "to"), DroneConfiguration.objects.order_by(
+        "version_number").values_list("version_number", flat=True).distinct()[:2])),
+}
+
+# Pages qui ne se mesurent pas par un simple GET
+SKIPPED = ("upload_chunk", "logout", "password_reset_confirm", "profil")
+
+# Nombre maximal de requêtes SQL par page (à froid, utilisateur de l'équipe connecté)
+DEFAULT_QUERY_BUDGET = 5
+QUERY_BUDGETS = {
+    "index": 6,
+    "index1": 6,
+    "detailed_article": 10,
+    "vols": 6,
+    "detailed_vols": 10,
+    "telemetry_vols": 6,
+    "confs": 6,
+    "detailed_confs": 10,
+    "diff_confs": 10,
+    "comps": 8,
+    "detailed_comps": 10,
+    "comments": 6,
+    "stats": 8,
+    "search": 8,
+}
+
+
+def url_names():
+    """
+    Noms des urls mesurées.
+     :return : La liste des couples (nom, noms des paramètres).
+    """
+    names = []
+    for module in URL_MODULES:
+        for pattern in import_module(module).urlpatterns:
+            if isinstance(pattern, URLResolver) or not isinstance(pattern, URLPattern) or not pattern.name:
+                continue
+            if pattern.name in SKIPPED:
+                continue
+            names.append((pattern.name, list(pattern.pattern.converters)))
+    return names
+
+
+def page_url(name, parameters):
+    """
+    Adresse d'une page, avec le premier objet venu pour ses paramètres.
+     :param name: Le nom de l'url.
+     :param parameters: Les noms de ses paramètres.
+     :return : L'adresse et ses paramètres GET, ou None s'il manque un objet.
+    """
+    kwargs = {}
+    for parameter in parameters:
+        objects = URL_OBJECTS.get(parameter)
+        pk = objects.values_list("pk", flat=True).first() if objects is not None else None
+        if pk is None:
+            return None
+        kwargs[parameter] = pk
+    return reverse(name, kwargs=kwargs), URL_QUERIES.get(name, dict)()
+
+
+def _clear_caches():
+    for alias in ("default", "fragments"):
+        caches[alias].clear()
+
+
+def run(user, repeat=5, label=None):
+    """
+    Mesure toutes les pages.
+     :param user: L'utilisateur connecté pendant les mesures.
+     :param repeat: Le nombre de requêtes à chaud par page.
+     :param label: Étiquette ajoutée à chaque résultat (p.ex. le volume de données).
+     :return : La liste des résultats, un dictionnaire par page.
+    """
+    client = Client()
+    client.force_login(user)
+    results = []
+    for name, parameters in url_names():
+        target = page_url(name, parameters)
+        if target is None:
+            continue
+        url, query = target
+        _clear_caches()
+        reset_queries()  # le journal des requêtes est borné : il doit être vide pour compter
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = client.get(url, query)
+            cold = (time.perf_counter() - start) * 1000
+        count = len(queries)  # avant les requêtes suivantes, qui vident le journal
+        warm = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            client.get(url, query)
+            warm.append((time.perf_counter() - start) * 1000)
+        budget = QUERY_BUDGETS.get(name, DEFAULT_QUERY_BUDGET)
+        results.append({
+            "label": label,
+            "view": name,
+            "url": url,
+            "status": response.status_code,
+            "queries": count,
+            "budget": budget,
+            "within_budget": count <= budget,
+            "cold_ms": round(cold, 2),
+            "median_ms": round(statistics.median(warm), 2) if warm else None,
+            "max_ms": round(max(warm), 2) if warm else None,
+        })
+    return results
+
+
+def compare(results, previous, tolerance=0.2, noise=5.0):
+    """
+    Pages devenues plus lentes ou plus bavardes que lors d'une mesure précédente.
+     :param results: Les résultats de la mesure.
+     :param previous: Les résultats de la mesure de référence.
+     :param tolerance: L'augmentation relative du temps médian tolérée.
+     :param noise: L'augmentation en millisecondes en deçà de laquelle l'écart est du bruit.
+     :return : La liste des messages de régression.
+    """
+    reference = {(row["label"], row["view"]): row for row in previous}
+    regressions = []
+    for row in results:
+        old = reference.get((row["label"], row["view"]))
+        if old is None:
+            continue
+        if row["queries"] > old["queries"]:
+            regressions.append(f"{row['view']} ({row['label']}) : {old['queries']} -> {row['queries']} requêtes SQL")
+        if old["median_ms"] and row["median_ms"] and row["median_ms"] > old["median_ms"] * (1 + tolerance) \
+                and row["median_ms"] - old["median_ms"] > noise:
+            regressions.append(
+                f"{row['view']} ({row['label']}) : {old['median_ms']} -> {row['median_ms']} ms")
+    return regressions
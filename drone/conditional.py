@@ -0,0 +1,64 @@
+"""
+Requêtes conditionnelles (ETag / Last-Modified) pour les pages du site.
+
+L'état d'une page est tiré, en une seule requête d'agrégat, des articles
+qu'elle affiche : dernière modification, dernière date de parution, dernier
+commentaire, dernière modification des objets liés qu'elle affiche aussi
+(configuration d'un vol, composants d'une configuration) et nombre d'articles
+(pour voir les suppressions). Lorsque le
+navigateur (ou nginx) renvoie les validateurs d'une page inchangée, la vue
+n'est pas exécutée et la réponse est un 304.
+"""
+import hashlib
+
+from django.db.models import Count, Max
+from django.views.decorators.http import condition
+
+
+DATES = ("updated", "date", "comment", "related")
+
+
+def page_state(request, queryset, related=()):
+    """
+    État des articles affichés par la page, calculé une seule fois par requête.
+     :param request: La requête.
+     :param queryset: Les articles dont dépend la page.
+     :param related: Les chemins vers les articles liés affichés par la page.
+     :return : Un dictionnaire `updated`, `date`, `comment`, `related` et `count`.
+    """
+    state = getattr(request, "_page_state", None)
+    if state is None:
+        related_dates = {f"related_{path}": Max(f"{path}__updated_at") for path in related}
+        state = queryset.order_by().aggregate(
+            updated=Max('updated_at'), date=Max('date'), comment=Max('comments__date'),
+            count=Count('pk', distinct=True), **related_dates)
+        dates = [state.pop(name) for name in related_dates]
+        state["related"] = max((date for date in dates if date is not None), default=None)
+        request._page_state = state
+    return state
+
+
+def conditional_page(articles, related=()):
+    """
+    Décorateur de vue qui ajoute ETag et Last-Modified, et répond 304 si la page n'a pas changé.
+     :param articles: Fonction (request, **kwargs) qui renvoie le queryset des articles de la page.
+     :param related: Les chemins (p.ex. `drone_configuration`) des articles liés affichés par la page.
+     :return : Le décorateur.
+    """
+
+    def last_modified(request, *args, **kwargs):
+        state = page_state(request, articles(request, *args, **kwargs), related)
+        dates = [state[name] for name in DATES if state[name] is not None]
+        return max(dates) if dates else None
+
+    def etag(request, *args, **kwargs):
+        state = page_state(request, articles(request, *args, **kwargs), related)
+        # la page dépend aussi de l'utilisateur (droits, menu), des paramètres (tri,
+        # pagination) et du secret CSRF de ses formulaires, renouvelé à chaque connexion ;
+        # seul celui reçu du navigateur compte : les pages sans formulaire n'en créent pas
+        key = "|".join(str(v) for v in (
+            request.user.pk, request.get_full_path(), request.META.get("CSRF_COOKIE"),
+            *(state[name] for name in DATES), state["count"]))
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
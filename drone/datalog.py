@@ -0,0 +1,527 @@
+"""
+Ingestion des datalogs de vol et stockage en colonnes.
+
+Le log texte (export CSV de blackbox Betaflight, ou export tabulaire
+`mavlogdump --format csv` d'ArduPilot) est lu une seule fois, par blocs de
+lignes, et chaque colonne numérique est écrite dans un fichier binaire brut
+à côté de l'original. Ces fichiers sont ensuite relus par projection mémoire
+sans jamais re-parser le texte.
+
+Pour les tracés, chaque colonne est aussi résumée en une pyramide de niveaux
+min/max : le niveau `k` regroupe les échantillons par seaux de
+`PYRAMID_FACTOR ** k`, jusqu'à ce qu'il reste au plus `PYRAMID_TOP` seaux.
+
+Les statistiques du vol (durée, altitude, vitesse, consommation, distance)
+sont calculées à l'ingestion et rangées dans le manifeste.
+"""
+import bisect
+import csv
+import json
+import math
+import mmap
+import os
+import shutil
+import sys
+from array import array
+from itertools import islice, zip_longest
+from pathlib import Path
+
+from django.utils.text import slugify
+
+STORE_SUFFIX = ".channels"  # Suffixe du répertoire des colonnes, à côté du log
+MANIFEST = "manifest.json"
+FORMAT_VERSION = 3
+CHUNK_ROWS = 4096  # Nombre de lignes lues avant d'écrire les colonnes
+HEADER_SEARCH_ROWS = 100  # Nombre de lignes de préambule tolérées avant l'entête
+TIME_TYPECODE = "d"
+CHANNEL_TYPECODE = "f"
+PYRAMID_FACTOR = 16  # Nombre de seaux d'un niveau regroupés au niveau suivant
+PYRAMID_TOP = 256  # Nombre maximal de seaux du niveau le plus grossier
+EARTH_RADIUS = 6371000.0  # Rayon terrestre moyen en mètres
+
+# Colonnes reconnues pour les statistiques, par ordre de préférence, et leur
+# conversion vers l'unité de la statistique (m, m/s, mAh, degrés).
+STATISTIC_COLUMNS = {
+    "altitude": [("baroalt (cm)", 0.01), ("gps_altitude", 1.0), ("ctun.alt", 1.0),
+                 ("baro.alt", 1.0), ("gps.alt", 1.0), ("alt", 1.0)],
+    "speed": [("gps_speed (m/s)", 1.0), ("gps_speed", 1.0), ("gps.spd", 1.0), ("spd", 1.0)],
+    "battery": [("energycumulative (mah)", 1.0), ("bat.currtot", 1.0), ("currtot", 1.0)],
+    "latitude": [("gps_coord[0]", 1.0), ("gps.lat", 1.0), ("lat", 1.0)],
+    "longitude": [("gps_coord[1]", 1.0), ("gps.lng", 1.0), ("lng", 1.0)],
+}
+
+# Colonnes de temps reconnues, par ordre de préférence, et leur conversion en secondes
+TIME_COLUMNS = {
+    "time (us)": 1e-6,  # blackbox_decode (Betaflight)
+    "timeus": 1e-6,  # ArduPilot
+    "time_us": 1e-6,
+    "time (s)": 1.0,
+    "timestamp": 1.0,  # mavlogdump (ArduPilot)
+    "time": 1.0,
+}
+
+
+class DatalogError(Exception):
+    """Le datalog ne peut pas être découpé en colonnes."""
+
+
+def store_path(log_path):
+    """
+    Répertoire des colonnes d'un datalog.
+     :param log_path: Le chemin du log original.
+     :return : Le chemin du répertoire de colonnes.
+    """
+    log_path = Path(log_path)
+    return log_path.with_name(log_path.name + STORE_SUFFIX)
+
+
+def _source_signature(log_path):
+    """Identifie une version du log original."""
+    stat = os.stat(log_path)
+    return {"source": Path(log_path).name, "source_size": stat.st_size, "source_mtime": stat.st_mtime}
+
+
+def _find_header(reader):
+    """
+    Saute le préambule éventuel et renvoie l'entête et la colonne de temps.
+    """
+    for _ in range(HEADER_SEARCH_ROWS):
+        row = next(reader, None)
+        if row is None:
+            break
+        names = [cell.strip() for cell in row]
+        lowered = [name.lower() for name in names]
+        for time_name, scale in TIME_COLUMNS.items():
+            if time_name in lowered:
+                return names, lowered.index(time_name), scale
+    raise DatalogError("Aucune colonne de temps reconnue dans l'entête du datalog.")
+
+
+def _file_names(names):
+    """Noms de fichiers uniques et sûrs pour chaque colonne."""
+    used = set()
+    files = []
+    for index, name in enumerate(names):
+        stem = slugify(name) or f"col{index}"
+        candidate = stem
+        while candidate in used:
+            candidate = f"{stem}-{index}"
+        used.add(candidate)
+        files.append(candidate)
+    return files
+
+
+class _ColumnWriter:
+    """
+    Accumule les valeurs d'une colonne et les écrit par blocs.
+    Les cellules vides ou non numériques reprennent la dernière valeur connue.
+    """
+
+    def __init__(self, path, typecode, scale=1.0, offset=None):
+        self.path = Path(path)
+        self.file = open(path, "wb")
+        self.typecode = typecode
+        self.scale = scale
+        self.offset = offset
+        self.last = math.nan
+        self.numeric = 0
+
+    def write(self, cells):
+        try:
+            values = array(self.typecode, map(float, cells))
+            self.numeric += len(values)
+        except ValueError:
+            values = array(self.typecode)
+            for cell in cells:
+                try:
+                    self.last = float(cell)
+                    self.numeric += 1
+                except ValueError:
+                    pass
+                values.append(self.last)
+        if values:
+            self.last = values[-1]
+        if self.scale != 1.0 or self.offset is not None:
+            if self.offset is None:
+                self.offset = values[0] * self.scale
+            values = array(self.typecode, (v * self.scale - self.offset for v in values))
+        values.tofile(self.file)
+
+    def close(self):
+        self.file.close()
+
+
+def _write_columns(log_path, work):
+    """
+    Lit le log par blocs de lignes et écrit chaque colonne dans `work`.
+     :return : Les noms de colonnes, l'index du temps, les écrivains et le nombre de lignes.
+    """
+    writers = []
+    try:
+        with open(log_path, newline="", encoding="utf-8", errors="replace") as source:
+            reader = csv.reader(source)
+            names, time_index, scale = _find_header(reader)
+            for index, file in enumerate(_file_names(names)):
+                if index == time_index:
+                    writers.append(_ColumnWriter(work / f"{file}.{TIME_TYPECODE}", TIME_TYPECODE, scale=scale))
+                else:
+                    writers.append(_ColumnWriter(work / f"{file}.{CHANNEL_TYPECODE}", CHANNEL_TYPECODE))
+            rows = 0
+            while True:
+                block = list(islice(reader, CHUNK_ROWS))
+                if not block:
+                    break
+                chunk = [row for row in block if row]
+                if not chunk:
+                    continue
+                rows += len(chunk)
+                # Transposition du bloc : une séquence de cellules par colonne.
+                for writer, cells in zip(writers, zip_longest(*chunk, fillvalue="")):
+                    writer.write(cells)
+    finally:
+        for writer in writers:
+            writer.close()
+    if writers[time_index].numeric == 0:
+        raise DatalogError("La colonne de temps du datalog ne contient aucune valeur.")
+    return names, time_index, writers, rows
+
+
+def _read_array(path, typecode):
+    """Relit entièrement un fichier de colonne."""
+    values = array(typecode)
+    with open(path, "rb") as f:
+        values.frombytes(f.read())
+    return values
+
+
+def _minmax(values):
+    """Min et max d'un seau, en ignorant les valeurs manquantes."""
+    low, high = min(values), max(values)
+    if low != low or high != high:
+        known = [v for v in values if v == v]
+        if not known:
+            return math.nan, math.nan
+        low, high = min(known), max(known)
+    return low, high
+
+
+def _time_pyramid(path, rows):
+    """
+    Écrit l'instant de début de chaque seau, pour chaque niveau de la pyramide.
+     :return : Les noms des fichiers de niveau, du plus fin au plus grossier.
+    """
+    levels = []
+    times = _read_array(path, TIME_TYPECODE)
+    size = PYRAMID_FACTOR
+    while math.ceil(rows / (size // PYRAMID_FACTOR)) > PYRAMID_TOP:
+        level = path.with_name(f"{path.name}.L{len(levels) + 1}")
+        with open(level, "wb") as f:
+            times[::size].tofile(f)
+        levels.append(level.name)
+        size *= PYRAMID_FACTOR
+    return levels
+
+
+def _channel_pyramid(path, depth):
+    """
+    Écrit les paires (min, max) entrelacées de chaque seau, niveau par niveau,
+    chaque niveau étant calculé à partir du précédent.
+     :return : Les noms des fichiers de niveau, du plus fin au plus grossier.
+    """
+    levels = []
+    values = _read_array(path, CHANNEL_TYPECODE)
+    lows = highs = values
+    for depth_index in range(1, depth + 1):
+        level = array(CHANNEL_TYPECODE)
+        for start in range(0, len(lows), PYRAMID_FACTOR):
+            if lows is highs:
+                low, high = _minmax(lows[start:start + PYRAMID_FACTOR])
+            else:
+                low = _minmax(lows[start:start + PYRAMID_FACTOR])[0]
+                high = _minmax(highs[start:start + PYRAMID_FACTOR])[1]
+            level.append(low)
+            level.append(high)
+        level_path = path.with_name(f"{path.name}.L{depth_index}")
+        with open(level_path, "wb") as f:
+            level.tofile(f)
+        levels.append(level_path.name)
+        lows, highs = level[0::2], level[1::2]
+    return levels
+
+
+def ingest(log_path, force=False):
+    """
+    Découpe un datalog CSV en colonnes binaires projetables en mémoire.
+     :param log_path: Le chemin du log original.
+     :param force: Refait l'ingestion même si les colonnes sont à jour.
+     :return : Le manifeste des colonnes.
+    """
+    log_path = Path(log_path)
+    target = store_path(log_path)
+    signature = _source_signature(log_path)
+    if not force:
+        manifest = read_manifest(target)
+        if manifest is not None and all(manifest.get(k) == v for k, v in signature.items()):
+            return manifest
+    work = target.with_name(target.name + ".tmp")
+    shutil.rmtree(work, ignore_errors=True)
+    work.mkdir(parents=True)
+    try:
+        names, time_index, writers, rows = _write_columns(log_path, work)
+    except Exception:
+        shutil.rmtree(work, ignore_errors=True)
+        raise
+    channels = []
+    for index, (name, writer) in enumerate(zip(names, writers)):
+        if index == time_index:
+            continue
+        if writer.numeric == 0:
+            writer.path.unlink()
+            continue
+        channels.append({"name": name, "file": writer.path.name, "typecode": CHANNEL_TYPECODE})
+    time_levels = _time_pyramid(writers[time_index].path, rows)
+    for channel in channels:
+        channel["levels"] = _channel_pyramid(work / channel["file"], len(time_levels))
+    manifest = {
+        "version": FORMAT_VERSION,
+        **signature,
+        "rows": rows,
+        "byteorder": sys.byteorder,
+        "time": {
+            "name": names[time_index],
+            "file": writers[time_index].path.name,
+            "typecode": TIME_TYPECODE,
+            "offset": writers[time_index].offset,
+            "levels": time_levels,
+        },
+        "pyramid_factor": PYRAMID_FACTOR,
+        "channels": channels,
+    }
+    with open(work / MANIFEST, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    # Les statistiques se calculent sur les colonnes relues via le manifeste.
+    with ChannelStore(work) as store:
+        manifest["statistics"] = statistics(store)
+    with open(work / MANIFEST, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    shutil.rmtree(target, ignore_errors=True)
+    work.rename(target)
+    return manifest
+
+
+def _find_channel(store, kind):
+    """Première colonne présente pour une statistique, avec son facteur d'échelle."""
+    names = {name.lower(): name for name in store.channels}
+    for candidate, scale in STATISTIC_COLUMNS[kind]:
+        if candidate in names:
+            return store.channel(names[candidate]), scale
+    return None, None
+
+
+def _first_known(values):
+    """Première valeur non manquante."""
+    return next((v for v in values if v == v), math.nan)
+
+
+def _distance(latitudes, longitudes):
+    """Longueur de la trace GPS en mètres, en ignorant les positions répétées ou sans fix."""
+    low, high = _minmax(latitudes)
+    # Les exports Betaflight donnent les coordonnées en 1e-7 degré.
+    scale = 1e-7 if max(abs(low), abs(high)) > 180 else 1.0
+    total = 0.0
+    previous = None
+    for lat, lon in zip(latitudes, longitudes):
+        if lat != lat or lon != lon or (lat == 0 and lon == 0) or (lat, lon) == previous:
+            continue
+        if previous is not None:
+            phi1, phi2 = math.radians(previous[0] * scale), math.radians(lat * scale)
+            dphi = phi2 - phi1
+            dlambda = math.radians((lon - previous[1]) * scale)
+            a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+            total += 2 * EARTH_RADIUS * math.asin(math.sqrt(a))
+        previous = (lat, lon)
+    return total
+
+
+def statistics(store):
+    """
+    Statistiques d'un vol, calculées sur les colonnes reconnues du datalog.
+    Chaque statistique vaut None si les colonnes nécessaires sont absentes.
+     :param store: Les colonnes du datalog.
+     :return : Un dictionnaire `duration` (s), `max_altitude` (m au-dessus du
+               point de départ), `max_speed` (m/s), `battery_consumed` (mAh)
+               et `distance` (m).
+    """
+    def known(value):
+        return None if value is None or value != value else value
+
+    time = store.time()
+    result = {
+        "duration": known(time[-1] - time[0]) if len(time) else None,
+        "max_altitude": None,
+        "max_speed": None,
+        "battery_consumed": None,
+        "distance": None,
+    }
+    altitude, scale = _find_channel(store, "altitude")
+    if altitude is not None and len(altitude):
+        result["max_altitude"] = known((_minmax(altitude)[1] - _first_known(altitude)) * scale)
+    speed, scale = _find_channel(store, "speed")
+    if speed is not None and len(speed):
+        result["max_speed"] = known(_minmax(speed)[1] * scale)
+    battery, scale = _find_channel(store, "battery")
+    if battery is not None and len(battery):
+        low, high = _minmax(battery)
+        result["battery_consumed"] = known((high - low) * scale)
+    latitudes, _ = _find_channel(store, "latitude")
+    longitudes, _ = _find_channel(store, "longitude")
+    if latitudes is not None and longitudes is not None and len(latitudes):
+        result["distance"] = _distance(latitudes, longitudes)
+    return result
+
+
+def read_manifest(directory):
+    """
+    Lit le manifeste d'un répertoire de colonnes.
+     :param directory: Le répertoire de colonnes.
+     :return : Le manifeste, ou None s'il est absent ou d'un autre format.
+    """
+    try:
+        with open(Path(directory) / MANIFEST, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != FORMAT_VERSION:
+        return None
+    return manifest
+
+
+class ChannelStore:
+    """
+    Accès en lecture aux colonnes d'un datalog ingéré, par projection mémoire.
+    S'utilise comme gestionnaire de contexte pour libérer les projections.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.manifest = read_manifest(self.directory)
+        if self.manifest is None:
+            raise DatalogError(f"Pas de colonnes lisibles dans {self.directory}.")
+        if self.manifest["byteorder"] != sys.byteorder:
+            raise DatalogError("Les colonnes ont été écrites avec un autre boutisme.")
+        self._channels = {c["name"]: c for c in self.manifest["channels"]}
+        self._maps = []
+        self._views = []
+
+    @classmethod
+    def for_log(cls, log_path):
+        """
+        Ouvre les colonnes d'un log, si elles sont à jour.
+         :param log_path: Le chemin du log original.
+         :return : Le ChannelStore, ou None si le log n'a pas été ingéré.
+        """
+        directory = store_path(log_path)
+        manifest = read_manifest(directory)
+        if manifest is None:
+            return None
+        try:
+            signature = _source_signature(log_path)
+        except OSError:
+            return None
+        if any(manifest.get(k) != v for k, v in signature.items()):
+            return None
+        return cls(directory)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def channels(self):
+        """Noms des colonnes disponibles, dans l'ordre du log."""
+        return list(self._channels)
+
+    @property
+    def rows(self):
+        """Nombre d'échantillons."""
+        return self.manifest["rows"]
+
+    def _map(self, file, typecode):
+        path = self.directory / file
+        if path.stat().st_size == 0:
+            return memoryview(array(typecode))
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(mapped)
+        view = memoryview(mapped).cast(typecode)
+        self._views.append(view)
+        return view
+
+    def time(self):
+        """
+        Les instants des échantillons, en secondes depuis le début du log.
+         :return : Une vue mémoire de flottants double précision.
+        """
+        return self._map(self.manifest["time"]["file"], self.manifest["time"]["typecode"])
+
+    def channel(self, name):
+        """
+        Les valeurs d'une colonne.
+         :param name: Le nom de la colonne tel que dans l'entête du log.
+         :return : Une vue mémoire de flottants.
+        """
+        try:
+            channel = self._channels[name]
+        except KeyError:
+            raise DatalogError(f"Colonne inconnue: {name}") from None
+        return self._map(channel["file"], channel["typecode"])
+
+    def decimate(self, name, start=None, end=None, points=1000):
+        """
+        Résume une colonne en au plus `points` seaux (instant, min, max) sur
+        l'intervalle demandé, en lisant le niveau de pyramide le plus fin qui
+        convient : le coût ne dépend que de `points`, pas de la taille du log.
+         :param name: Le nom de la colonne.
+         :param start: Début de l'intervalle en secondes (début du log par défaut).
+         :param end: Fin de l'intervalle en secondes (fin du log par défaut).
+         :param points: Nombre maximal de seaux renvoyés.
+         :return : Le niveau utilisé et les listes des instants, minimums et maximums.
+        """
+        channel = self._channels.get(name)
+        if channel is None:
+            raise DatalogError(f"Colonne inconnue: {name}")
+        time = self.time()
+        first = 0 if start is None else bisect.bisect_left(time, start)
+        last = len(time) if end is None else bisect.bisect_right(time, end)
+        if last <= first:
+            return 0, [], [], []
+        levels = channel["levels"]
+        depth = 0
+        while depth < len(levels) and math.ceil((last - first) / PYRAMID_FACTOR ** depth) > points:
+            depth += 1
+        if depth == 0:
+            values = self.channel(name)[first:last].tolist()
+            return 0, time[first:last].tolist(), values, values
+        size = PYRAMID_FACTOR ** depth
+        first, last = first // size, math.ceil(last / size)
+        times = self._map(self.manifest["time"]["levels"][depth - 1], self.manifest["time"]["typecode"])
+        pairs = self._map(levels[depth - 1], channel["typecode"])[2 * first:2 * last]
+        times, lows, highs = times[first:last].tolist(), pairs[0::2].tolist(), pairs[1::2].tolist()
+        if len(times) > points:
+            # Même le niveau le plus grossier est trop fin : on fusionne ses seaux.
+            group = math.ceil(len(times) / points)
+            merged = [_minmax(lows[i:i + group])[0] for i in range(0, len(lows), group)]
+            highs = [_minmax(highs[i:i + group])[1] for i in range(0, len(highs), group)]
+            times, lows = times[::group], merged
+        return depth, times, lows, highs
+
+    def close(self):
+        """Libère les projections mémoire."""
+        for view in self._views:
+            view.release()
+        for mapped in self._maps:
+            mapped.close()
+        self._views = []
+        self._maps = []
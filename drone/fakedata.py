@@ -0,0 +1,191 @@
+"""
+Génération de données réalistes pour mesurer les performances du site.
+
+Les objets passent par `save()` comme ceux saisis dans l'administration : rendu
+markdown, index de recherche, caractéristiques des composants, totaux des
+configurations et découpage des datalogs sont faits comme en production.
+"""
+import math
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+
+from common import search
+
+from .models import (
+    DroneArticle,
+    DroneArticleComment,
+    DroneComponent,
+    DroneComponentCategory,
+    DroneComponentComment,
+    DroneConfiguration,
+    DroneConfigurationComment,
+    DroneFlight,
+    DroneFlightComment,
+)
+from .statistics import invalidate_fleet_statistics
+
+FAKE_PREFIX = "fake"  # Préfixe des noms d'utilisateurs générés
+DATALOG_ROWS = 5000  # Nombre d'échantillons d'un datalog généré
+GROUPS = ("validated", "moderator", "developper")
+
+# Catégories et caractéristiques typiques de leurs composants
+CATEGORIES = {
+    "Moteur": (True, {"Poids": (25, 60), "Prix": (15, 40), "KV": (1700, 2800)}),
+    "Hélice": (True, {"Poids": (3, 8), "Prix": (2, 6), "Pas": (3, 5)}),
+    "Batterie": (True, {"Poids": (150, 250), "Prix": (20, 50), "Capacité": (1300, 2200)}),
+    "Cadre": (True, {"Poids": (80, 150), "Prix": (30, 90), "Largeur": (200, 260)}),
+    "Controleur de vol": (True, {"Poids": (5, 10), "Prix": (30, 70)}),
+    "Caméra": (True, {"Poids": (8, 20), "Prix": (20, 60)}),
+    "Télécommande": (False, {"Poids": (400, 700), "Prix": (80, 250)}),
+    "Récepteur Vidéo": (False, {"Poids": (50, 150), "Prix": (40, 400)}),
+}
+
+WORDS = (
+    "drone vol hélice moteur batterie réglage vent stabilité caméra image pilotage "
+    "acrobatie altitude vitesse GPS retour atterrissage décollage test essai filtre PID "
+    "vibrations autonomie consommation cadre montage soudure antenne portée vidéo"
+).split()
+
+
+def _text(rng, words):
+    """Texte markdown d'environ `words` mots, en paragraphes."""
+    paragraphs = []
+    while words > 0:
+        size = min(words, rng.randint(20, 60))
+        sentence = " ".join(rng.choice(WORDS) for _ in range(size))
+        paragraphs.append(sentence.capitalize() + ".")
+        words -= size
+    if len(paragraphs) > 1:
+        paragraphs.insert(1, f"**{rng.choice(WORDS)}** : *{rng.choice(WORDS)}*")
+    return "\n\n".join(paragraphs)
+
+
+def fake_datalog(rng, rows=DATALOG_ROWS):
+    """
+    Datalog au format blackbox_decode (Betaflight) : temps, altitude, vitesse,
+    batterie et trace GPS autour d'un point de départ.
+     :param rng: Le générateur aléatoire.
+     :param rows: Le nombre d'échantillons.
+     :return : Le contenu du fichier.
+    """
+    lat, lon = 45.0 + rng.random(), 5.0 + rng.random()
+    lines = ['"Product","Blackbox flight data recorder"',
+             "loopIteration, time (us), rcCommand[3], vbatLatest (V), BaroAlt (cm), "
+             "GPS_speed (m/s), energyCumulative (mAh), GPS_coord[0], GPS_coord[1]"]
+    for i in range(rows):
+        phase = i / rows
+        altitude = 3000 * math.sin(math.pi * phase) + rng.uniform(-50, 50)
+        speed = 12 * math.sin(math.pi * phase) ** 2 + rng.uniform(0, 1)
+        angle = 2 * math.pi * phase
+        lines.append(
+            f"{i}, {i * 2000}, {1000 + rng.randint(0, 1000)}, {16.8 - 2 * phase:.2f}, {altitude:.0f}, "
+            f"{speed:.2f}, {1200 * phase:.1f}, {lat + 0.002 * math.sin(angle):.7f}, "
+            f"{lon + 0.002 * math.cos(angle):.7f}")
+    return "\n".join(lines) + "\n"
+
+
+def _comments(rng, model, article, users, count, start):
+    """Commentaires actifs (et quelques-uns en attente de modération) d'un article."""
+    for i in range(count):
+        model.objects.create(
+            article=article, auteur=rng.choice(users), contenu=_text(rng, rng.randint(5, 60)),
+            date=start + timedelta(hours=i + rng.random()), active=rng.random() > 0.1)
+
+
+def generate(users=20, components=100, configurations=20, flights=200, articles=20, comments=5,
+             datalogs=10, seed=0):
+    """
+    Ajoute des données générées à la base.
+     :param users: Le nombre d'utilisateurs.
+     :param components: Le nombre de composants.
+     :param configurations: Le nombre de configurations.
+     :param flights: Le nombre de vols.
+     :param articles: Le nombre d'articles de news.
+     :param comments: Le nombre moyen de commentaires par article.
+     :param datalogs: Le nombre de vols qui ont un datalog.
+     :param seed: La graine du générateur aléatoire, pour des données reproductibles.
+     :return : Le nombre d'objets créés par type.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    created = {}
+    with transaction.atomic():
+        groups = [Group.objects.get_or_create(name=name)[0] for name in GROUPS]
+        start = User.objects.filter(username__startswith=FAKE_PREFIX).count()
+        # mot de passe inutilisable : on ne se connecte pas à un compte généré, qui peut être modérateur
+        password = make_password(None)
+        # create() et non bulk_create() : les signaux créent le profil de chaque utilisateur
+        people = [
+            User.objects.create(username=f"{FAKE_PREFIX}{i}", email=f"{FAKE_PREFIX}{i}@example.org", password=password)
+            for i in range(start, start + users)]
+        User.groups.through.objects.bulk_create([
+            User.groups.through(user=user, group=group)
+            for user in people for group in rng.sample(groups, rng.randint(0, len(groups)))])
+        people = people or list(User.objects.all()[:1])
+        created["utilisateurs"] = users
+
+        categories = [
+            DroneComponentCategory.objects.get_or_create(name=name, defaults={"onBoard": on_board})[0]
+            for name, (on_board, _) in CATEGORIES.items()]
+        parts = []
+        for i in range(components):
+            category = rng.choice(categories)
+            ranges = CATEGORIES.get(category.name, (True, {}))[1]
+            specs = {key: round(rng.uniform(low, high), 1) for key, (low, high) in ranges.items()}
+            parts.append(DroneComponent.objects.create(
+                titre=f"{category.name} {rng.choice(WORDS)} {i}", slug=f"composant-{i}",
+                auteur=rng.choice(people), category=category, specs=specs, contenu=_text(rng, 80),
+                date=now - timedelta(days=rng.randint(0, 1000))))
+        created["composants"] = components
+
+        confs = []
+        for i in range(configurations):
+            conf = DroneConfiguration.objects.create(
+                titre=f"Configuration {rng.choice(WORDS)}", slug=f"configuration-{i}",
+                version_number=f"{i // 10}.{i % 10}", auteur=rng.choice(people),
+                contenu=_text(rng, 150), date=now - timedelta(days=rng.randint(0, 1000)),
+                private=rng.random() < 0.2, staff=rng.random() < 0.05)
+            if parts:
+                conf.Composants.set(rng.sample(parts, min(len(parts), rng.randint(6, 12))))
+            confs.append(conf)
+        created["configurations"] = configurations
+
+        for i in range(articles):
+            DroneArticle.objects.create(
+                titre=f"News {rng.choice(WORDS)} {i}", slug=f"news-{i}", auteur=rng.choice(people),
+                contenu=_text(rng, 300), date=now - timedelta(days=rng.randint(0, 1000)),
+                private=rng.random() < 0.2, superprivate=rng.random() < 0.05)
+        created["articles"] = articles
+
+        vols = []
+        for i in range(flights if confs else 0):
+            vols.append(DroneFlight.objects.create(
+                titre=f"Vol {rng.choice(WORDS)} {i}", slug=f"vol-{i}", auteur=rng.choice(people),
+                drone_configuration=rng.choice(confs), contenu=_text(rng, 100),
+                date=now - timedelta(days=rng.randint(0, 1000)), meteo={"vent": rng.randint(0, 40)}))
+        created["vols"] = len(vols)
+
+        # les datalogs sont attachés après coup : l'enregistrement du vol les découpe en colonnes
+        for vol in rng.sample(vols, min(datalogs, len(vols))):
+            vol.datalog.save(f"{vol.slug}.csv", ContentFile(fake_datalog(rng).encode()))
+        created["datalogs"] = min(datalogs, len(vols))
+
+        count = 0
+        for model, objects in ((DroneComponentComment, parts), (DroneConfigurationComment, confs),
+                               (DroneFlightComment, vols),
+                               (DroneArticleComment, DroneArticle.objects.order_by("-pk")[:articles])):
+            for article in objects:
+                # quelques articles populaires, beaucoup de peu commentés
+                number = min(int(rng.expovariate(1 / comments)) if comments else 0, 50 * comments)
+                _comments(rng, model, article, people, number, article.date)
+                count += number
+        created["commentaires"] = count
+    search.rebuild()
+    invalidate_fleet_statistics()
+    return created
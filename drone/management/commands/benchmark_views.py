@@ -0,0 +1,109 @@
+"""Management command to time every page on generated data of growing size."""
+import json
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from drone import benchmark, fakedata
+
+# Volume de données ajouté par palier (multiplié par la taille demandée)
+BASE_VOLUME = {
+    "users": 10,
+    "components": 50,
+    "configurations": 10,
+    "flights": 100,
+    "articles": 10,
+    "comments": 5,
+    "datalogs": 2,
+}
+
+
+def _commit():
+    """Commit du dépôt mesuré, s'il est connu."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ("Mesure le temps de réponse et le nombre de requêtes SQL de chaque page, dans une base "
+            "de test remplie de données générées à plusieurs volumes, et écrit les résultats en JSON.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes", default="1,5,20",
+            help="Volumes mesurés, en multiples du volume de base (séparés par des virgules).")
+        parser.add_argument("--repeat", type=int, default=5, help="Nombre de requêtes à chaud par page.")
+        parser.add_argument("--output", help="Fichier JSON des résultats (sinon la sortie standard).")
+        parser.add_argument("--compare", help="Fichier JSON d'une mesure précédente, pour signaler les régressions.")
+        parser.add_argument("--no-budget", action="store_true",
+                            help="Ne pas échouer lorsqu'une page dépasse son budget de requêtes SQL.")
+
+    def handle(self, *args, **options):
+        try:
+            sizes = sorted({int(size) for size in options["sizes"].split(",")})
+        except ValueError:
+            raise CommandError("--sizes attend des entiers séparés par des virgules.")
+        media = tempfile.TemporaryDirectory()
+        # base de test et fichiers temporaires : la base et les caches du site ne sont pas touchés
+        isolated = override_settings(
+            MEDIA_ROOT=media.name,
+            ALLOWED_HOSTS=["testserver"],
+            CACHES={alias: {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": alias}
+                    for alias in settings.CACHES},
+            STORAGES={**settings.STORAGES, "staticfiles": {
+                "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"}},
+            EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend",
+            JOBS_EAGER=True,  # datalogs et miniatures prêts avant les mesures
+            INSTRUMENTATION_SLOW_REQUEST_MS=sys.maxsize,
+            INSTRUMENTATION_SLOW_QUERY_MS=sys.maxsize,
+        )
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        results = []
+        try:
+            with isolated:
+                user = User.objects.create_user("benchmark", is_staff=True, is_superuser=True)
+                done = 0
+                for size in sizes:
+                    self.stdout.write(f"Volume x{size}...", ending="\r" if options["output"] else "\n")
+                    # les paliers sont cumulés : on ajoute ce qui manque pour atteindre le volume
+                    fakedata.generate(seed=size, **{
+                        name: (count if name == "comments" else count * (size - done))
+                        for name, count in BASE_VOLUME.items()})
+                    done = size
+                    results.extend(benchmark.run(user, repeat=options["repeat"], label=f"x{size}"))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            media.cleanup()
+
+        report = {"commit": _commit(), "date": timezone.now().isoformat(), "sizes": sizes,
+                  "volume": BASE_VOLUME, "results": results}
+        if options["output"]:
+            Path(options["output"]).write_text(json.dumps(report, indent=1), encoding="utf-8")
+            for row in results:
+                self.stdout.write(
+                    f"{row['label']:>5} {row['view']:<24} {row['queries']:>3}/{row['budget']:<3} requêtes "
+                    f"{row['cold_ms']:>8.1f} ms à froid {row['median_ms']:>8.1f} ms à chaud")
+        else:
+            self.stdout.write(json.dumps(report, indent=1))
+
+        if options["compare"]:
+            previous = json.loads(Path(options["compare"]).read_text(encoding="utf-8"))["results"]
+            for message in benchmark.compare(results, previous):
+                self.stderr.write(self.style.WARNING(f"Régression : {message}"))
+        over = [row for row in results if not row["within_budget"]]
+        for row in over:
+            self.stderr.write(self.style.ERROR(
+                f"{row['view']} ({row['label']}) : {row['queries']} requêtes SQL pour un budget de {row['budget']}"))
+        if over and not options["no_budget"]:
+            raise CommandError("Budget de requêtes SQL dépassé.")
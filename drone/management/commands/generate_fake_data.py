@@ -0,0 +1,37 @@
+"""Management command to fill the database with generated data."""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from drone import fakedata
+
+
+class Command(BaseCommand):
+    help = ("Ajoute à la base des utilisateurs, composants, configurations, vols, articles, "
+            "commentaires et datalogs générés, pour mesurer les performances sur un volume réaliste.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=20, help="Nombre d'utilisateurs.")
+        parser.add_argument("--components", type=int, default=100, help="Nombre de composants.")
+        parser.add_argument("--configurations", type=int, default=20, help="Nombre de configurations.")
+        parser.add_argument("--flights", type=int, default=200, help="Nombre de vols.")
+        parser.add_argument("--articles", type=int, default=20, help="Nombre d'articles de news.")
+        parser.add_argument("--comments", type=int, default=5, help="Nombre moyen de commentaires par article.")
+        parser.add_argument("--datalogs", type=int, default=10, help="Nombre de vols avec un datalog.")
+        parser.add_argument("--seed", type=int, default=0, help="Graine du générateur aléatoire.")
+        parser.add_argument(
+            "--force", action="store_true",
+            help="Génère les données même hors du mode DEBUG (base de production).")
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options["force"]:
+            raise CommandError(
+                "DEBUG est désactivé : cette base est peut-être celle du site. "
+                "Relancez avec --force pour y ajouter des données générées.")
+        created = fakedata.generate(
+            users=options["users"], components=options["components"],
+            configurations=options["configurations"], flights=options["flights"],
+            articles=options["articles"], comments=options["comments"],
+            datalogs=options["datalogs"], seed=options["seed"])
+        for name, count in created.items():
+            self.stdout.write(f"{name} : {count}")
+        self.stdout.write(self.style.SUCCESS("Données générées."))
@@ -1,65 +1,335 @@
 """Management command to import data from the MySQL source database into SQLite."""
+import json
 import os
-import tempfile
+import shutil
+import time
+from datetime import date, datetime, time as dtime
+from decimal import Decimal
+from pathlib import Path
+from uuid import UUID
 
+from django.apps import apps
 from django.conf import settings
-from django.core.management import call_command
-from django.core.management.base import BaseCommand
+from django.contrib.auth.models import Permission
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, connection, connections, models, transaction
+from django.db.utils import load_backend
+from django.utils import timezone
 
+from common import search
+from common.jobs import enqueue
+from drone import rollup
+from drone.models import DroneComponent, DroneConfiguration, DroneFlight
+from drone.statistics import invalidate_fleet_statistics
 
-class Command(BaseCommand):
-    help = "Importe les données depuis la base MySQL source vers la base SQLite locale."
+# Tables jamais copiées : les sessions n'ont pas d'intérêt, les types de contenu
+# et permissions sont recréés par `migrate` et seulement mis en correspondance.
+SKIPPED_MODELS = ("sessions.session", "contenttypes.contenttype", "auth.permission")
+SOURCE_ALIAS = "mysql_source"
+DEFAULT_STATE = Path(settings.BASE_DIR) / "db" / "mysql_import.json"
 
-    def handle(self, *args, **options):
-        mysql_host = os.environ.get("MYSQL_HOST", "")
-        mysql_port = os.environ.get("MYSQL_PORT", "3306")
-        mysql_name = os.environ.get("MYSQL_NAME", "")
-        mysql_user = os.environ.get("MYSQL_USER", "")
-        mysql_password = os.environ.get("MYSQL_PASSWORD", "")
-
-        if not all([mysql_host, mysql_name, mysql_user, mysql_password]):
-            self.stderr.write(self.style.ERROR(
-                "Les variables MYSQL_HOST, MYSQL_NAME, MYSQL_USER et MYSQL_PASSWORD "
-                "doivent être définies dans le fichier .env."
-            ))
-            return
 
-        settings.DATABASES["mysql_source"] = {
-            "ENGINE": "django.db.backends.mysql",
-            "NAME": mysql_name,
-            "USER": mysql_user,
-            "PASSWORD": mysql_password,
-            "HOST": mysql_host,
-            "PORT": mysql_port,
-            "OPTIONS": {"init_command": "SET sql_mode='STRICT_TRANS_TABLES'"},
+def mysql_source():
+    """
+    Connexion à la base MySQL source, décrite par les variables d'environnement.
+     :return : Le `DatabaseWrapper` de la base source.
+    """
+    names = ("MYSQL_HOST", "MYSQL_NAME", "MYSQL_USER", "MYSQL_PASSWORD")
+    if not all(os.environ.get(name) for name in names):
+        raise CommandError(
+            "Les variables MYSQL_HOST, MYSQL_NAME, MYSQL_USER et MYSQL_PASSWORD "
+            "doivent être définies dans le fichier .env.")
+    settings_dict = {
+        "ENGINE": "django.db.backends.mysql",
+        "NAME": os.environ["MYSQL_NAME"],
+        "USER": os.environ["MYSQL_USER"],
+        "PASSWORD": os.environ["MYSQL_PASSWORD"],
+        "HOST": os.environ["MYSQL_HOST"],
+        "PORT": os.environ.get("MYSQL_PORT", "3306"),
+        "OPTIONS": {"init_command": "SET sql_mode='STRICT_TRANS_TABLES'"},
+        "ATOMIC_REQUESTS": False,
+        "AUTOCOMMIT": True,
+        "CONN_MAX_AGE": 0,
+        "CONN_HEALTH_CHECKS": False,
+        "TIME_ZONE": None,
+        "TEST": {},
+    }
+    source = load_backend(settings_dict["ENGINE"]).DatabaseWrapper(settings_dict, SOURCE_ALIAS)
+    # les fonctions de Django (transactions, introspection) retrouvent la connexion par son alias
+    connections[SOURCE_ALIAS] = source
+    return source
+
+
+def copy_order():
+    """
+    Modèles à copier, chacun après ceux qu'il référence.
+     :return : La liste ordonnée des modèles (tables intermédiaires des ManyToMany comprises).
+    """
+    candidates = {
+        model for model in apps.get_models(include_auto_created=True)
+        if model._meta.managed and not model._meta.proxy and model._meta.label_lower not in SKIPPED_MODELS
+    }
+    ordered, done = [], set()
+
+    def visit(model, path):
+        if model in done or model in path:
+            return
+        path.add(model)
+        dependencies = {
+            field.related_model for field in model._meta.local_concrete_fields
+            if field.is_relation and field.related_model in candidates and field.related_model is not model
         }
+        for dependency in sorted(dependencies, key=lambda m: m._meta.label):
+            visit(dependency, path)
+        done.add(model)
+        ordered.append(model)
+
+    for model in sorted(candidates, key=lambda m: m._meta.label):
+        visit(model, set())
+    return ordered
 
-        self.stdout.write(f"Connexion à MySQL {mysql_host}:{mysql_port}/{mysql_name}...")
 
-        dump_file = None
+def sqlite_value(value):
+    """Valeur lue dans la base source, sous la forme stockée par Django dans SQLite."""
+    if isinstance(value, datetime):
+        return value.isoformat(" ")
+    if isinstance(value, UUID):
+        return value.hex
+    if isinstance(value, (date, dtime, Decimal)):
+        return str(value)
+    return value
+
+
+class Importer:
+    """
+    Copie table par table d'une base source vers la base SQLite, par lots
+    parcourus dans l'ordre des clés primaires. La dernière clé copiée de chaque
+    table est enregistrée après chaque lot : une importation interrompue ou
+    relancée plus tard ne reprend que les lignes plus récentes.
+    """
+
+    def __init__(self, source, stdout, batch_size=2000, state_path=DEFAULT_STATE, full=False, media_source=None):
+        self.source = source
+        self.stdout = stdout
+        self.batch_size = batch_size
+        self.state_path = Path(state_path)
+        self.media_source = Path(media_source) if media_source else None
+        self.state = {}
+        if not full and self.state_path.exists():
+            self.state = json.loads(self.state_path.read_text(encoding="utf-8"))
+        self.remaps = {}
+        self.media_copied = 0
+
+    def save_state(self):
+        """Enregistre les dernières clés copiées."""
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.state_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.state, indent=1), encoding="utf-8")
+        tmp.replace(self.state_path)
+
+    def build_remaps(self, source_tables):
+        """Correspondance des types de contenu et permissions, par clé naturelle."""
+        content_types = {
+            (ct.app_label, ct.model): ct.pk for ct in ContentType.objects.all()}
+        permissions = {
+            (p.content_type.app_label, p.content_type.model, p.codename): p.pk
+            for p in Permission.objects.select_related("content_type")}
+        ct_table = ContentType._meta.db_table
+        perm_table = Permission._meta.db_table
+        self.remaps = {ContentType: {}, Permission: {}}
+        if ct_table not in source_tables:
+            return
+        with self.source.cursor() as cursor:
+            cursor.execute(f"SELECT id, app_label, model FROM {ct_table}")
+            for pk, app_label, model in cursor.fetchall():
+                if (app_label, model) in content_types:
+                    self.remaps[ContentType][pk] = content_types[(app_label, model)]
+            if perm_table not in source_tables:
+                return
+            cursor.execute(
+                f"SELECT p.id, ct.app_label, ct.model, p.codename FROM {perm_table} p "
+                f"INNER JOIN {ct_table} ct ON p.content_type_id = ct.id")
+            for pk, *key in cursor.fetchall():
+                if tuple(key) in permissions:
+                    self.remaps[Permission][pk] = permissions[tuple(key)]
+
+    @staticmethod
+    def default_value(field):
+        """Valeur d'une colonne absente de la base source."""
+        if getattr(field, "auto_now", False) or getattr(field, "auto_now_add", False):
+            value = timezone.now()
+        else:
+            value = field.get_default()
+        return field.get_db_prep_save(value, connection)
+
+    def copy_media(self, name):
+        """Copie un fichier référencé depuis le répertoire media source, s'il manque."""
+        if not name or self.media_source is None:
+            return
+        source = self.media_source / name
+        target = Path(settings.MEDIA_ROOT) / name
+        if source.is_file() and not target.exists():
+            target.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(source, target)
+            self.media_copied += 1
+
+    def copy_model(self, model, source_tables):
+        """
+        Copie une table.
+         :param model: Le modèle de la table.
+         :param source_tables: Les tables présentes dans la base source.
+         :return : Le nombre de lignes copiées.
+        """
+        label = model._meta.label
+        table = model._meta.db_table
+        if table not in source_tables:
+            self.stdout.write(f"{label}: absente de la base source.")
+            return 0
+        with self.source.cursor() as cursor:
+            source_columns = {c.name for c in self.source.introspection.get_table_description(cursor, table)}
+        fields = model._meta.local_concrete_fields
+        copied = [f for f in fields if f.column in source_columns]
+        missing = [f for f in fields if f.column not in source_columns]
+        pk_index = copied.index(model._meta.pk)
+        remaps = {
+            index: self.remaps[field.related_model] for index, field in enumerate(copied)
+            if field.is_relation and field.related_model in self.remaps}
+        files = [index for index, field in enumerate(copied) if isinstance(field, models.FileField)]
+        defaults = [self.default_value(f) for f in missing]
+
+        src = self.source.ops.quote_name
+        dst = connection.ops.quote_name
+        pk_column = src(model._meta.pk.column)
+        select = (f"SELECT {', '.join(src(f.column) for f in copied)} FROM {src(table)} "
+                  f"WHERE {pk_column} > %s ORDER BY {pk_column} LIMIT %s")
+        first = (f"SELECT {', '.join(src(f.column) for f in copied)} FROM {src(table)} "
+                 f"ORDER BY {pk_column} LIMIT %s")
+        # Les lignes déjà importées sont mises à jour ; les colonnes propres à SQLite
+        # (caches, statistiques...) sont gardées, sauf les dates de modification.
+        # Tout autre conflit d'unicité fait échouer le lot plutôt que de perdre la ligne.
+        updated = [f for f in copied if not f.primary_key] + [
+            f for f in missing if getattr(f, "auto_now", False)]
+        columns = [dst(f.column) for f in copied + missing]
+        insert = (f"INSERT INTO {dst(table)} ({', '.join(columns)}) "
+                  f"VALUES ({', '.join(['%s'] * len(columns))}) "
+                  f"ON CONFLICT({dst(model._meta.pk.column)}) ")
+        if updated:
+            insert += "DO UPDATE SET " + ", ".join(
+                f"{dst(f.column)} = excluded.{dst(f.column)}" for f in updated)
+        else:
+            insert += "DO NOTHING"
+
+        last = self.state.get(label)
+        count = skipped = 0
+        start = time.monotonic()
+        while True:
+            with self.source.cursor() as cursor:
+                if last is None:
+                    cursor.execute(first, [self.batch_size])
+                else:
+                    cursor.execute(select, [last, self.batch_size])
+                rows = cursor.fetchall()
+            if not rows:
+                break
+            batch = []
+            for row in rows:
+                values = [sqlite_value(v) for v in row]
+                for index, mapping in remaps.items():
+                    if values[index] is not None:
+                        values[index] = mapping.get(values[index])
+                        if values[index] is None:
+                            break
+                else:
+                    for index in files:
+                        self.copy_media(values[index])
+                    batch.append(values + defaults)
+                    continue
+                skipped += 1
+            try:
+                with transaction.atomic():
+                    with connection.cursor() as cursor:
+                        cursor.executemany(insert, batch)
+            except IntegrityError as err:
+                raise CommandError(
+                    f"{label}: lot suivant la clé {last} refusé ({err}). Corrigez le doublon, "
+                    f"l'importation relancée reprendra à ce lot.") from err
+            last = rows[-1][pk_index]
+            self.state[label] = sqlite_value(last)
+            self.save_state()
+            count += len(batch)
+            if len(rows) < self.batch_size:
+                break
+        elapsed = time.monotonic() - start
+        rate = count / elapsed if elapsed > 0 else 0
+        message = f"{label}: {count} ligne(s) en {elapsed:.1f} s ({rate:.0f} lignes/s)"
+        if skipped:
+            message += f", {skipped} ignorée(s) (type de contenu ou permission inconnu)"
+        self.stdout.write(message + ".")
+        return count
+
+    def run(self):
+        """
+        Copie toutes les tables, puis recalcule les données dérivées.
+         :return : Le nombre total de lignes copiées.
+        """
+        source_tables = set(self.source.introspection.table_names())
+        self.build_remaps(source_tables)
+        order = copy_order()
+        total = 0
+        with connection.constraint_checks_disabled():
+            for model in order:
+                total += self.copy_model(model, source_tables)
+        try:
+            connection.check_constraints(table_names=[m._meta.db_table for m in order])
+        except IntegrityError as err:
+            self.stdout.write(f"Attention, références incohérentes : {err}")
+        if total:
+            self.rebuild_derived()
+        return total
+
+    def rebuild_derived(self):
+        """Les données calculées à l'enregistrement ne l'ont pas été pour les lignes copiées."""
+        for component in DroneComponent.objects.order_by("pk").iterator():
+            component.update_spec_values()
+        rollup.recompute(DroneConfiguration.objects.all())
+        search.rebuild()
+        # colonnes et statistiques des vols : les datalogs déjà découpés ne sont pas refaits
+        for flight_id in DroneFlight.objects.exclude(datalog="").order_by("pk").values_list("pk", flat=True):
+            enqueue("drone.ingest_datalog", flight_id=flight_id)
+        invalidate_fleet_statistics()
+
+
+class Command(BaseCommand):
+    help = ("Importe les données depuis la base MySQL source vers la base SQLite locale, "
+            "table par table et par lots ; une nouvelle exécution ne copie que les nouvelles lignes.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=2000,
+            help="Nombre de lignes lues et écrites par requête.")
+        parser.add_argument(
+            "--full", action="store_true",
+            help="Reprend toutes les lignes depuis le début (les lignes déjà importées sont mises à jour).")
+        parser.add_argument(
+            "--state", default=str(DEFAULT_STATE),
+            help="Fichier des dernières clés importées, pour la reprise.")
+        parser.add_argument(
+            "--media-source",
+            help="Répertoire media de l'ancien site, d'où copier les fichiers référencés.")
+
+    def handle(self, *args, **options):
+        source = mysql_source()
+        self.stdout.write(
+            f"Connexion à MySQL {source.settings_dict['HOST']}:{source.settings_dict['PORT']}"
+            f"/{source.settings_dict['NAME']}...")
+        importer = Importer(
+            source, self.stdout, batch_size=options["batch_size"], state_path=options["state"],
+            full=options["full"], media_source=options["media_source"])
         try:
-            with tempfile.NamedTemporaryFile(mode="w", suffix=".json", delete=False) as f:
-                dump_file = f.name
-
-            self.stdout.write("Export des données depuis MySQL...")
-            call_command(
-                "dumpdata",
-                "--database=mysql_source",
-                "--natural-foreign",
-                "--natural-primary",
-                "--output", dump_file,
-                verbosity=options["verbosity"],
-            )
-
-            self.stdout.write("Import des données dans SQLite...")
-            call_command(
-                "loaddata",
-                dump_file,
-                verbosity=options["verbosity"],
-            )
-
-            self.stdout.write(self.style.SUCCESS("Import terminé avec succès."))
+            total = importer.run()
         finally:
-            if dump_file and os.path.exists(dump_file):
-                os.unlink(dump_file)
-            settings.DATABASES.pop("mysql_source", None)
+            source.close()
+        if options["media_source"]:
+            self.stdout.write(f"{importer.media_copied} fichier(s) media copié(s).")
+        self.stdout.write(self.style.SUCCESS(f"Import terminé avec succès : {total} ligne(s)."))
@@ -0,0 +1,28 @@
+"""Management command to split flight datalogs into columnar channel files."""
+from django.core.management.base import BaseCommand
+
+from drone.datalog import DatalogError
+from drone.models import DroneFlight
+from drone.statistics import invalidate_fleet_statistics
+
+
+class Command(BaseCommand):
+    help = "Découpe les datalogs des vols en colonnes binaires projetables en mémoire."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force", action="store_true",
+            help="Refait l'ingestion même pour les datalogs déjà à jour.")
+
+    def handle(self, *args, **options):
+        flights = DroneFlight.objects.exclude(datalog="").order_by("pk")
+        for flight in flights.iterator():
+            try:
+                manifest = flight.ingest_datalog(force=options["force"])
+            except (DatalogError, OSError) as err:
+                self.stderr.write(self.style.WARNING(f"{flight}: {err}"))
+                continue
+            self.stdout.write(
+                f"{flight}: {manifest['rows']} échantillons, {len(manifest['channels'])} colonnes.")
+        invalidate_fleet_statistics()
+        self.stdout.write(self.style.SUCCESS("Ingestion terminée."))
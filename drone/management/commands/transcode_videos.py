@@ -0,0 +1,29 @@
+"""Management command to transcode flight videos into HLS streams with ffmpeg."""
+from django.core.management.base import BaseCommand
+
+from drone.base_models import touch_articles
+from drone.models import DroneFlight
+from drone.video import VideoError, transcode
+
+
+class Command(BaseCommand):
+    help = "Transcode les vidéos des vols : aperçu, vidéo basse définition et segments HLS."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force", action="store_true",
+            help="Refait le transcodage même pour les vidéos déjà à jour.")
+
+    def handle(self, *args, **options):
+        flights = DroneFlight.objects.exclude(video="").order_by("pk")
+        for flight in flights.iterator():
+            try:
+                done = transcode(flight.video.path, force=options["force"])
+            except (VideoError, OSError) as err:
+                self.stderr.write(self.style.WARNING(f"{flight}: {err}"))
+                continue
+            if done:
+                # la page du vol propose désormais le streaming
+                touch_articles([flight.pk])
+            self.stdout.write(f"{flight}: {'transcodée' if done else 'déjà à jour'}.")
+        self.stdout.write(self.style.SUCCESS("Transcodage terminé."))
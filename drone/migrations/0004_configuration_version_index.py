@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-18 11:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0004_article_list_indexes'),
+        ('drone', '0003_alter_dronecomponentcategory_id'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='droneconfiguration',
+            index=models.Index(fields=['version_number', 'sitearticle_ptr'], name='configuration_version_idx'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.1.15 on 2026-10-18 11:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0004_article_list_indexes'),
+        ('drone', '0004_configuration_version_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='droneflight',
+            name='battery_consumed',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='Batterie consommée (mAh)'),
+        ),
+        migrations.AddField(
+            model_name='droneflight',
+            name='distance',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='Distance parcourue (m)'),
+        ),
+        migrations.AddField(
+            model_name='droneflight',
+            name='duration',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='Durée du vol (s)'),
+        ),
+        migrations.AddField(
+            model_name='droneflight',
+            name='max_altitude',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='Altitude maximale (m)'),
+        ),
+        migrations.AddField(
+            model_name='droneflight',
+            name='max_speed',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='Vitesse maximale (m/s)'),
+        ),
+        migrations.AddIndex(
+            model_name='droneflight',
+            index=models.Index(fields=['duration', 'sitearticle_ptr'], name='flight_duration_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='droneflight',
+            index=models.Index(fields=['max_altitude', 'sitearticle_ptr'], name='flight_max_altitude_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='droneflight',
+            index=models.Index(fields=['max_speed', 'sitearticle_ptr'], name='flight_max_speed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='droneflight',
+            index=models.Index(fields=['battery_consumed', 'sitearticle_ptr'], name='flight_battery_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='droneflight',
+            index=models.Index(fields=['distance', 'sitearticle_ptr'], name='flight_distance_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.15 on 2026-10-18 12:04
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drone', '0005_flight_statistics'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChunkedUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('field', models.CharField(choices=[('datalog', 'Datalog'), ('video', 'Vidéo')], max_length=10, verbose_name='Champ du vol')),
+                ('filename', models.CharField(max_length=255, verbose_name='Nom du fichier')),
+                ('size', models.BigIntegerField(verbose_name='Taille totale')),
+                ('offset', models.BigIntegerField(default=0, verbose_name='Octets reçus')),
+                ('completed', models.BooleanField(default=False, verbose_name='Terminé')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Début')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Dernier morceau')),
+                ('flight', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='drone.droneflight', verbose_name='Vol')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Utilisateur')),
+            ],
+            options={
+                'verbose_name': 'Téléversement par morceaux',
+                'ordering': ['-updated'],
+            },
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.1.15 on 2026-10-18 12:10
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Copie de drone.models.numeric_spec au moment de la migration
+SPEC_NUMBER = re.compile(r"^\s*([-+]?\d+(?:[.,]\d+)?)")
+
+
+def numeric_spec(value):
+    """Valeur numérique d'une caractéristique, ou None."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = SPEC_NUMBER.match(str(value))
+    if match is None:
+        return None
+    return float(match.group(1).replace(",", "."))
+
+
+def extract_specs(apps, schema_editor):
+    """Extrait les caractéristiques numériques des composants existants."""
+    DroneComponent = apps.get_model('drone', 'DroneComponent')
+    DroneComponentSpec = apps.get_model('drone', 'DroneComponentSpec')
+    rows = []
+    for pk, specs in DroneComponent.objects.values_list('pk', 'specs').iterator():
+        for key, value in (specs or {}).items():
+            number = numeric_spec(value)
+            if number is not None:
+                rows.append(DroneComponentSpec(component_id=pk, key=str(key)[:50], value=number))
+    DroneComponentSpec.objects.bulk_create(rows, batch_size=500, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drone', '0006_chunked_upload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DroneComponentSpec',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=50, verbose_name='Caractéristique')),
+                ('value', models.FloatField(verbose_name='Valeur')),
+                ('component', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='spec_values', to='drone.dronecomponent', verbose_name='Composant')),
+            ],
+            options={
+                'verbose_name': 'Caractéristique de composant',
+                'indexes': [models.Index(fields=['key', 'value'], name='component_spec_value_idx')],
+                'constraints': [models.UniqueConstraint(fields=('component', 'key'), name='component_spec_unique')],
+            },
+        ),
+        migrations.RunPython(extract_specs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.1.15 on 2026-10-18 12:12
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+ROLLUP = {
+    ("Poids", True): "poids_embarque",
+    ("Poids", False): "poids_sol",
+    ("Prix", True): "prix_embarque",
+    ("Prix", False): "prix_sol",
+}
+
+
+def compute_rollup(apps, schema_editor):
+    """Calcule les totaux des configurations existantes."""
+    DroneConfiguration = apps.get_model('drone', 'DroneConfiguration')
+    DroneComponentSpec = apps.get_model('drone', 'DroneComponentSpec')
+    totals = {}
+    for (key, on_board), field in ROLLUP.items():
+        specs = DroneComponentSpec.objects.filter(
+            key=key, component__category__onBoard=on_board,
+            component__droneconfiguration=OuterRef('pk')).values('key').annotate(total=Sum('value')).values('total')
+        totals[field] = Coalesce(Subquery(specs), Value(0.0))
+    DroneConfiguration.objects.update(**totals)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drone', '0007_component_specs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='droneconfiguration',
+            name='poids_embarque',
+            field=models.FloatField(default=0, editable=False, verbose_name='Poids embarqué'),
+        ),
+        migrations.AddField(
+            model_name='droneconfiguration',
+            name='poids_sol',
+            field=models.FloatField(default=0, editable=False, verbose_name='Poids du matériel au sol'),
+        ),
+        migrations.AddField(
+            model_name='droneconfiguration',
+            name='prix_embarque',
+            field=models.FloatField(default=0, editable=False, verbose_name='Prix embarqué'),
+        ),
+        migrations.AddField(
+            model_name='droneconfiguration',
+            name='prix_sol',
+            field=models.FloatField(default=0, editable=False, verbose_name='Prix du matériel au sol'),
+        ),
+        migrations.RunPython(compute_rollup, migrations.RunPython.noop),
+    ]
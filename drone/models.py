@@ -1,6 +1,38 @@
 """Les modèles pour le site drone"""
+import logging
+import re
+import uuid
+
+from django.conf import settings
 from django.db import models
-from .base_models import SiteArticle, SiteArticleComment
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from common.jobs import enqueue, task
+
+from . import datalog, video
+from .base_models import SiteArticle, SiteArticleComment, touch_articles
+
+logger = logging.getLogger(__name__)
+
+# Nombre en tête d'une caractéristique, avec une virgule ou un point décimal (« 12,5 g », « 2300KV »)
+SPEC_NUMBER = re.compile(r"^\s*([-+]?\d+(?:[.,]\d+)?)")
+
+
+def numeric_spec(value):
+    """
+    Valeur numérique d'une caractéristique de composant.
+     :param value: La valeur saisie dans `DroneComponent.specs`.
+     :return : Le nombre, ou None si la valeur n'en commence pas par un.
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = SPEC_NUMBER.match(str(value))
+    if match is None:
+        return None
+    return float(match.group(1).replace(",", "."))
 
 
 class DroneArticle(SiteArticle):
@@ -80,6 +112,43 @@ class DroneComponent(SiteArticle):
         self.superprivate = False
         super().save(*args, **kwargs)
 
+    def update_spec_values(self):
+        """
+        Recopie les caractéristiques numériques dans la table `DroneComponentSpec`.
+        """
+        values = {}
+        for key, value in (self.specs or {}).items():
+            number = numeric_spec(value)
+            if number is not None:
+                values[str(key)[:50]] = number
+        self.spec_values.exclude(key__in=values).delete()
+        DroneComponentSpec.objects.bulk_create(
+            [DroneComponentSpec(component=self, key=key, value=value) for key, value in values.items()],
+            update_conflicts=True, unique_fields=['component', 'key'], update_fields=['value'])
+
+
+class DroneComponentSpec(models.Model):
+    """
+    Caractéristique numérique d'un composant, extraite de `DroneComponent.specs`
+    pour les recherches par plage de valeurs.
+    """
+    component = models.ForeignKey(DroneComponent, on_delete=models.CASCADE, related_name='spec_values',
+                                  verbose_name="Composant")
+    key = models.CharField(max_length=50, verbose_name="Caractéristique")
+    value = models.FloatField(verbose_name="Valeur")
+
+    class Meta:
+        verbose_name = "Caractéristique de composant"
+        constraints = [
+            models.UniqueConstraint(fields=['component', 'key'], name='component_spec_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['key', 'value'], name='component_spec_value_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} : {self.value:g}"
+
 
 class DroneConfiguration(SiteArticle):
     """
@@ -94,10 +163,30 @@ class DroneConfiguration(SiteArticle):
     photo = models.ImageField(null=True, blank=True,
                               upload_to='drone/confimg',
                               verbose_name="Photo de la configuration")
+    # Totaux des composants, tenus à jour par drone.rollup
+    poids_embarque = models.FloatField(default=0, editable=False,
+                                       verbose_name="Poids embarqué")
+    poids_sol = models.FloatField(default=0, editable=False,
+                                  verbose_name="Poids du matériel au sol")
+    prix_embarque = models.FloatField(default=0, editable=False,
+                                      verbose_name="Prix embarqué")
+    prix_sol = models.FloatField(default=0, editable=False,
+                                 verbose_name="Prix du matériel au sol")
+
+    # Champ de total selon la caractéristique et le caractère embarqué du composant
+    ROLLUP = {
+        ("Poids", True): "poids_embarque",
+        ("Poids", False): "poids_sol",
+        ("Prix", True): "prix_embarque",
+        ("Prix", False): "prix_sol",
+    }
 
     class Meta:
         verbose_name = "Configuration Drone"
         ordering = ['-date']
+        indexes = [
+            models.Index(fields=['version_number', 'sitearticle_ptr'], name='configuration_version_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         """
@@ -108,6 +197,10 @@ class DroneConfiguration(SiteArticle):
         self.superprivate = False
         super().save(*args, **kwargs)
 
+    def prix_total(self):
+        """Prix de tous les composants, embarqués ou au sol."""
+        return self.prix_embarque + self.prix_sol
+
 
 class DroneFlight(SiteArticle):
     """
@@ -123,10 +216,30 @@ class DroneFlight(SiteArticle):
     video = models.FileField(blank=True,
                              upload_to="drone/videoflight",
                              verbose_name="Vidéo du vol")
+    # Statistiques calculées à l'ingestion du datalog
+    duration = models.FloatField(null=True, blank=True, editable=False,
+                                 verbose_name="Durée du vol (s)")
+    max_altitude = models.FloatField(null=True, blank=True, editable=False,
+                                     verbose_name="Altitude maximale (m)")
+    max_speed = models.FloatField(null=True, blank=True, editable=False,
+                                  verbose_name="Vitesse maximale (m/s)")
+    battery_consumed = models.FloatField(null=True, blank=True, editable=False,
+                                         verbose_name="Batterie consommée (mAh)")
+    distance = models.FloatField(null=True, blank=True, editable=False,
+                                 verbose_name="Distance parcourue (m)")
+
+    STATISTICS = ('duration', 'max_altitude', 'max_speed', 'battery_consumed', 'distance')
 
     class Meta:
         verbose_name = "Vol de  Drone"
         ordering = ['-date']
+        indexes = [
+            models.Index(fields=['duration', 'sitearticle_ptr'], name='flight_duration_idx'),
+            models.Index(fields=['max_altitude', 'sitearticle_ptr'], name='flight_max_altitude_idx'),
+            models.Index(fields=['max_speed', 'sitearticle_ptr'], name='flight_max_speed_idx'),
+            models.Index(fields=['battery_consumed', 'sitearticle_ptr'], name='flight_battery_idx'),
+            models.Index(fields=['distance', 'sitearticle_ptr'], name='flight_distance_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         """
@@ -137,6 +250,55 @@ class DroneFlight(SiteArticle):
         self.superprivate = False
         super().save(*args, **kwargs)
 
+    def datalog_channels(self):
+        """
+        Ouvre les colonnes du datalog, si celui-ci a été ingéré.
+         :return : Un `datalog.ChannelStore` ou None.
+        """
+        if not self.datalog:
+            return None
+        return datalog.ChannelStore.for_log(self.datalog.path)
+
+    def ingest_datalog(self, force=False):
+        """
+        Découpe le datalog en colonnes binaires à côté du fichier original,
+        et enregistre les statistiques du vol qui en sont tirées.
+         :param force: Refait l'ingestion même si les colonnes sont à jour.
+         :return : Le manifeste des colonnes, ou None s'il n'y a pas de datalog.
+        """
+        if not self.datalog:
+            stats = dict.fromkeys(self.STATISTICS)
+            manifest = previous = None
+        else:
+            previous = datalog.read_manifest(datalog.store_path(self.datalog.path))
+            manifest = datalog.ingest(self.datalog.path, force=force)
+            stats = {name: manifest["statistics"].get(name) for name in self.STATISTICS}
+        changed = manifest != previous
+        if any(getattr(self, name) != value for name, value in stats.items()):
+            for name, value in stats.items():
+                setattr(self, name, value)
+            DroneFlight.objects.filter(pk=self.pk).update(**stats)
+            changed = True
+        if changed:
+            # les colonnes ont pu changer à statistiques égales : la page du vol aussi
+            touch_articles([self.pk])
+        return manifest
+
+    def video_stream(self):
+        """
+        Liens de lecture en streaming de la vidéo, si elle a été transcodée.
+         :return : Un dictionnaire `poster`, `preview` et `playlist` d'urls, ou None.
+        """
+        if not self.video or not video.is_transcoded(self.video.path):
+            return None
+        base = self.video.name + video.STREAM_SUFFIX
+        storage = self.video.storage
+        return {
+            "poster": storage.url(f"{base}/{video.POSTER}"),
+            "preview": storage.url(f"{base}/{video.PREVIEW}"),
+            "playlist": storage.url(f"{base}/{video.MASTER_PLAYLIST}"),
+        }
+
     def render_meteo(self):
         """
         render the flight weather
@@ -177,6 +339,92 @@ class DroneFlight(SiteArticle):
         return ret
 
 
+class ChunkedUpload(models.Model):
+    """
+    Téléversement par morceaux d'un fichier de vol, reprenable après coupure.
+    Les morceaux sont écrits à la suite dans un fichier temporaire sur disque.
+    """
+    FIELDS = [('datalog', "Datalog"), ('video', "Vidéo")]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+                             verbose_name="Utilisateur")
+    flight = models.ForeignKey(DroneFlight, on_delete=models.CASCADE,
+                               verbose_name="Vol")
+    field = models.CharField(max_length=10, choices=FIELDS,
+                             verbose_name="Champ du vol")
+    filename = models.CharField(max_length=255, verbose_name="Nom du fichier")
+    size = models.BigIntegerField(verbose_name="Taille totale")
+    offset = models.BigIntegerField(default=0, verbose_name="Octets reçus")
+    completed = models.BooleanField(default=False, verbose_name="Terminé")
+    created = models.DateTimeField(auto_now_add=True, verbose_name="Début")
+    updated = models.DateTimeField(auto_now=True, verbose_name="Dernier morceau")
+
+    class Meta:
+        verbose_name = "Téléversement par morceaux"
+        ordering = ['-updated']
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size})"
+
+    @property
+    def part_path(self):
+        """Chemin du fichier temporaire qui reçoit les morceaux."""
+        return settings.CHUNKED_UPLOAD_DIR / f"{self.id}.part"
+
+
+@receiver(post_delete, sender=ChunkedUpload)
+def delete_upload_part(sender, instance, **kwargs):
+    """Lorsque l'on supprime un téléversement, son fichier temporaire disparaît aussi."""
+    instance.part_path.unlink(missing_ok=True)
+
+
+@receiver(post_save, sender=DroneComponentCategory)
+def category_changed(sender, instance, created, **kwargs):
+    """Le nom et l'icône de la catégorie sont affichés avec chacun de ses composants."""
+    if not created:
+        touch_articles(DroneComponent.objects.filter(category=instance).values('pk'))
+
+
+@receiver(post_save, sender=DroneComponent)
+def index_component_specs(sender, instance, **kwargs):
+    """Les caractéristiques numériques suivent chaque enregistrement du composant."""
+    instance.update_spec_values()
+
+
+@receiver(post_save, sender=DroneComponent)
+@receiver(post_save, sender=DroneConfiguration)
+def build_photo_variants(sender, instance, **kwargs):
+    """Lorsque l'on sauve un composant ou une configuration, les miniatures de sa photo sont mises en file."""
+    if instance.photo:
+        enqueue("common.thumbnails", model=instance._meta.label, pk=instance.pk, fields=['photo'])
+
+
+@task("drone.ingest_datalog", priority=5)
+def ingest_datalog_job(flight_id):
+    """
+    Tâche de fond : découpage du datalog d'un vol et statistiques du vol.
+     :param flight_id: La clé primaire du vol.
+    """
+    from .statistics import invalidate_fleet_statistics
+
+    flight = DroneFlight.objects.filter(pk=flight_id).first()
+    if flight is None:
+        return
+    try:
+        flight.ingest_datalog()
+    except (datalog.DatalogError, OSError) as err:
+        logger.warning("Datalog du vol %s non ingéré: %s", flight.pk, err)
+    # les statistiques du vol sont écrites par update(), sans signal
+    invalidate_fleet_statistics()
+
+
+@receiver(post_save, sender=DroneFlight)
+def ingest_flight_datalog(sender, instance, **kwargs):
+    """Lorsque l'on sauve un vol, son datalog est mis en file pour être découpé en colonnes."""
+    enqueue("drone.ingest_datalog", flight_id=instance.pk)
+
+
 class DroneArticleComment(SiteArticleComment):
     """
     Classe pour les commentaires d'article
@@ -0,0 +1,152 @@
+"""Pagination par curseur (keyset) des pages de liste"""
+import base64
+import binascii
+import datetime
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.urls import reverse
+
+PAGE_SIZE = 15  # Nombre d'éléments par page de liste
+COMMENTS_PAGE_SIZE = 10  # Nombre de commentaires affichés puis chargés à chaque fois
+
+
+class KeysetPage:
+    """
+    Une page de résultats, avec les liens vers les pages voisines.
+    """
+
+    def __init__(self, items, previous_url=None, next_url=None):
+        self.items = items
+        self.previous_url = previous_url
+        self.next_url = next_url
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        return self.items[index]
+
+
+def _json_value(value):
+    """Sérialisation des valeurs de tri, à la microseconde près pour les dates."""
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value)
+
+
+def encode_cursor(value, pk):
+    """
+    Encode la position d'un élément dans la liste.
+     :param value: La valeur du champ de tri.
+     :param pk: La clé primaire de l'élément.
+     :return : Le curseur à mettre dans l'url.
+    """
+    raw = json.dumps([value, pk], default=_json_value)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, field):
+    """
+    Décode un curseur produit par `encode_cursor`.
+     :param cursor: Le curseur reçu dans l'url.
+     :param field: Le champ de tri, pour reconvertir la valeur.
+     :return : Le couple (valeur, clé primaire) ou None si le curseur est invalide.
+    """
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        value, pk = json.loads(raw)
+        return field.to_python(value), int(pk)
+    except (binascii.Error, ValueError, TypeError, ValidationError):
+        return None
+
+
+def _beyond(field, cursor, descending):
+    """Filtre des éléments situés après le curseur dans l'ordre donné."""
+    value, pk = cursor
+    lookup = "lt" if descending else "gt"
+    return Q(**{f"{field}__{lookup}": value}) | Q(**{field: value, f"pk__{lookup}": pk})
+
+
+def _ordering(field, descending):
+    """Ordre total sur le champ de tri, départagé par la clé primaire."""
+    if descending:
+        return f"-{field}", "-pk"
+    return field, "pk"
+
+
+def _page_url(request, key, item, field):
+    """Construit le lien vers une page voisine en conservant les autres paramètres."""
+    params = request.GET.copy()
+    params.pop("after", None)
+    params.pop("before", None)
+    params[key] = encode_cursor(getattr(item, field), item.pk)
+    return "?" + params.urlencode()
+
+
+def keyset_paginate(request, queryset, field, descending=True, per_page=PAGE_SIZE):
+    """
+    Découpe une liste en pages en se positionnant par rapport au dernier
+    élément vu plutôt que par un décalage, pour un coût constant quelle que
+    soit la profondeur de la page.
+     :param request: La requête, qui porte les curseurs `after` ou `before`.
+     :param queryset: Les éléments à paginer.
+     :param field: Le champ de tri, qui doit être indexé avec la clé primaire.
+     :param descending: Tri décroissant sur `field`.
+     :param per_page: Le nombre d'éléments par page.
+     :return : La page demandée.
+    """
+    model_field = queryset.model._meta.get_field(field)
+    before = decode_cursor(request.GET.get("before"), model_field)
+    after = decode_cursor(request.GET.get("after"), model_field)
+    items = []
+    if before is not None:
+        items = list(queryset.filter(_beyond(field, before, not descending))
+                     .order_by(*_ordering(field, not descending))[:per_page + 1])
+        has_previous = len(items) > per_page
+        items = items[:per_page][::-1]
+        has_next = True
+    if not items:
+        # Pas de curseur `before`, ou plus rien avant lui : on repart de `after`.
+        if after is not None:
+            queryset = queryset.filter(_beyond(field, after, descending))
+        items = list(queryset.order_by(*_ordering(field, descending))[:per_page + 1])
+        has_next = len(items) > per_page
+        items = items[:per_page]
+        has_previous = after is not None
+    if not items:
+        return KeysetPage(items)
+    return KeysetPage(
+        items,
+        previous_url=_page_url(request, "before", items[0], field) if has_previous else None,
+        next_url=_page_url(request, "after", items[-1], field) if has_next else None,
+    )
+
+
+def comment_page(article, cursor=None, per_page=COMMENTS_PAGE_SIZE):
+    """
+    Page des commentaires actifs d'un article, du plus récent au plus ancien.
+    La suite du fil est chargée à la demande depuis `next_url`, qui désigne le
+    dernier commentaire affiché.
+     :param article: L'article commenté.
+     :param cursor: Le curseur `before` reçu dans l'url, None pour la première page.
+     :param per_page: Le nombre de commentaires par page.
+     :return : La page de commentaires.
+    """
+    comments = article.get_all_comments()
+    before = decode_cursor(cursor, comments.model._meta.get_field('date'))
+    if before is not None:
+        comments = comments.filter(_beyond('date', before, True))
+    items = list(comments.order_by(*_ordering('date', True))[:per_page + 1])
+    if len(items) <= per_page:
+        return KeysetPage(items)
+    items = items[:per_page]
+    last = items[-1]
+    return KeysetPage(items, next_url=reverse('comments', args=[article.pk]) + "?before="
+                      + encode_cursor(last.date, last.pk))
@@ -0,0 +1,116 @@
+"""
+Totaux de poids et de prix des configurations.
+
+Les totaux sont des champs de `DroneConfiguration`, séparés entre composants
+embarqués et matériel au sol (`DroneComponentCategory.onBoard`). Ils sont
+ajustés par des mises à jour `F()` lorsque des composants sont ajoutés ou
+retirés d'une configuration, et recalculés en SQL pour les configurations
+d'un composant qui est modifié ou supprimé, ou dont la catégorie change.
+"""
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .base_models import touch_articles
+from .models import DroneComponent, DroneComponentCategory, DroneComponentSpec, DroneConfiguration
+
+
+def component_totals(component_ids):
+    """
+    Sommes des caractéristiques de composants, par champ de total.
+     :param component_ids: Les clés primaires des composants.
+     :return : Un dictionnaire champ de total -> somme.
+    """
+    keys = {key for key, _ in DroneConfiguration.ROLLUP}
+    rows = DroneComponentSpec.objects.filter(component__in=component_ids, key__in=keys).values_list(
+        'key', 'component__category__onBoard').annotate(total=Sum('value')).order_by()
+    return {DroneConfiguration.ROLLUP[(key, on_board)]: total for key, on_board, total in rows}
+
+
+def _shift(configuration_ids, totals, sign):
+    """Ajoute (sign=1) ou retire (sign=-1) des totaux aux configurations."""
+    if totals and configuration_ids:
+        DroneConfiguration.objects.filter(pk__in=configuration_ids).update(
+            **{field: F(field) + sign * total for field, total in totals.items()})
+        touch_articles(configuration_ids)
+
+
+def recompute(configurations):
+    """
+    Recalcule entièrement les totaux, en une requête.
+     :param configurations: Le queryset des configurations à recalculer.
+    """
+    totals = {}
+    for (key, on_board), field in DroneConfiguration.ROLLUP.items():
+        specs = DroneComponentSpec.objects.filter(
+            key=key, component__category__onBoard=on_board,
+            component__droneconfiguration=OuterRef('pk')).values('key').annotate(total=Sum('value')).values('total')
+        totals[field] = Coalesce(Subquery(specs), Value(0.0))
+    configurations.update(**totals)
+    touch_articles(configurations.values_list('pk', flat=True))
+
+
+def _linked(instance, reverse, pk_set):
+    """Parmi `pk_set`, les clés réellement liées à `instance` (Django transmet celles demandées)."""
+    through = DroneConfiguration.Composants.through.objects
+    if reverse:
+        return set(through.filter(dronecomponent=instance.pk, droneconfiguration__in=pk_set).values_list(
+            'droneconfiguration_id', flat=True))
+    return set(through.filter(droneconfiguration=instance.pk, dronecomponent__in=pk_set).values_list(
+        'dronecomponent_id', flat=True))
+
+
+@receiver(m2m_changed, sender=DroneConfiguration.Composants.through)
+def composants_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Ajustement des totaux lors de l'ajout ou du retrait de composants."""
+    if action == "pre_remove":
+        # seuls les liens existants retirent quelque chose des totaux
+        instance._rollup_removed = _linked(instance, reverse, pk_set)
+        return
+    # pour un ajout, Django a déjà écarté de pk_set les liens existants
+    sign = {"post_add": 1, "post_remove": -1}.get(action)
+    if action == "post_remove":
+        pk_set = instance.__dict__.pop("_rollup_removed", set())
+    if not reverse:
+        # instance est une configuration, pk_set des composants
+        if sign:
+            _shift([instance.pk], component_totals(pk_set), sign)
+        elif action == "post_clear":
+            DroneConfiguration.objects.filter(pk=instance.pk).update(
+                **{field: 0 for field in DroneConfiguration.ROLLUP.values()})
+            touch_articles([instance.pk])
+    else:
+        # instance est un composant, pk_set des configurations
+        if sign:
+            _shift(pk_set, component_totals([instance.pk]), sign)
+        elif action == "pre_clear":
+            _shift(list(instance.droneconfiguration_set.values_list('pk', flat=True)),
+                   component_totals([instance.pk]), -1)
+
+
+@receiver(post_save, sender=DroneComponent)
+def component_saved(sender, instance, created, **kwargs):
+    """Le poids, le prix ou la catégorie d'un composant a pu changer."""
+    if not created:
+        recompute(DroneConfiguration.objects.filter(Composants=instance))
+
+
+@receiver(pre_delete, sender=DroneComponent)
+def component_deleting(sender, instance, **kwargs):
+    """Les liens vers les configurations disparaissent sans signal m2m_changed."""
+    instance._rollup_configurations = list(instance.droneconfiguration_set.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=DroneComponent)
+def component_deleted(sender, instance, **kwargs):
+    """Recalcul des configurations qui utilisaient le composant supprimé."""
+    recompute(DroneConfiguration.objects.filter(pk__in=getattr(instance, "_rollup_configurations", [])))
+
+
+@receiver(post_save, sender=DroneComponentCategory)
+def category_saved(sender, instance, created, **kwargs):
+    """Une catégorie passée de l'embarqué au sol (ou l'inverse) déplace le poids et le prix de ses composants."""
+    if not created:
+        recompute(DroneConfiguration.objects.filter(
+            pk__in=DroneConfiguration.objects.filter(Composants__category=instance).values('pk')))
@@ -4,7 +4,22 @@ from pathlib import Path
 APP_PATH = Path(__file__).parent
 APP_NAME = APP_PATH.name
 
+# Durée de vie (en secondes) des fragments de page en cache, renouvelés de toute
+# façon dès que l'article ou ses commentaires changent
+FRAGMENT_CACHE_TIMEOUT = 7 * 24 * 3600
+
 # Informations de base minimale à communiquer à un template
 base_info = {
     "app_name": APP_NAME,
+    "fragment_cache_timeout": FRAGMENT_CACHE_TIMEOUT,
 }
+
+# Nombre de points renvoyés par défaut et au maximum pour un tracé de télémétrie
+TELEMETRY_POINTS = 1000
+TELEMETRY_MAX_POINTS = 5000
+
+# Clé de cache des statistiques de la flotte
+FLEET_STATISTICS_CACHE_KEY = "drone:fleet_statistics"
+
+# Exécutable ffmpeg utilisé pour transcoder les vidéos de vol
+FFMPEG = "ffmpeg"
@@ -0,0 +1,57 @@
+"""Statistiques agrégées de la flotte"""
+from django.core.cache import cache
+from django.db.models import Avg, Count, Sum
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from . import settings
+from .models import DroneComponent, DroneConfiguration, DroneFlight
+
+
+def _flight_aggregates(path):
+    """Agrégats des statistiques des vols atteints par la relation `path`."""
+    return {
+        "nb_flights": Count(path, distinct=True),
+        "total_duration": Sum(f"{path}__duration"),
+        "total_distance": Sum(f"{path}__distance"),
+        "avg_consumption": Avg(f"{path}__battery_consumed"),
+    }
+
+
+def fleet_statistics():
+    """
+    Agrège, par configuration et par composant, les statistiques des vols.
+    Toute l'agrégation est faite par la base sur les champs précalculés des vols.
+     :return : Un dictionnaire `configurations` et `composants` de listes de lignes.
+    """
+    aggregates = _flight_aggregates("droneflight")
+    configurations = DroneConfiguration.objects.annotate(**aggregates).order_by(
+        "-version_number").values("id", "titre", "version_number", *aggregates)
+    # Un composant vole avec chacun des vols des configurations qui l'utilisent.
+    aggregates = _flight_aggregates("droneconfiguration__droneflight")
+    components = DroneComponent.objects.annotate(**aggregates).filter(nb_flights__gt=0).order_by(
+        "category__name", "titre").values("id", "titre", "category__name", *aggregates)
+    return {"configurations": list(configurations), "composants": list(components)}
+
+
+def cached_fleet_statistics():
+    """
+    Statistiques de la flotte, recalculées seulement après une modification
+    des vols, configurations ou composants.
+     :return : Voir `fleet_statistics`.
+    """
+    return cache.get_or_set(settings.FLEET_STATISTICS_CACHE_KEY, fleet_statistics, timeout=None)
+
+
+def invalidate_fleet_statistics():
+    """Oublie les statistiques en cache."""
+    cache.delete(settings.FLEET_STATISTICS_CACHE_KEY)
+
+
+@receiver([post_save, post_delete], sender=DroneFlight)
+@receiver([post_save, post_delete], sender=DroneConfiguration)
+@receiver([post_save, post_delete], sender=DroneComponent)
+@receiver(m2m_changed, sender=DroneConfiguration.Composants.through)
+def flight_data_changed(sender, **kwargs):
+    """Lorsque des vols, configurations ou composants changent, les statistiques sont à refaire."""
+    invalidate_fleet_statistics()
@@ -1,7 +1,11 @@
 """news.templatetags.template_extra"""
 from django import template
 
+from common.templatetags.common_images import responsive_image
+from common.user_utils import user_has_group
+
 register = template.Library()
+register.simple_tag(responsive_image)
 
 
 @register.simple_tag
@@ -18,9 +22,22 @@ def getunit(text):
     return ""
 
 
+@register.filter(name='duration')
+def duration(seconds):
+    """
+    format a duration given in seconds
+    """
+    if seconds is None:
+        return ""
+    minutes = round(seconds / 60)
+    if minutes < 60:
+        return f"{minutes} min"
+    return f"{minutes // 60} h {minutes % 60:02d}"
+
+
 @register.filter(name='has_group')
 def has_group(user, group_name):
     """
     get the belonging of a user to a group
     """
-    return user.groups.filter(name=group_name).exists()
+    return user_has_group(user, group_name)
@@ -1,15 +1,911 @@
 """Tests pour cette application."""
-from django.test import TestCase, Client
+import shutil
+import sqlite3
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import AnonymousUser, Group, User
+from django.core import mail
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.db.utils import load_backend
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from PIL import Image
+from django.utils import timezone
+
+from common import jobs
+from common.admin import JobAdmin, SiteArticleCommentAdmin
+from common.models import Job
+from common.user_utils import user_is_developper, user_is_moderator, user_is_validated
+
+from . import benchmark, fakedata, video
+from .management.commands.import_from_mysql import Importer
+from .base_models import SiteArticle
+from .models import (
+    DroneArticle,
+    DroneArticleComment,
+    DroneComponent,
+    DroneComponentCategory,
+    DroneComponentComment,
+    DroneConfiguration,
+    DroneFlight,
+    DroneFlightComment,
+)
+from .pagination import COMMENTS_PAGE_SIZE, PAGE_SIZE
 
 
 url_conf = "drone_project.urls"
 
 
+# Les tests ne passent pas par collectstatic : pas de manifeste des noms hachés.
+# Les tâches de fond sont exécutées tout de suite, sauf dans les tests de la file.
+@override_settings(STORAGES={
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}, JOBS_EAGER=True)
+class SiteTestCase(TestCase):
+    pass
+
+
 # Create your tests here.
-class DroneTest(TestCase):
+class DroneTest(SiteTestCase):
     def test_should_respond_for_drone(self):
         client = Client(HTTP_HOST="drone.argawaen.net")
         view = reverse("index1", urlconf=url_conf)
         response = client.get(view)
         self.assertEqual(response.status_code, 200)
+
+
+class MarkdownCacheTest(SiteTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("pilote", password="pilote")
+
+    def test_render_is_stored_on_save(self):
+        article = DroneArticle.objects.create(titre="a", slug="a", auteur=self.user, contenu="**gras**")
+        self.assertIn("<strong>gras</strong>", article.contenu_html)
+        with mock.patch("common.models.markdownify") as markdownify:
+            DroneArticle.objects.get(pk=article.pk).contenu_all_md()
+            markdownify.assert_not_called()
+
+    def test_render_follows_content_update(self):
+        article = DroneArticle.objects.create(titre="a", slug="a", auteur=self.user, contenu="avant")
+        DroneArticle.objects.filter(pk=article.pk).update(contenu="*après*")
+        self.assertIn("<em>après</em>", DroneArticle.objects.get(pk=article.pk).contenu_md())
+        self.assertIn("<em>après</em>", DroneArticle.objects.get(pk=article.pk).contenu_html)
+
+
+class ListQueriesTest(SiteTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("pilote", password="pilote")
+        self.client = Client(HTTP_HOST="drone.argawaen.net")
+        self.client.force_login(self.user)
+        category = DroneComponentCategory.objects.create(name="Moteur", onBoard=True)
+        self.component = DroneComponent.objects.create(
+            titre="moteur", slug="moteur", auteur=self.user, category=category)
+        self.configuration = DroneConfiguration.objects.create(
+            titre="conf", slug="conf", auteur=self.user, version_number="1.0")
+        self.configuration.Composants.add(self.component)
+
+    def add_items(self, count):
+        start = DroneFlight.objects.count()
+        for i in range(start, start + count):
+            flight = DroneFlight.objects.create(
+                titre=f"vol {i}", slug=f"vol-{i}", auteur=self.user,
+                drone_configuration=self.configuration)
+            for j in range(4):
+                commenter = User.objects.create_user(f"c{i}-{j}")
+                DroneFlightComment.objects.create(
+                    article=flight, auteur=commenter, contenu=f"com {j}", active=True)
+            DroneArticle.objects.create(titre=f"news {i}", slug=f"news-{i}", auteur=self.user)
+
+    def count_queries(self, name):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(name, urlconf=url_conf))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_list_queries_do_not_depend_on_item_count(self):
+        self.add_items(1)
+        small = {name: self.count_queries(name) for name in ("index", "vols", "confs", "comps")}
+        self.add_items(5)
+        large = {name: self.count_queries(name) for name in ("index", "vols", "confs", "comps")}
+        self.assertEqual(small, large)
+
+    def test_list_shows_last_comments(self):
+        self.add_items(1)
+        response = self.client.get(reverse("vols", urlconf=url_conf))
+        self.assertEqual(response.context["vols"][0].nb_comments(), 4)
+        self.assertEqual(len(response.context["vols"][0].get_comments()), 3)
+
+
+class KeysetPaginationTest(SiteTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("pilote", password="pilote")
+        self.client = Client(HTTP_HOST="drone.argawaen.net")
+        self.client.force_login(self.user)
+        configuration = DroneConfiguration.objects.create(
+            titre="conf", slug="conf", auteur=self.user, version_number="1.0")
+        date = timezone.now()
+        for i in range(PAGE_SIZE + 5):
+            # Deux vols par date pour vérifier le départage par clé primaire.
+            DroneFlight.objects.create(
+                titre=f"vol {i}", slug=f"vol-{i}", auteur=self.user,
+                drone_configuration=configuration, date=date - timedelta(days=i // 2))
+
+    def test_pages_cover_all_flights_once(self):
+        url = reverse("vols", urlconf=url_conf)
+        first = self.client.get(url).context["vols"]
+        self.assertEqual(len(first), PAGE_SIZE)
+        self.assertIsNone(first.previous_url)
+        second = self.client.get(url + first.next_url).context["vols"]
+        self.assertEqual(len(second), 5)
+        self.assertIsNone(second.next_url)
+        seen = [vol.pk for vol in first] + [vol.pk for vol in second]
+        self.assertEqual(seen, list(DroneFlight.objects.order_by("-date", "-pk").values_list("pk", flat=True)))
+        back = self.client.get(url + second.previous_url).context["vols"]
+        self.assertEqual([vol.pk for vol in back], [vol.pk for vol in first])
+
+    def test_invalid_cursor_shows_first_page(self):
+        response = self.client.get(reverse("vols", urlconf=url_conf) + "?after=n'importe")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["vols"]), PAGE_SIZE)
+
+
+class CommentThreadTest(SiteTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("pilote", password="pilote")
+        self.client = Client(HTTP_HOST="drone.argawaen.net")
+        self.client.force_login(self.user)
+        self.component = DroneComponent.objects.create(
+            titre="moteur", slug="moteur", auteur=self.user,
+            category=DroneComponentCategory.objects.create(name="Moteur", onBoard=True))
+        date = timezone.now()
+        for i in range(COMMENTS_PAGE_SIZE + 3):
+            # Deux commentaires par date pour vérifier le départage par clé primaire.
+            DroneComponentComment.objects.create(
+                article=self.component, auteur=self.user, contenu=f"commentaire {i}",
+                date=date - timedelta(hours=i // 2), active=True)
+        DroneComponentComment.objects.create(article=self.component, auteur=self.user, contenu="en attente")
+
+    def test_first_page_then_older_comments_on_demand(self):
+        response = self.client.get(reverse("detailed_comps", args=[self.component.pk], urlconf=url_conf))
+        first = response.context["comments"]
+        self.assertEqual(len(first), COMMENTS_PAGE_SIZE)
+        self.assertContains(response, first.next_url)
+        data = self.client.get(first.next_url).json()
+        self.assertIsNone(data["next_url"])
+        self.assertEqual(data["html"].count('class="comment"'), 3)
+        self.assertNotIn("en attente", data["html"])
+        expected = DroneComponentComment.objects.filter(active=True).order_by("-date", "-pk")
+        self.assertIn(expected.last().contenu, data["html"])
+        self.assertEqual([c.pk for c in first], list(expected.values_list("pk", flat=True)[:COMMENTS_PAGE_SIZE]))
+
+    def test_hidden_article_comments_are_not_found(self):
+        self.component.developper = True
+        self.component.save()
+        response = self.client.get(reverse("comments", args=[self.component.pk], urlconf=url_conf))
+        self.assertEqual(response.status_code, 404)
+
+
+BLACKBOX_CSV = (
+    '"Product","Blackbox flight data recorder"\n'
+    'loopIteration, time (us), rcCommand[3], vbatLatest (V), flightModeFlags\n'
+    + "".join(f"{i}, {5000000 + i * 1000}, {1000 + i}, {16.8 - i / 100:.2f}, ANGLE\n" for i in range(100))
+    + "100, 5100000, , 15.8, ANGLE\n"
+)
+
+
+class VisibilityTest(SiteTestCase):
+    def setUp(self):
+        self.author = User.objects.create_user("auteur", password="auteur")
+        self.member = User.objects.create_user("membre", password="membre")
+        for flag in ("public", "private", "superprivate", "staff", "developper"):
+            DroneArticle.objects.create(titre=flag, slug=flag, auteur=self.author,
+                                        **({flag: True} if flag != "public" else {}))
+
+    def visible(self, user):
+        return set(DroneArticle.objects.visible_to(user).values_list("titre", flat=True))
+
+    def test_flags_are_filtered_by_the_database(self):
+        self.assertEqual(self.visible(AnonymousUser()), {"public"})
+        self.assertEqual(self.visible(self.member), {"public", "private"})
+        self.member.groups.add(Group.objects.create(name="validated"))
+        self.assertEqual(self.visible(self.member), {"public", "private", "superprivate"})
+        self.assertEqual(self.visible(self.author), {"public", "private", "superprivate", "staff"})
+        self.author.is_superuser = True
+        self.assertEqual(len(self.visible(self.author)), 5)
+
+    def test_hidden_article_detail_is_not_found(self):
+        client = Client(HTTP_HOST="drone.argawaen.net")
+        client.force_login(self.member)
+        hidden = DroneArticle.objects.get(titre="staff")
+        response = client.get(reverse("detailed_article", args=[hidden.pk], urlconf=url_conf))
+        self.assertEqual(response.status_code, 404)
+
+
+class SearchTest(SiteTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("pilote", password="pilote")
+        self.client = Client(HTTP_HOST="drone.argawaen.net")
+        self.client.force_login(self.user)
+        self.configuration = DroneConfiguration.objects.create(
+            titre="Hélice tripale", slug="conf", auteur=self.user, version_number="1.0",
+            contenu="Essai de <b>moteurs</b> plus puissants.")
+        self.flight = DroneFlight.objects.create(
+            titre="Vol du soir", slug="vol", auteur=self.user, drone_configuration=self.configuration)
+        DroneArticle.objects.create(titre="helice cachée", slug="cache", auteur=self.user, developper=True)
+
+    def search(self, text):
+        return self.client.get(reverse("search", urlconf=url_conf), {"q": text}).context["results"]
+
+    def test_results_are_ranked_highlighted_and_visible(self):
+        results = self.search("helice")
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]["titre"], "<mark>Hélice</mark> tripale")
+        self.assertEqual(results[0]["url"], f"/confs/{self.configuration.pk}")
+        self.assertIn("&lt;b&gt;<mark>moteurs</mark>", self.search("moteur")[0]["extrait"])
+
+    def test_index_follows_comments_and_deletion(self):
+        self.assertEqual(self.search("atterrissage"), [])
+        DroneFlightComment.objects.create(article=self.flight, auteur=self.user,
+                                          contenu="Atterrissage un peu dur.", active=True)
+        self.assertEqual(self.search("atterrissage")[0]["url"], f"/vols/{self.flight.pk}")
+        self.flight.delete()
+        self.assertEqual(self.search("atterrissage"), [])
+        self.assertEqual(self.search('" OR *'), [])
+
+    def test_comments_approved_in_bulk_are_indexed(self):
+        DroneFlightComment.objects.create(article=self.flight, auteur=self.user, contenu="Atterrissage parfait.")
+        self.assertEqual(self.search("atterrissage"), [])
+        comment_admin = SiteArticleCommentAdmin(DroneFlightComment, admin.site)
+        comment_admin.approve_comments(None, DroneFlightComment.objects.filter(active=False))
+        self.assertEqual(self.search("atterrissage")[0]["url"], f"/vols/{self.flight.pk}")
+
+    def test_anonymous_user_is_redirected_to_login(self):
+        response = Client(HTTP_HOST="drone.argawaen.net").get(reverse("search", urlconf=url_conf), {"q": "helice"})
+        self.assertEqual(response.status_code, 302)
+
+
+class ComponentSpecTest(SiteTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("pilote", password="pilote")
+        self.client = Client(HTTP_HOST="drone.argawaen.net")
+        self.client.force_login(self.user)
+        self.motors = DroneComponentCategory.objects.create(name="Moteur", onBoard=True)
+        for name, specs in (("petit", {"KV": "1900KV", "Poids": 28}),
+                            ("moyen", {"KV": "2450 KV", "Poids": "31,5 g"}),
+                            ("gros", {"KV": 2750, "Poids": 35, "Couleur": "rouge"})):
+            DroneComponent.objects.create(titre=name, slug=name, auteur=self.user, category=self.motors, specs=specs)
+
+    def catalogue(self, **params):
+        return self.client.get(reverse("comps", urlconf=url_conf), params).context
+
+    def test_numeric_specs_are_extracted(self):
+        gros = DroneComponent.objects.get(titre="gros")
+        self.assertEqual(dict(gros.spec_values.values_list("key", "value")), {"KV": 2750.0, "Poids": 35.0})
+        gros.specs = {"KV": "2300"}
+        gros.save()
+        self.assertEqual(dict(gros.spec_values.values_list("key", "value")), {"KV": 2300.0})
+
+    def test_range_and_facets(self):
+        context = self.catalogue(spec="KV", min=2300)
+        self.assertEqual([c.titre for c in context["composants"]], ["gros", "moyen"])
+        context = self.catalogue(spec="Poids", max=32)
+        self.assertEqual([c.titre for c in context["composants"]], ["moyen", "petit"])
+        facets = {s["key"]: (s["nb"], s["min"], s["max"]) for s in context["specs"]}
+        self.assertEqual(facets["Poids"], (3, 28.0, 35.0))
+        self.assertEqual(context["categories"][0].nb, 3)
+
+
+class ConfigurationRollupTest(SiteTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("pilote", password="pilote")
+        onboard = DroneComponentCategory.objects.create(name="Moteur", onBoard=True)
+        ground = DroneComponentCategory.objects.create(name="Télécommande", onBoard=False)
+        self.motor = DroneComponent.objects.create(
+            titre="moteur", slug="moteur", auteur=self.user, category=onboard, specs={"Poids": 30, "Prix": "20 €"})
+        self.frame = DroneComponent.objects.create(
+            titre="châssis", slug="chassis", auteur=self.user, category=onboard, specs={"Poids": 100})
+        self.radio = DroneComponent.objects.create(
+            titre="radio", slug="radio", auteur=self.user, category=ground, specs={"Poids": 400, "Prix": 150})
+        self.old = DroneConfiguration.objects.create(
+            titre="conf", slug="conf", auteur=self.user, version_number="1.0")
+        self.old.Composants.add(self.motor, self.radio)
+        self.new = DroneConfiguration.objects.create(
+            titre="conf", slug="conf", auteur=self.user, version_number="1.1")
+        self.new.Composants.add(self.motor, self.frame, self.radio)
+
+    def totals(self, configuration):
+        configuration.refresh_from_db()
+        return [getattr(configuration, field) for field in ("poids_embarque", "poids_sol", "prix_embarque", "prix_sol")]
+
+    def test_totals_follow_components(self):
+        self.assertEqual(self.totals(self.old), [30, 400, 20, 150])
+        self.assertEqual(self.totals(self.new), [130, 400, 20, 150])
+        self.new.Composants.remove(self.radio)
+        self.frame.droneconfiguration_set.add(self.old)
+        self.assertEqual(self.totals(self.new), [130, 0, 20, 0])
+        self.assertEqual(self.totals(self.old), [130, 400, 20, 150])
+        self.motor.specs = {"Poids": 35, "Prix": 25}
+        self.motor.save()
+        self.assertEqual(self.totals(self.old), [135, 400, 25, 150])
+        self.frame.delete()
+        self.assertEqual(self.totals(self.new), [35, 0, 25, 0])
+        self.old.Composants.clear()
+        self.assertEqual(self.totals(self.old), [0, 0, 0, 0])
+
+    def test_removing_a_non_member_or_moving_a_category(self):
+        self.old.Composants.remove(self.frame)
+        self.radio.droneconfiguration_set.remove(self.old, self.old)
+        self.assertEqual(self.totals(self.old), [30, 0, 20, 0])
+        self.radio.category.onBoard = True
+        self.radio.category.save()
+        self.assertEqual(self.totals(self.new), [530, 0, 170, 0])
+
+    def test_diff_between_versions(self):
+        client = Client(HTTP_HOST="drone.argawaen.net")
+        client.force_login(self.user)
+        context = client.get(reverse("diff_confs", urlconf=url_conf), {"from": "1.0", "to": "1.1"}).context
+        self.assertEqual(context["added"], [self.frame])
+        self.assertEqual(context["removed"], [])
+        self.assertEqual(context["totals"][0]["delta"], 100)
+        response = client.get(reverse("diff_confs", urlconf=url_conf), {"from": "1.0", "to": "9.9"})
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(CACHES={
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "fragments": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "fragments"},
+})
+class FragmentCacheTest(SiteTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("pilote", password="pilote")
+        self.client = Client(HTTP_HOST="drone.argawaen.net")
+        self.client.force_login(self.user)
+        self.article = DroneArticle.objects.create(titre="première", slug="news", auteur=self.user)
+
+    def index(self):
+        return self.client.get(reverse("index", urlconf=url_conf)).content.decode()
+
+    def test_items_are_served_from_cache_until_modified(self):
+        self.assertIn("première", self.index())
+        # une écriture qui ne touche pas updated_at ne se voit pas : le fragment vient du cache
+        DroneArticle.objects.filter(pk=self.article.pk).update(titre="modifiée en douce")
+        self.assertIn("première", self.index())
+        self.article.titre = "seconde"
+        self.article.save()
+        self.assertIn("seconde", self.index())
+        comment = DroneArticleComment.objects.create(
+            article=self.article, auteur=self.user, contenu="bravo", active=True)
+        self.assertIn("bravo", self.index())
+        comment.contenu = "super"
+        comment.save()
+        self.assertIn("super", self.index())
+
+    def test_comments_approved_in_bulk_refresh_the_page(self):
+        DroneArticleComment.objects.create(article=self.article, auteur=self.user, contenu="en attente")
+        updated_at = DroneArticle.objects.get(pk=self.article.pk).updated_at
+        comment_admin = SiteArticleCommentAdmin(DroneArticleComment, admin.site)
+        comment_admin.approve_comments(None, DroneArticleComment.objects.filter(active=False))
+        self.assertGreater(DroneArticle.objects.get(pk=self.article.pk).updated_at, updated_at)
+        self.assertIn("en attente", self.index())
+
+    def test_renamed_author_or_category_refreshes_the_items(self):
+        category = DroneComponentCategory.objects.create(name="Moteur", onBoard=True)
+        component = DroneComponent.objects.create(titre="moteur", slug="moteur", auteur=self.user, category=category)
+        updated_at = DroneComponent.objects.get(pk=component.pk).updated_at
+        category.name = "Moteurs"
+        category.save()
+        self.assertGreater(DroneComponent.objects.get(pk=component.pk).updated_at, updated_at)
+        updated_at = DroneArticle.objects.get(pk=self.article.pk).updated_at
+        self.user.username = "pilote2"
+        self.user.save()
+        self.assertGreater(DroneArticle.objects.get(pk=self.article.pk).updated_at, updated_at)
+
+
+class ConditionalGetTest(SiteTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("pilote", password="pilote")
+        self.client = Client(HTTP_HOST="drone.argawaen.net")
+        self.client.force_login(self.user)
+        self.article = DroneArticle.objects.create(titre="news", slug="news", auteur=self.user)
+        self.url = reverse("detailed_article", args=[self.article.pk], urlconf=url_conf)
+        # le navigateur a déjà reçu le cookie CSRF d'une page à formulaire
+        self.client.get(self.url)
+
+    def revisit(self, url, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"],
+                               HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+
+    def test_unchanged_pages_are_not_modified(self):
+        for url in (self.url, reverse("index", urlconf=url_conf)):
+            first = self.client.get(url)
+            self.assertEqual(first.status_code, 200)
+            with self.assertNumQueries(4):  # session, utilisateur, groupes, agrégat
+                self.assertEqual(self.revisit(url, first).status_code, 304)
+
+    def test_new_comment_or_other_user_changes_the_page(self):
+        first = self.client.get(self.url)
+        DroneArticleComment.objects.create(article=self.article, auteur=self.user, contenu="bravo", active=True)
+        self.assertEqual(self.revisit(self.url, first).status_code, 200)
+        first = self.client.get(self.url)
+        self.client.force_login(User.objects.create_user("autre"))
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 200)
+
+    def test_related_configuration_or_new_csrf_token_changes_the_page(self):
+        configuration = DroneConfiguration.objects.create(
+            titre="conf", slug="conf", auteur=self.user, version_number="1.0")
+        DroneFlight.objects.create(titre="vol", slug="vol", auteur=self.user, drone_configuration=configuration)
+        url = reverse("vols", urlconf=url_conf)
+        first = self.client.get(url)
+        configuration.titre = "conf renommée"
+        configuration.save()
+        self.assertEqual(self.revisit(url, first).status_code, 200)
+        first = self.client.get(self.url)
+        self.assertEqual(self.revisit(self.url, first).status_code, 304)
+        # une nouvelle connexion renouvelle le jeton CSRF des formulaires de la page
+        self.client.cookies[settings.CSRF_COOKIE_NAME] = "a" * 32
+        self.assertEqual(self.revisit(self.url, first).status_code, 200)
+        # une page sans formulaire ne pose pas de cookie CSRF
+        response = Client(HTTP_HOST="drone.argawaen.net").get(reverse("index", urlconf=url_conf))
+        self.assertNotIn(settings.CSRF_COOKIE_NAME, response.cookies)
+
+
+class InstrumentationTest(SiteTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("pilote", password="pilote", is_staff=True)
+        self.client = Client(HTTP_HOST="drone.argawaen.net")
+        self.client.force_login(self.user)
+        article = DroneArticle.objects.create(titre="news", slug="news", auteur=self.user, contenu="**gras**")
+        self.url = reverse("detailed_article", args=[article.pk], urlconf=url_conf)
+
+    def test_server_timing_and_slow_request_log(self):
+        with override_settings(INSTRUMENTATION_SLOW_REQUEST_MS=0), \
+                self.assertLogs("common.instrumentation", "WARNING") as logs:
+            response = self.client.get(self.url)
+        timing = response["Server-Timing"]
+        for metric in ("total;dur=", "db;dur=", "tpl;dur=", "md;dur="):
+            self.assertIn(metric, timing)
+        self.assertRegex(timing, r'desc="[1-9]\d* SQL"')
+        self.assertIn("detailed_article", logs.output[0])
+
+    def test_percentiles_page_is_staff_only(self):
+        self.client.get(self.url)
+        response = self.client.get(reverse("perfs", urlconf=url_conf))
+        self.assertContains(response, "detailed_article")
+        self.user.is_staff = False
+        self.user.save()
+        self.assertEqual(self.client.get(reverse("perfs", urlconf=url_conf)).status_code, 302)
+
+
+class ProfilingTest(SiteTestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        profile_settings = override_settings(PROFILE_DIR=Path(self.tmp))
+        profile_settings.enable()
+        self.addCleanup(profile_settings.disable)
+        self.user = User.objects.create_user("pilote", password="pilote", is_staff=True)
+        self.client = Client(HTTP_HOST="drone.argawaen.net")
+        self.client.force_login(self.user)
+        self.url = reverse("vols", urlconf=url_conf)
+
+    def test_staff_request_is_profiled_and_listed(self):
+        response = self.client.get(self.url, {"_profile": ""})
+        self.assertEqual(response.status_code, 200)
+        report = self.client.get(reverse("profil", args=[response["X-Profile"]], urlconf=url_conf))
+        self.assertContains(report, "cumulative")
+        self.assertContains(report, "Allocations mémoire")
+        self.assertContains(self.client.get(reverse("perfs", urlconf=url_conf)), response["X-Profile"])
+        shown = self.client.get(self.url, {"_profile": "show"})
+        self.assertEqual(shown["Content-Type"], "text/plain; charset=utf-8")
+
+    def test_other_users_are_not_profiled(self):
+        self.client.force_login(User.objects.create_user("autre"))
+        self.assertNotIn("X-Profile", self.client.get(self.url, {"_profile": ""}))
+        self.assertFalse(any(Path(self.tmp).iterdir()))
+
+
+class MysqlImportTest(SiteTestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.user = User.objects.create_user("pilote", password="pilote")
+        self.user.groups.add(Group.objects.create(name="validated"))
+        category = DroneComponentCategory.objects.create(name="Moteur", onBoard=True)
+        DroneComponent.objects.create(titre="moteur", slug="moteur", auteur=self.user, category=category,
+                                      specs={"Poids": 30})
+        # La base source reçoit une copie des tables, vidées ensuite côté destination.
+        self.source_path = Path(self.tmp) / "source.sqlite3"
+        self.source = load_backend("django.db.backends.sqlite3").DatabaseWrapper({
+            **connection.settings_dict, "NAME": str(self.source_path)}, "source")
+        connections["source"] = self.source
+        self.addCleanup(connections.__delitem__, "source")
+        self.addCleanup(self.source.close)
+        with self.source.schema_editor(atomic=False) as editor:
+            for model in (Group, User, DroneComponentCategory, SiteArticle, DroneComponent):
+                editor.create_model(model)  # avec les tables de ses ManyToMany
+        for model in (Group, User, User.groups.through, DroneComponentCategory, SiteArticle, DroneComponent):
+            columns = ", ".join(f.column for f in model._meta.local_concrete_fields)
+            with connection.cursor() as cursor:
+                cursor.execute(f"SELECT {columns} FROM {model._meta.db_table}")
+                rows = cursor.fetchall()
+            with self.source.cursor() as cursor:
+                cursor.executemany(f"INSERT INTO {model._meta.db_table} ({columns}) "
+                                   f"VALUES ({', '.join(['%s'] * len(rows[0]))})", rows)
+        DroneComponent.objects.all().delete()
+        User.objects.all().delete()
+        Group.objects.all().delete()
+
+    def run_import(self):
+        out = StringIO()
+        importer = Importer(self.source, out, batch_size=1, state_path=Path(self.tmp) / "state.json")
+        return importer.run(), out.getvalue()
+
+    def test_tables_are_copied_then_only_new_rows(self):
+        total, out = self.run_import()
+        self.assertGreater(total, 0)
+        self.assertIn("lignes/s", out)
+        user = User.objects.get(username="pilote")
+        self.assertTrue(user.check_password("pilote"))
+        self.assertEqual(list(user.groups.values_list("name", flat=True)), ["validated"])
+        component = DroneComponent.objects.get(titre="moteur")
+        self.assertEqual(component.auteur, user)
+        self.assertEqual(component.spec_values.get().value, 30)
+        self.assertEqual(self.run_import()[0], 0)
+        with sqlite3.connect(self.source_path) as source:
+            source.execute("INSERT INTO drone_dronecomponentcategory (name, onBoard) VALUES ('Hélice', 1)")
+        self.assertEqual(self.run_import()[0], 1)
+        self.assertTrue(DroneComponentCategory.objects.filter(name="Hélice").exists())
+
+    def test_unique_conflict_stops_the_import(self):
+        # même nom, autre clé : la ligne ne doit pas être perdue en silence
+        Group.objects.create(name="validated")
+        with self.assertRaisesMessage(CommandError, "auth.Group"):
+            self.run_import()
+
+    def test_imported_datalogs_are_queued_for_ingestion(self):
+        user = User.objects.create_user("auteur")
+        configuration = DroneConfiguration.objects.create(titre="conf", slug="conf", auteur=user, version_number="1.0")
+        flight = DroneFlight.objects.create(titre="vol", slug="vol", auteur=user, drone_configuration=configuration)
+        DroneFlight.objects.create(titre="sans log", slug="sans-log", auteur=user, drone_configuration=configuration)
+        # comme une ligne copiée en SQL : pas de signal, pas d'ingestion
+        DroneFlight.objects.filter(pk=flight.pk).update(datalog="datalogs/vol.csv")
+        with mock.patch("drone.management.commands.import_from_mysql.enqueue") as enqueue:
+            Importer(self.source, StringIO()).rebuild_derived()
+        enqueue.assert_called_once_with("drone.ingest_datalog", flight_id=flight.pk)
+
+
+class GroupCacheTest(SiteTestCase):
+    def test_groups_are_loaded_once_and_forgotten_on_change(self):
+        user = User.objects.create_user("membre", password="membre")
+        moderator = Group.objects.create(name="moderator")
+        with self.assertNumQueries(1):
+            self.assertFalse(user_is_validated(user))
+            self.assertFalse(user_is_developper(user))
+            self.assertFalse(user_is_moderator(user))
+        user.groups.add(moderator)
+        self.assertTrue(user_is_moderator(user))
+
+
+class DatalogTestMixin:
+    def setUp(self):
+        super().setUp()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        media_settings = override_settings(MEDIA_ROOT=self.media)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.user = User.objects.create_user("pilote", password="pilote")
+        self.configuration = DroneConfiguration.objects.create(
+            titre="conf", slug="conf", auteur=self.user, version_number="1.0")
+
+    def create_flight(self, content=BLACKBOX_CSV):
+        return DroneFlight.objects.create(
+            titre="vol", slug="vol", auteur=self.user, drone_configuration=self.configuration,
+            datalog=SimpleUploadedFile("log.csv", content.encode()))
+
+
+class DatalogIngestionTest(DatalogTestMixin, SiteTestCase):
+    def test_upload_is_split_into_channels(self):
+        flight = self.create_flight()
+        with flight.datalog_channels() as store:
+            self.assertEqual(store.channels, ["loopIteration", "rcCommand[3]", "vbatLatest (V)"])
+            self.assertEqual(store.rows, 101)
+            time = store.time()
+            self.assertEqual(time[0], 0.0)
+            self.assertAlmostEqual(time[-1], 0.1)
+            throttle = store.channel("rcCommand[3]")
+            self.assertEqual(throttle[99], 1099.0)
+            # Cellule vide : la dernière valeur connue est conservée.
+            self.assertEqual(throttle[100], 1099.0)
+
+    def test_invalid_log_does_not_prevent_saving(self):
+        flight = self.create_flight("pas,un,datalog\n1,2,3\n")
+        self.assertIsNone(flight.datalog_channels())
+        self.assertTrue(DroneFlight.objects.filter(pk=flight.pk).exists())
+
+
+class TelemetryTest(DatalogTestMixin, SiteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = Client(HTTP_HOST="drone.argawaen.net")
+        self.client.force_login(self.user)
+        rows = "".join(f"{i * 1000},{i % 100}\n" for i in range(5000))
+        self.flight = self.create_flight("time (us),alt\n" + rows)
+        self.url = reverse("telemetry_vols", args=[self.flight.pk], urlconf=url_conf)
+
+    def test_lists_channels(self):
+        data = self.client.get(self.url).json()
+        self.assertEqual(data["channels"], ["alt"])
+        self.assertAlmostEqual(data["duration"], 4.999)
+
+    def test_payload_is_bounded_by_points(self):
+        data = self.client.get(self.url, {"channel": "alt", "points": 100}).json()
+        self.assertGreater(data["level"], 0)
+        self.assertLessEqual(len(data["t"]), 100)
+        self.assertEqual(min(data["min"]), 0)
+        self.assertEqual(max(data["max"]), 99)
+
+    def test_zoom_returns_raw_samples(self):
+        data = self.client.get(self.url, {"channel": "alt", "from": 1, "to": 1.05}).json()
+        self.assertEqual(data["level"], 0)
+        self.assertEqual(len(data["t"]), 51)
+        self.assertEqual(data["min"], data["max"])
+
+    def test_unknown_channel(self):
+        self.assertEqual(self.client.get(self.url, {"channel": "nope"}).status_code, 404)
+        self.assertEqual(self.client.get(self.url, {"channel": "alt", "from": "x"}).status_code, 400)
+
+    def test_detail_page_offers_plot(self):
+        response = self.client.get(reverse("detailed_vols", args=[self.flight.pk], urlconf=url_conf))
+        self.assertEqual(response.context["channels"], ["alt"])
+
+
+class FlightStatisticsTest(DatalogTestMixin, SiteTestCase):
+    def flight_log(self, seconds):
+        rows = "".join(
+            f"{i * 100000},{1000 + i * 10},{i * 0.5:.2f},{i * 3},{48.8 + i * 1e-4:.7f},2.35\n"
+            for i in range(seconds * 10 + 1))
+        return "time (us),BaroAlt (cm),GPS_speed (m/s),energyCumulative (mAh),GPS_coord[0],GPS_coord[1]\n" + rows
+
+    def test_statistics_are_stored_on_upload(self):
+        flight = DroneFlight.objects.get(pk=self.create_flight(self.flight_log(10)).pk)
+        self.assertAlmostEqual(flight.duration, 10.0)
+        self.assertAlmostEqual(flight.max_altitude, 10.0)
+        self.assertAlmostEqual(flight.max_speed, 50.0)
+        self.assertAlmostEqual(flight.battery_consumed, 300.0)
+        self.assertAlmostEqual(flight.distance, 1112, delta=2)
+
+    def test_flights_sorted_and_filtered_by_statistics(self):
+        short = self.create_flight(self.flight_log(5))
+        long = self.create_flight(self.flight_log(20))
+        self.create_flight("pas,un,datalog\n")
+        client = Client(HTTP_HOST="drone.argawaen.net")
+        client.force_login(self.user)
+        url = reverse("vols", urlconf=url_conf)
+        response = client.get(url, {"sort": "duration"})
+        self.assertEqual([vol.pk for vol in response.context["vols"]], [long.pk, short.pk])
+        response = client.get(url, {"min_duration": "10"})
+        self.assertEqual([vol.pk for vol in response.context["vols"]], [long.pk])
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class FleetStatisticsTest(SiteTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("pilote", password="pilote")
+        self.client = Client(HTTP_HOST="drone.argawaen.net")
+        self.client.force_login(self.user)
+        battery = DroneComponentCategory.objects.create(name="Batterie", onBoard=True)
+        self.battery = DroneComponent.objects.create(
+            titre="4S 1500", slug="4s", auteur=self.user, category=battery)
+        self.configurations = []
+        for version in ("1.0", "2.0"):
+            configuration = DroneConfiguration.objects.create(
+                titre="conf", slug="conf", auteur=self.user, version_number=version)
+            configuration.Composants.add(self.battery)
+            self.configurations.append(configuration)
+        self.add_flight(self.configurations[0], 300, 1000)
+        self.add_flight(self.configurations[0], 200, 800)
+        self.add_flight(self.configurations[1], 100, None)
+
+    def add_flight(self, configuration, duration, consumption):
+        flight = DroneFlight.objects.create(
+            titre="vol", slug="vol", auteur=self.user, drone_configuration=configuration)
+        DroneFlight.objects.filter(pk=flight.pk).update(duration=duration, battery_consumed=consumption)
+        return flight
+
+    def get_statistics(self):
+        response = self.client.get(reverse("stats", urlconf=url_conf))
+        self.assertEqual(response.status_code, 200)
+        return response.context
+
+    def test_aggregates_per_configuration_and_component(self):
+        context = self.get_statistics()
+        first = next(c for c in context["configurations"] if c["id"] == self.configurations[0].pk)
+        self.assertEqual(first["nb_flights"], 2)
+        self.assertEqual(first["total_duration"], 500)
+        self.assertEqual(first["avg_consumption"], 900)
+        battery = context["composants"][0]
+        self.assertEqual(battery["nb_flights"], 3)
+        self.assertEqual(battery["total_duration"], 600)
+
+    def test_cache_is_invalidated_by_new_flight(self):
+        self.get_statistics()
+        with CaptureQueriesContext(connection) as queries:
+            self.get_statistics()
+        cached = len(queries)
+        self.add_flight(self.configurations[1], 50, None)
+        with CaptureQueriesContext(connection) as queries:
+            context = self.get_statistics()
+        self.assertGreater(len(queries), cached)
+        self.assertEqual(context["composants"][0]["nb_flights"], 4)
+
+
+class ThumbnailTest(DatalogTestMixin, SiteTestCase):
+    def photo(self, width):
+        buffer = BytesIO()
+        Image.new("RGB", (width, width // 2), "red").save(buffer, "PNG")
+        return SimpleUploadedFile("photo.png", buffer.getvalue())
+
+    def test_variants_are_built_and_offered_in_srcset(self):
+        category = DroneComponentCategory.objects.create(name="Cadre", onBoard=True)
+        component = DroneComponent.objects.create(
+            titre="cadre", slug="cadre", auteur=self.user, category=category, photo=self.photo(700))
+        thumbs = Path(self.media) / "drone" / "compimg" / "thumbs"
+        self.assertEqual(
+            sorted(p.name for p in thumbs.iterdir()),
+            [f"photo-{w}.{e}" for w in (160, 320, 640) for e in ("jpg", "webp")])
+        client = Client(HTTP_HOST="drone.argawaen.net")
+        client.force_login(self.user)
+        response = client.get(reverse("comps", urlconf=url_conf))
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, "thumbs/photo-320.webp 320w")
+        self.assertEqual(component.photo.name, "drone/compimg/photo.png")
+
+
+class VideoTranscodingTest(DatalogTestMixin, SiteTestCase):
+    def test_detail_page_embeds_transcoded_stream(self):
+        flight = DroneFlight.objects.create(
+            titre="vol", slug="vol", auteur=self.user, drone_configuration=self.configuration,
+            video=SimpleUploadedFile("vol.mp4", b"not really a video"))
+        self.assertIsNone(flight.video_stream())
+
+        def fake_ffmpeg(*args):
+            Path(args[-1]).write_bytes(b"")
+
+        with mock.patch("drone.video._ffmpeg", side_effect=fake_ffmpeg) as ffmpeg:
+            self.assertTrue(video.transcode(flight.video.path))
+            self.assertFalse(video.transcode(flight.video.path))
+        self.assertEqual(ffmpeg.call_count, 2 + len(video.RENDITIONS))
+        stream = flight.video_stream()
+        self.assertTrue(stream["playlist"].endswith("vol.mp4.hls/master.m3u8"))
+        client = Client(HTTP_HOST="drone.argawaen.net")
+        client.force_login(self.user)
+        response = client.get(reverse("detailed_vols", args=[flight.pk], urlconf=url_conf))
+        self.assertContains(response, 'poster="/media/drone/videoflight/vol.mp4.hls/poster.jpg"')
+
+
+class ChunkedUploadTest(DatalogTestMixin, SiteTestCase):
+    def setUp(self):
+        super().setUp()
+        upload_settings = override_settings(CHUNKED_UPLOAD_DIR=Path(self.media) / "uploads")
+        upload_settings.enable()
+        self.addCleanup(upload_settings.disable)
+        self.user.is_staff = True
+        self.user.save()
+        self.client = Client(HTTP_HOST="drone.argawaen.net")
+        self.client.force_login(self.user)
+        self.flight = DroneFlight.objects.create(
+            titre="vol", slug="vol", auteur=self.user, drone_configuration=self.configuration)
+        self.url = reverse("upload_vols", args=[self.flight.pk], urlconf=url_conf)
+
+    def start(self, content):
+        return self.client.post(self.url, {"field": "datalog", "filename": "log.csv", "size": len(content)}).json()
+
+    def put(self, state, content, start, end):
+        return self.client.put(state["url"], content[start:end], content_type="application/octet-stream",
+                               HTTP_CONTENT_RANGE=f"bytes {start}-{end - 1}/{len(content)}")
+
+    def test_upload_is_resumed_and_attached_to_flight(self):
+        content = BLACKBOX_CSV.encode()
+        state = self.start(content)
+        self.assertEqual(state["offset"], 0)
+        self.assertEqual(self.put(state, content, 0, 1000).json()["offset"], 1000)
+        # Reprise : le même fichier reprend au dernier octet reçu, un morceau rejoué est refusé.
+        state = self.start(content)
+        self.assertEqual(state["offset"], 1000)
+        replay = self.put(state, content, 0, 1000)
+        self.assertEqual(replay.status_code, 409)
+        self.assertEqual(replay.json()["offset"], 1000)
+        state = self.put(state, content, 1000, len(content)).json()
+        self.assertTrue(state["completed"])
+        self.flight.refresh_from_db()
+        self.assertEqual(self.flight.datalog.read(), content)
+        self.assertIsNotNone(self.flight.datalog_channels())
+        self.assertFalse(any((Path(self.media) / "uploads").iterdir()))
+
+    def test_staff_only(self):
+        self.user.is_staff = False
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+
+@override_settings(CACHES={alias: {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": alias}
+                           for alias in ("default", "fragments")})
+class BenchmarkTest(DatalogTestMixin, SiteTestCase):
+    def test_pages_respond_within_query_budget(self):
+        created = fakedata.generate(users=3, components=10, configurations=3, flights=6, articles=3,
+                                    comments=2, datalogs=1)
+        self.assertEqual(created["datalogs"], 1)
+        self.assertTrue(DroneFlight.objects.filter(duration__isnull=False).exists())
+        self.user.is_staff = True
+        self.user.save()
+        results = benchmark.run(self.user, repeat=1, label="test")
+        self.assertIn("telemetry_vols", [row["view"] for row in results])
+        for row in results:
+            self.assertEqual(row["status"], 200, row["view"])
+            self.assertLessEqual(row["queries"], row["budget"], row["view"])
+
+    def test_generated_accounts_cannot_log_in_and_production_is_refused(self):
+        fakedata.generate(users=2, components=0, configurations=0, flights=0, articles=0, datalogs=0)
+        self.assertFalse(User.objects.filter(username__startswith=fakedata.FAKE_PREFIX).first().has_usable_password())
+        with self.assertRaisesMessage(CommandError, "--force"):
+            call_command("generate_fake_data", users=1)
+
+
+@override_settings(JOBS_EAGER=False)
+class JobQueueTest(DatalogTestMixin, SiteTestCase):
+    def test_datalog_is_ingested_by_the_worker(self):
+        flight = self.create_flight()
+        flight.save()
+        self.assertEqual(Job.objects.filter(name="drone.ingest_datalog", status=Job.PENDING).count(), 1)
+        self.assertIsNone(flight.datalog_channels())
+        call_command("run_jobs", once=True, processes=1, stdout=StringIO())
+        self.assertEqual(Job.objects.get().status, Job.DONE)
+        with flight.datalog_channels() as store:
+            self.assertIn("vbatLatest (V)", store.channels)
+
+    def test_failed_job_is_retried_later_then_given_up(self):
+        @jobs.task("test.broken", max_attempts=2)
+        def broken():
+            raise RuntimeError("panne")
+        self.addCleanup(jobs.TASKS.pop, "test.broken")
+        job = jobs.enqueue("test.broken")
+        with self.assertLogs("common.jobs", "WARNING"):
+            self.assertEqual(jobs.run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.PENDING, 1))
+        self.assertIn("panne", job.error)
+        self.assertEqual(jobs.run_pending(), 0)  # pas avant le délai
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        with self.assertLogs("common.jobs", "WARNING"):
+            jobs.run_pending()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+
+    def test_password_reset_email_is_sent_first_by_the_worker(self):
+        self.user.email = "pilote@example.org"
+        self.user.save()
+        self.create_flight()
+        response = Client(HTTP_HOST="drone.argawaen.net").post(
+            reverse("password_reset", urlconf=url_conf), {"email": self.user.email})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(mail.outbox), 0)
+        email_job = Job.objects.get(name="connector.password_reset_mail")
+        # le lien de réinitialisation n'est pas stocké dans la file
+        self.assertNotIn("token", email_job.arguments)
+        self.assertEqual(email_job.arguments["user_id"], self.user.pk)
+        self.assertEqual(JobAdmin(Job, admin.site).get_exclude(None, email_job), ("arguments",))
+        self.assertEqual(jobs.claim_job(), email_job.pk)
+        self.assertTrue(jobs.execute(email_job.pk))
+        self.assertEqual(mail.outbox[0].to, [self.user.email])
+        self.assertIn("/reset/", mail.outbox[0].body)
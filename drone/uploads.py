@@ -0,0 +1,128 @@
+"""
+Téléversement par morceaux des fichiers de vol (datalog et vidéo).
+
+Le navigateur envoie le fichier en morceaux successifs (requêtes PUT avec un
+en-tête Content-Range). Chaque morceau est recopié par blocs dans un fichier
+temporaire sur disque : aucun fichier n'est gardé en mémoire par le serveur.
+Un téléversement interrompu reprend à partir du dernier octet reçu.
+"""
+import re
+
+from django.conf import settings
+from django.core.files import File
+
+from .models import ChunkedUpload
+
+READ_SIZE = 65536  # Taille des blocs lus dans le corps de la requête
+CONTENT_RANGE = re.compile(r"^bytes (\d+)-(\d+)/(\d+)$")
+
+
+class UploadError(Exception):
+    """Le téléversement ou le morceau est invalide."""
+
+
+class UploadConflict(UploadError):
+    """Le morceau ne commence pas là où le téléversement s'est arrêté."""
+
+
+class _PartFile(File):
+    """
+    Fichier temporaire complet : le stockage le déplace au lieu de le recopier.
+    """
+
+    def temporary_file_path(self):
+        """Chemin utilisé par FileSystemStorage pour déplacer le fichier."""
+        return self.name
+
+
+def parse_content_range(header):
+    """
+    Lecture d'un en-tête Content-Range.
+     :param header: La valeur de l'en-tête, p.ex. 'bytes 0-1023/4096'.
+     :return : Le tuple (début, fin exclue, taille totale).
+    """
+    match = CONTENT_RANGE.match(header or "")
+    if match is None:
+        raise UploadError("En-tête Content-Range invalide.")
+    start, last, total = (int(v) for v in match.groups())
+    if last < start or last >= total:
+        raise UploadError("Plage d'octets invalide.")
+    return start, last + 1, total
+
+
+def start_upload(user, flight, field, filename, size):
+    """
+    Crée un téléversement, ou reprend celui qui a été interrompu pour le même fichier.
+     :param user: L'utilisateur qui téléverse.
+     :param flight: Le vol auquel le fichier est destiné.
+     :param field: Le champ du vol ('datalog' ou 'video').
+     :param filename: Le nom du fichier.
+     :param size: La taille totale du fichier en octets.
+     :return : Le téléversement.
+    """
+    if field not in dict(ChunkedUpload.FIELDS):
+        raise UploadError(f"Champ inconnu : {field}.")
+    if not filename or size <= 0:
+        raise UploadError("Fichier vide.")
+    if size > settings.CHUNKED_UPLOAD_MAX_SIZE:
+        raise UploadError("Fichier trop volumineux.")
+    upload, _ = ChunkedUpload.objects.get_or_create(
+        user=user, flight=flight, field=field, filename=filename[:255], size=size, completed=False)
+    settings.CHUNKED_UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    part = upload.part_path
+    received = part.stat().st_size if part.exists() else 0
+    if received < upload.offset:
+        # le fichier temporaire a été perdu : on repart de ce qui est réellement sur disque
+        ChunkedUpload.objects.filter(pk=upload.pk).update(offset=received)
+        upload.offset = received
+    return upload
+
+
+def write_chunk(upload, content_range, stream):
+    """
+    Ajoute un morceau au fichier temporaire en le lisant par blocs.
+     :param upload: Le téléversement.
+     :param content_range: L'en-tête Content-Range du morceau.
+     :param stream: Le corps de la requête, lu au fil de l'eau.
+     :return : True si le fichier est complet.
+    """
+    start, end, total = parse_content_range(content_range)
+    if total != upload.size:
+        raise UploadError("La taille annoncée ne correspond pas au téléversement.")
+    if end - start > settings.CHUNKED_UPLOAD_MAX_CHUNK_SIZE:
+        raise UploadError("Morceau trop volumineux.")
+    if upload.completed or start != upload.offset:
+        raise UploadConflict("Le morceau ne suit pas le dernier octet reçu.")
+    remaining = end - start
+    with open(upload.part_path, "r+b" if upload.part_path.exists() else "wb") as part:
+        part.seek(start)
+        part.truncate()
+        while remaining:
+            block = stream.read(min(READ_SIZE, remaining))
+            if not block:
+                break
+            part.write(block)
+            remaining -= len(block)
+        if remaining:
+            part.truncate(start)
+            raise UploadError("Morceau incomplet.")
+    # mise à jour conditionnelle : deux envois concurrents du même morceau ne peuvent pas
+    # faire avancer le téléversement deux fois
+    if not ChunkedUpload.objects.filter(pk=upload.pk, offset=start, completed=False).update(offset=end):
+        raise UploadConflict("Le téléversement a été modifié par une autre requête.")
+    upload.offset = end
+    if end == upload.size:
+        finish_upload(upload)
+        return True
+    return False
+
+
+def finish_upload(upload):
+    """
+    Attache le fichier complet au vol. Le fichier temporaire est déplacé dans MEDIA_ROOT.
+     :param upload: Le téléversement complet.
+    """
+    with _PartFile(open(upload.part_path, "rb"), name=str(upload.part_path)) as part:
+        getattr(upload.flight, upload.field).save(upload.filename, part)
+    ChunkedUpload.objects.filter(pk=upload.pk).update(completed=True)
+    upload.completed = True
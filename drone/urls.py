@@ -7,10 +7,19 @@ from .views import (
     detailed_article,
     vols,
     detailed_vol,
+    telemetry,
+    upload_vol,
+    upload_chunk,
     configurations,
     detailed_configuration,
+    diff_configurations,
     composants,
     detailed_composant,
+    commentaires,
+    statistiques,
+    recherche,
+    performances,
+    profil,
 )
 
 
@@ -20,8 +29,17 @@ urlpatterns = [
     path('news/<int:article_id>', detailed_article, name='detailed_article'),
     path('vols', vols, name='vols'),
     path('vols/<int:vol_id>', detailed_vol, name='detailed_vols'),
+    path('vols/<int:vol_id>/telemetry', telemetry, name='telemetry_vols'),
+    path('vols/<int:vol_id>/upload', upload_vol, name='upload_vols'),
+    path('uploads/<uuid:upload_id>', upload_chunk, name='upload_chunk'),
     path('confs', configurations, name='confs'),
     path('confs/<int:conf_id>', detailed_configuration, name='detailed_confs'),
+    path('confs/diff', diff_configurations, name='diff_confs'),
     path('comps', composants, name='comps'),
     path('comps/<int:comp_id>', detailed_composant, name='detailed_comps'),
+    path('comments/<int:article_id>', commentaires, name='comments'),
+    path('stats', statistiques, name='stats'),
+    path('search', recherche, name='search'),
+    path('perfs', performances, name='perfs'),
+    path('perfs/<str:name>', profil, name='profil'),
 ]
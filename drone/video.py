@@ -0,0 +1,119 @@
+"""
+Transcodage des vidéos de vol pour la lecture en streaming.
+
+À partir du fichier téléversé, ffmpeg produit à côté de l'original une
+image d'aperçu, une vidéo basse définition et, pour chaque rendu de
+`RENDITIONS`, des segments HLS décrits par une playlist maîtresse.
+"""
+import json
+import os
+import shutil
+import subprocess
+from pathlib import Path
+
+from . import settings
+
+STREAM_SUFFIX = ".hls"  # Suffixe du répertoire de streaming, à côté de la vidéo
+DONE_MARKER = "done.json"
+MASTER_PLAYLIST = "master.m3u8"
+POSTER = "poster.jpg"
+PREVIEW = "preview.mp4"
+SEGMENT_SECONDS = 4
+# Hauteur maximale, débit vidéo et débit audio de chaque rendu HLS
+RENDITIONS = (
+    (360, 800_000, 96_000),
+    (720, 2_500_000, 128_000),
+)
+
+
+class VideoError(Exception):
+    """La vidéo ne peut pas être transcodée."""
+
+
+def stream_path(video_path):
+    """
+    Répertoire de streaming d'une vidéo.
+     :param video_path: Le chemin de la vidéo originale.
+     :return : Le chemin du répertoire de streaming.
+    """
+    video_path = Path(video_path)
+    return video_path.with_name(video_path.name + STREAM_SUFFIX)
+
+
+def _source_signature(video_path):
+    """Identifie une version de la vidéo originale."""
+    stat = os.stat(video_path)
+    return {"source": Path(video_path).name, "source_size": stat.st_size, "source_mtime": stat.st_mtime}
+
+
+def is_transcoded(video_path):
+    """
+    Indique si le streaming d'une vidéo est à jour.
+     :param video_path: Le chemin de la vidéo originale.
+     :return : True si les fichiers de streaming correspondent à la vidéo.
+    """
+    try:
+        with open(stream_path(video_path) / DONE_MARKER, encoding="utf-8") as f:
+            return json.load(f) == _source_signature(video_path)
+    except (OSError, ValueError):
+        return False
+
+
+def _ffmpeg(*args):
+    """Lance ffmpeg et remonte son erreur en cas d'échec."""
+    binary = shutil.which(settings.FFMPEG)
+    if binary is None:
+        raise VideoError(f"ffmpeg introuvable ({settings.FFMPEG}).")
+    result = subprocess.run(
+        [binary, "-hide_banner", "-loglevel", "error", "-y", *map(str, args)],
+        stdin=subprocess.DEVNULL, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise VideoError(result.stderr.strip() or f"ffmpeg a échoué ({result.returncode}).")
+
+
+def _scale(height):
+    """Filtre de mise à l'échelle qui n'agrandit jamais la source."""
+    return f"scale=-2:'min({height},ih)'"
+
+
+def transcode(video_path, force=False):
+    """
+    Produit l'aperçu, la vidéo basse définition et les segments HLS d'une vidéo.
+     :param video_path: Le chemin de la vidéo originale.
+     :param force: Refait le transcodage même s'il est à jour.
+     :return : True si le transcodage a été fait, False s'il était déjà à jour.
+    """
+    video_path = Path(video_path)
+    if not force and is_transcoded(video_path):
+        return False
+    target = stream_path(video_path)
+    work = target.with_name(target.name + ".tmp")
+    shutil.rmtree(work, ignore_errors=True)
+    work.mkdir(parents=True)
+    try:
+        _ffmpeg("-ss", 1, "-i", video_path, "-frames:v", 1, "-vf", _scale(720), work / POSTER)
+        _ffmpeg("-i", video_path, "-vf", _scale(240),
+                "-c:v", "libx264", "-preset", "veryfast", "-b:v", "300k",
+                "-c:a", "aac", "-b:a", "64k", "-movflags", "+faststart", work / PREVIEW)
+        master = ["#EXTM3U", "#EXT-X-VERSION:3"]
+        for height, video_rate, audio_rate in RENDITIONS:
+            rendition = work / f"{height}p"
+            rendition.mkdir()
+            _ffmpeg("-i", video_path, "-map", "0:v:0", "-map", "0:a:0?", "-vf", _scale(height),
+                    "-c:v", "libx264", "-preset", "veryfast", "-b:v", video_rate,
+                    "-maxrate", video_rate, "-bufsize", 2 * video_rate,
+                    "-g", 48, "-keyint_min", 48, "-sc_threshold", 0,
+                    "-c:a", "aac", "-b:a", audio_rate,
+                    "-f", "hls", "-hls_time", SEGMENT_SECONDS, "-hls_playlist_type", "vod",
+                    "-hls_segment_filename", rendition / "seg_%04d.ts", rendition / "index.m3u8")
+            master.append(f"#EXT-X-STREAM-INF:BANDWIDTH={video_rate + audio_rate}")
+            master.append(f"{height}p/index.m3u8")
+        (work / MASTER_PLAYLIST).write_text("\n".join(master) + "\n", encoding="utf-8")
+        with open(work / DONE_MARKER, "w", encoding="utf-8") as f:
+            json.dump(_source_signature(video_path), f)
+    except Exception:
+        shutil.rmtree(work, ignore_errors=True)
+        raise
+    shutil.rmtree(target, ignore_errors=True)
+    work.rename(target)
+    return True
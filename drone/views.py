@@ -1,14 +1,34 @@
 """La definition des vues"""
+import math
+
+from django.conf import settings as main_settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
+from django.db.models import Count, Max, Min
+from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
+from django.template.loader import render_to_string
+from django.urls import reverse
+
+from common.instrumentation import view_percentiles
+from common.profiling import profile_report, profile_reports
+from common.search import search
 
 from . import settings
+from .base_models import SiteArticle
+from .conditional import conditional_page
+from .datalog import DatalogError
 from .forms import DroneFlightCommentForm, DroneArticleCommentForm, DroneComponentCommentForm, \
     DroneConfigurationCommentForm
-from .models import DroneArticle, DroneFlight, DroneConfiguration, DroneComponent
+from .models import ChunkedUpload, DroneArticle, DroneFlight, DroneConfiguration, DroneComponent, \
+    DroneComponentCategory, DroneComponentSpec
+from .pagination import comment_page, keyset_paginate
+from .statistics import cached_fleet_statistics
+from .uploads import UploadConflict, UploadError, start_upload, write_chunk
 from .user_utils import user_is_moderator
 
 
+@conditional_page(lambda request: DroneArticle.objects.visible_to(request.user))
 def index(request):
     """
     Main Page
@@ -16,7 +36,7 @@ def index(request):
     :return: the rendered page
     """
     if request.user.is_authenticated:
-        articles = DroneArticle.objects.order_by('-date')[:15]
+        articles = keyset_paginate(request, DroneArticle.objects.visible_to(request.user).with_comments(), 'date')
         return render(request, "drone/base_articles.html", {
             **settings.base_info,
             "page": "news",
@@ -30,6 +50,7 @@ def index(request):
 
 
 @login_required
+@conditional_page(lambda request, article_id: DroneArticle.objects.visible_to(request.user).filter(pk=article_id))
 def detailed_article(request, article_id):
     """
     page for one article with details
@@ -37,7 +58,7 @@ def detailed_article(request, article_id):
     :param article_id: the id of the article to find
     :return: the rendered page
     """
-    article = get_object_or_404(DroneArticle, pk=article_id)
+    article = get_object_or_404(DroneArticle.objects.visible_to(request.user), pk=article_id)
     new_comment = None
     # comment posted
     if request.method == "POST":
@@ -60,26 +81,52 @@ def detailed_article(request, article_id):
         **settings.base_info,
         "page": "news",
         "article": article,
+        "comments": comment_page(article),
         "new_comment": new_comment,
         "comment_form": comment_form
     })
 
 
 @login_required
+@conditional_page(lambda request: DroneFlight.objects.visible_to(request.user), related=('drone_configuration',))
 def vols(request):
     """
     Main Page
     :param request: the page request
     :return: the rendered page
     """
-    df = DroneFlight.objects.order_by("-date")
+    df = DroneFlight.objects.visible_to(request.user).with_comments().select_related('drone_configuration')
+    sort = request.GET.get("sort", "date")
+    if sort not in DroneFlight.STATISTICS:
+        sort = "date"
+    else:
+        # Les vols sans statistique ne peuvent pas être classés.
+        df = df.filter(**{f"{sort}__isnull": False})
+    statistics = []
+    for name in DroneFlight.STATISTICS:
+        bounds = {}
+        for bound, lookup in (("min", "gte"), ("max", "lte")):
+            bounds[bound] = request.GET.get(f"{bound}_{name}", "")
+            try:
+                df = df.filter(**{f"{name}__{lookup}": float(bounds[bound])})
+            except ValueError:
+                bounds[bound] = ""
+        statistics.append({
+            "name": name,
+            "label": DroneFlight._meta.get_field(name).verbose_name,
+            **bounds,
+        })
+    df = keyset_paginate(request, df, sort)
     return render(request, "drone/base_flight.html", {
         **settings.base_info,
-        "page": "vols", "vols": df
+        "page": "vols", "vols": df,
+        "sort": sort, "statistics": statistics,
     })
 
 
 @login_required
+@conditional_page(lambda request, vol_id: DroneFlight.objects.visible_to(request.user).filter(pk=vol_id),
+                  related=('drone_configuration',))
 def detailed_vol(request, vol_id):
     """
     page for one article with details
@@ -87,7 +134,7 @@ def detailed_vol(request, vol_id):
     :param vol_id: the id of the flight to find
     :return: the rendered page
     """
-    vol = get_object_or_404(DroneFlight, pk=vol_id)
+    vol = get_object_or_404(DroneFlight.objects.visible_to(request.user), pk=vol_id)
     new_comment = None
     # comment posted
     if request.method == "POST":
@@ -106,23 +153,133 @@ def detailed_vol(request, vol_id):
             new_comment.save()
     else:
         comment_form = DroneFlightCommentForm()
+    store = vol.datalog_channels()
+    channels = store.channels if store is not None else []
     return render(request, "drone/detailed_flight.html", {
         **settings.base_info,
         "page": "vols",
         "vol": vol,
+        "channels": channels,
+        "comments": comment_page(vol),
+        "stream": vol.video_stream(),
         "new_comment": new_comment,
         "comment_form": comment_form
     })
 
 
+def _json_floats(values):
+    """Les valeurs manquantes (NaN) ne sont pas du JSON valide."""
+    return [None if math.isnan(v) else v for v in values]
+
+
 @login_required
+@conditional_page(lambda request, vol_id: DroneFlight.objects.visible_to(request.user).filter(pk=vol_id))
+def telemetry(request, vol_id):
+    """
+    Telemetry of a flight, decimated for plotting
+    :param request: the page request, with `channel`, `from`, `to` and `points` parameters
+    :param vol_id: the id of the flight to find
+    :return: the JSON data, or the list of channels when no `channel` is given
+    """
+    vol = get_object_or_404(DroneFlight.objects.visible_to(request.user), pk=vol_id)
+    store = vol.datalog_channels()
+    if store is None:
+        return JsonResponse({"error": "Pas de datalog exploitable pour ce vol."}, status=404)
+    with store:
+        channel = request.GET.get("channel")
+        if not channel:
+            time = store.time()
+            return JsonResponse({
+                "channels": store.channels,
+                "duration": time[-1] if len(time) else 0.0,
+            })
+        try:
+            start = float(request.GET["from"]) if request.GET.get("from") else None
+            end = float(request.GET["to"]) if request.GET.get("to") else None
+            points = int(request.GET.get("points", settings.TELEMETRY_POINTS))
+        except ValueError:
+            return JsonResponse({"error": "Paramètres invalides."}, status=400)
+        points = max(2, min(points, settings.TELEMETRY_MAX_POINTS))
+        try:
+            level, times, lows, highs = store.decimate(channel, start, end, points)
+        except DatalogError as err:
+            return JsonResponse({"error": str(err)}, status=404)
+    return JsonResponse({
+        "channel": channel,
+        "level": level,
+        "t": times,
+        "min": _json_floats(lows),
+        "max": _json_floats(highs),
+    })
+
+
+def _upload_state(upload):
+    """État d'un téléversement renvoyé au navigateur."""
+    return {
+        "id": str(upload.id),
+        "url": reverse('upload_chunk', args=[upload.id]),
+        "field": upload.field,
+        "offset": upload.offset,
+        "size": upload.size,
+        "completed": upload.completed,
+    }
+
+
+@staff_member_required
+def upload_vol(request, vol_id):
+    """
+    Chunked upload of the datalog or video of a flight
+    :param request: the page request, a POST with `field`, `filename` and `size` starts or resumes an upload
+    :param vol_id: the id of the flight to find
+    :return: the upload page, or the JSON state of the upload
+    """
+    vol = get_object_or_404(DroneFlight.objects.visible_to(request.user), pk=vol_id)
+    if request.method == "POST":
+        try:
+            upload = start_upload(request.user, vol, request.POST.get("field"),
+                                  request.POST.get("filename"), int(request.POST.get("size", 0)))
+        except (ValueError, UploadError) as err:
+            return JsonResponse({"error": str(err)}, status=400)
+        return JsonResponse(_upload_state(upload))
+    return render(request, "drone/upload_flight.html", {
+        **settings.base_info,
+        "page": "vols",
+        "vol": vol,
+        "chunk_size": main_settings.CHUNKED_UPLOAD_MAX_CHUNK_SIZE,
+    })
+
+
+@staff_member_required
+def upload_chunk(request, upload_id):
+    """
+    Receive one chunk of an upload
+    :param request: the page request, a PUT with a `Content-Range` header, or a GET for the progress
+    :param upload_id: the id of the upload
+    :return: the JSON state of the upload
+    """
+    upload = get_object_or_404(ChunkedUpload, pk=upload_id, user=request.user)
+    if request.method == "PUT":
+        try:
+            write_chunk(upload, request.headers.get("Content-Range"), request)
+        except UploadConflict as err:
+            upload.refresh_from_db()
+            return JsonResponse({"error": str(err), **_upload_state(upload)}, status=409)
+        except UploadError as err:
+            return JsonResponse({"error": str(err)}, status=400)
+    elif request.method != "GET":
+        return JsonResponse({"error": "Méthode non supportée."}, status=405)
+    return JsonResponse(_upload_state(upload))
+
+
+@login_required
+@conditional_page(lambda request: DroneConfiguration.objects.visible_to(request.user))
 def configurations(request):
     """
     Main Page
     :param request: the page request
     :return: the rendered page
     """
-    dc = DroneConfiguration.objects.order_by('-version_number')
+    dc = keyset_paginate(request, DroneConfiguration.objects.visible_to(request.user).with_comments(), 'version_number')
     return render(request, "drone/base_configuration.html", {
         **settings.base_info,
         "page": "confs", "configurations": dc
@@ -130,6 +287,8 @@ def configurations(request):
 
 
 @login_required
+@conditional_page(lambda request, conf_id: DroneConfiguration.objects.visible_to(request.user).filter(pk=conf_id),
+                  related=('Composants',))
 def detailed_configuration(request, conf_id):
     """
     page for one article with details
@@ -137,7 +296,7 @@ def detailed_configuration(request, conf_id):
     :param conf_id: the id of the article to find
     :return: the rendered page
     """
-    dc = get_object_or_404(DroneConfiguration, pk=conf_id)
+    dc = get_object_or_404(DroneConfiguration.objects.visible_to(request.user), pk=conf_id)
     new_comment = None
     # comment posted
     if request.method == "POST":
@@ -160,26 +319,99 @@ def detailed_configuration(request, conf_id):
         **settings.base_info,
         "page": "confs",
         "conf": dc,
+        "comments": comment_page(dc),
+        "composants": dc.Composants.visible_to(request.user),
         "new_comment": new_comment,
         "comment_form": comment_form
     })
 
 
 @login_required
+def diff_configurations(request):
+    """
+    Differences between two configuration versions
+    :param request: the page request, with the `from` and `to` version numbers
+    :return: the rendered page
+    """
+    visible = DroneConfiguration.objects.visible_to(request.user)
+    old_version = request.GET.get("from", "")
+    new_version = request.GET.get("to", "")
+    context = {
+        **settings.base_info,
+        "page": "confs",
+        "versions": visible.order_by('version_number').values_list('version_number', flat=True).distinct(),
+        "old_version": old_version, "new_version": new_version,
+    }
+    if old_version and new_version:
+        old = visible.filter(version_number=old_version).order_by('-date').first()
+        new = visible.filter(version_number=new_version).order_by('-date').first()
+        if old is None or new is None:
+            raise Http404("Version de configuration inconnue.")
+        old_components = set(old.Composants.visible_to(request.user).select_related('category'))
+        new_components = set(new.Composants.visible_to(request.user).select_related('category'))
+        context.update({
+            "old": old, "new": new,
+            "added": sorted(new_components - old_components, key=str),
+            "removed": sorted(old_components - new_components, key=str),
+            "kept": sorted(old_components & new_components, key=str),
+            "totals": [
+                {
+                    "label": DroneConfiguration._meta.get_field(field).verbose_name,
+                    "unit": "g" if field.startswith("poids") else "€",
+                    "old": getattr(old, field),
+                    "new": getattr(new, field),
+                    "delta": getattr(new, field) - getattr(old, field),
+                }
+                for field in DroneConfiguration.ROLLUP.values()
+            ],
+        })
+    return render(request, "drone/diff_configuration.html", context)
+
+
+@login_required
+@conditional_page(lambda request: DroneComponent.objects.visible_to(request.user))
 def composants(request):
     """
     Main Page
     :param request: the page request
     :return: the rendered page
     """
-    dc = DroneComponent.objects.order_by("titre")
+    visible = DroneComponent.objects.visible_to(request.user)
+    # Facettes : nombre de composants par catégorie, puis plages des caractéristiques
+    categories = DroneComponentCategory.objects.filter(dronecomponent__in=visible).annotate(
+        nb=Count('dronecomponent')).order_by('name')
+    category = request.GET.get("category", "")
+    if category.isdigit():
+        visible = visible.filter(category_id=int(category))
+    else:
+        category = ""
+    specs = DroneComponentSpec.objects.filter(component__in=visible).values('key').annotate(
+        nb=Count('id'), min=Min('value'), max=Max('value')).order_by('key')
+    spec = request.GET.get("spec", "")
+    bounds = {}
+    if spec:
+        lookups = {"spec_values__key": spec}
+        for bound, lookup in (("min", "gte"), ("max", "lte")):
+            bounds[bound] = request.GET.get(bound, "")
+            try:
+                lookups[f"spec_values__value__{lookup}"] = float(bounds[bound])
+            except ValueError:
+                bounds[bound] = ""
+        # une seule jointure sur la table des caractéristiques, servie par son index (key, value)
+        visible = visible.filter(**lookups)
+    dc = keyset_paginate(
+        request, visible.with_comments().select_related('category'), 'titre',
+        descending=False)
     return render(request, "drone/base_composants.html", {
         **settings.base_info,
-        "page": "comps", "composants": dc
+        "page": "comps", "composants": dc,
+        "categories": categories, "category": category,
+        "specs": specs, "spec": spec, **bounds,
     })
 
 
 @login_required
+@conditional_page(lambda request, comp_id: DroneComponent.objects.visible_to(request.user).filter(pk=comp_id))
 def detailed_composant(request, comp_id):
     """
     page for one article with details
@@ -187,7 +419,7 @@ def detailed_composant(request, comp_id):
     :param comp_id: the id of the article to find
     :return: the rendered page
     """
-    dc = get_object_or_404(DroneComponent, pk=comp_id)
+    dc = get_object_or_404(DroneComponent.objects.visible_to(request.user), pk=comp_id)
     new_comment = None
     # comment posted
     if request.method == "POST":
@@ -210,6 +442,109 @@ def detailed_composant(request, comp_id):
         **settings.base_info,
         "page": "comps",
         "comp": dc,
+        "comments": comment_page(dc),
         "new_comment": new_comment,
         "comment_form": comment_form
     })
+
+
+@login_required
+@conditional_page(lambda request, article_id: SiteArticle.objects.visible_to(request.user).filter(pk=article_id))
+def commentaires(request, article_id):
+    """
+    Older comments of an article, loaded on demand by the detail pages
+    :param request: the page request, with the `before` cursor of the last displayed comment
+    :param article_id: the id of the article, flight, configuration or component
+    :return: the JSON with the rendered comments and the url of the next page
+    """
+    article = get_object_or_404(SiteArticle.objects.visible_to(request.user), pk=article_id)
+    comments = comment_page(article, request.GET.get("before"))
+    return JsonResponse({
+        "html": render_to_string("drone/comment_list.html", {"comments": comments}, request),
+        "next_url": comments.next_url,
+    })
+
+
+@login_required
+def statistiques(request):
+    """
+    Fleet statistics per configuration and per component
+    :param request: the page request
+    :return: the rendered page
+    """
+    statistics = cached_fleet_statistics()
+    # Les statistiques sont communes à tous, seules les lignes visibles sont montrées.
+    configurations = set(DroneConfiguration.objects.visible_to(request.user).values_list('pk', flat=True))
+    components = set(DroneComponent.objects.visible_to(request.user).values_list('pk', flat=True))
+    return render(request, "drone/base_statistics.html", {
+        **settings.base_info,
+        "page": "stats",
+        "configurations": [row for row in statistics["configurations"] if row["id"] in configurations],
+        "composants": [row for row in statistics["composants"] if row["id"] in components],
+    })
+
+
+@staff_member_required
+def performances(request):
+    """
+    Response time percentiles per view, gathered by the instrumentation middleware
+    :param request: the page request
+    :return: the rendered page
+    """
+    return render(request, "drone/performances.html", {
+        **settings.base_info,
+        "page": "perfs",
+        "views": view_percentiles(),
+        "slow_request_ms": main_settings.INSTRUMENTATION_SLOW_REQUEST_MS,
+        "profiles": [path.name for path in profile_reports()],
+    })
+
+
+@staff_member_required
+def profil(request, name):
+    """
+    A profiling report recorded by the profiling middleware
+    :param request: the page request
+    :param name: the file name of the report
+    :return: the report as plain text
+    """
+    path = profile_report(name)
+    if path is None:
+        raise Http404("Rapport de profilage introuvable")
+    return HttpResponse(path.read_text(encoding="utf-8"), content_type="text/plain; charset=utf-8")
+
+
+# Pages de détail des résultats de recherche, par type d'article
+SEARCH_RESULTS = (
+    (DroneArticle, 'detailed_article', "mdi-newspaper"),
+    (DroneFlight, 'detailed_vols', "mdi-airport"),
+    (DroneConfiguration, 'detailed_confs', "mdi-quadcopter"),
+    (DroneComponent, 'detailed_comps', "mdi-chip"),
+)
+
+
+@login_required
+def recherche(request):
+    """
+    Full-text search in articles, flights, configurations, components and their comments
+    :param request: the page request, with the searched text in `q`
+    :return: the rendered page
+    """
+    text = request.GET.get("q", "").strip()
+    results = search(text, SiteArticle.objects.visible_to(request.user)) if text else []
+    # le type de chaque résultat, pour construire son lien
+    ids = [result["id"] for result in results]
+    kinds = {}
+    for model, url_name, icon in SEARCH_RESULTS:
+        for pk in model.objects.filter(pk__in=ids).values_list('pk', flat=True):
+            kinds[pk] = (url_name, icon)
+    for result in results:
+        url_name, icon = kinds.get(result["id"], (None, ""))
+        result["url"] = reverse(url_name, args=[result["id"]]) if url_name else ""
+        result["icon"] = icon
+    return render(request, "drone/search.html", {
+        **settings.base_info,
+        "page": "search",
+        "q": text,
+        "results": results,
+    })
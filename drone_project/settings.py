@@ -2,6 +2,7 @@
 Django's settings for drone project.
 """
 import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -45,10 +46,12 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'common.instrumentation.InstrumentationMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'common.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -57,7 +60,8 @@ ROOT_URLCONF = 'drone_project.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, with the rendering time reported by the instrumentation
+        'BACKEND': 'common.instrumentation.TimedDjangoTemplates',
         'DIRS': [
             SITE_DIR / 'data' / 'templates' / 'common',
             SITE_DIR / 'data' / 'templates',
@@ -86,13 +90,54 @@ EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', '1') == '1'
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
+# SQLite is tuned for several gunicorn workers sharing the file:
+# - WAL lets readers go on while a comment is being written,
+# - synchronous=NORMAL is safe with WAL (only the last commits can be lost
+#   on power failure, never the database),
+# - mmap and a larger page cache avoid read() calls on the hot pages,
+# - IMMEDIATE transactions take the write lock upfront instead of failing
+#   with "database is locked" when a read transaction turns into a write,
+#   and the timeout makes a writer wait for the lock instead of failing.
+SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', 64 * 1024))
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db' / 'db.sqlite3',
+        'OPTIONS': {
+            'init_command': ';'.join([
+                'PRAGMA journal_mode=WAL',
+                'PRAGMA synchronous=NORMAL',
+                f'PRAGMA mmap_size={SQLITE_MMAP_SIZE}',
+                f'PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}',
+                'PRAGMA temp_store=MEMORY',
+            ]),
+            'transaction_mode': 'IMMEDIATE',
+            # busy timeout, in seconds
+            'timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 20)),
+        },
+        # Persistent connections: each worker keeps its connection between requests.
+        'CONN_MAX_AGE': int(os.environ.get('CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': os.environ.get('CONN_HEALTH_CHECKS', '1') == '1',
     }
 }
 
+# Cache, partagé entre les workers gunicorn et le worker des tâches de fond
+# (même répertoire monté dans les deux conteneurs, voir docker-compose.yml)
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CACHE_DIR', Path(tempfile.gettempdir()) / 'webdrone_cache'),
+    },
+    # Fragments de templates des pages de liste, à part pour pouvoir être vidés seuls
+    'fragments': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('FRAGMENT_CACHE_DIR', Path(tempfile.gettempdir()) / 'webdrone_fragments'),
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -131,6 +176,21 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [SITE_DIR / 'data' / 'static']
 STATIC_ROOT = BASE_DIR / 'staticfiles'
+# In production (STATIC_MANIFEST=1, set for `web` in docker-compose.yml), collectstatic
+# produces content-hashed names (base_default.<hash>.css) and their .gz / .br variants,
+# served by nginx with far-future cache headers. The manifest storage refuses to render
+# a page whose files were not collected, so local runs (runserver, tests) keep the
+# plain names and need no collectstatic.
+STATIC_MANIFEST = os.environ.get('STATIC_MANIFEST', '0') == '1'
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': ('whitenoise.storage.CompressedManifestStaticFilesStorage' if STATIC_MANIFEST
+                    else 'django.contrib.staticfiles.storage.StaticFilesStorage'),
+    },
+}
 
 # Les medias
 MEDIA_URL = "/media/"
@@ -141,9 +201,42 @@ LOGIN_URL = '/profile/login/'
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
 
-# Upload limits (500 MB for flight videos)
-DATA_UPLOAD_MAX_MEMORY_SIZE = 524288000
-FILE_UPLOAD_MAX_MEMORY_SIZE = 524288000
+# Upload limits: files above FILE_UPLOAD_MAX_MEMORY_SIZE are streamed to a
+# temporary file on disk instead of being held in the worker's memory.
+# Flight datalogs and videos go through the chunked upload (drone.uploads).
+DATA_UPLOAD_MAX_MEMORY_SIZE = 5242880
+FILE_UPLOAD_MAX_MEMORY_SIZE = 2621440
+FILE_UPLOAD_TEMP_DIR = os.environ.get('FILE_UPLOAD_TEMP_DIR') or None
+
+# Chunked uploads: parts are kept out of MEDIA_ROOT, on a persistent volume,
+# so an interrupted upload can be resumed even after a restart.
+CHUNKED_UPLOAD_DIR = Path(os.environ.get('CHUNKED_UPLOAD_DIR', BASE_DIR / 'db' / 'uploads'))
+CHUNKED_UPLOAD_MAX_CHUNK_SIZE = 16777216
+CHUNKED_UPLOAD_MAX_SIZE = 524288000
+
+# Request instrumentation (common.instrumentation): requests and SQL queries
+# slower than these thresholds (in milliseconds) are logged with their view.
+INSTRUMENTATION_SLOW_REQUEST_MS = int(os.environ.get('INSTRUMENTATION_SLOW_REQUEST_MS', 500))
+INSTRUMENTATION_SLOW_QUERY_MS = int(os.environ.get('INSTRUMENTATION_SLOW_QUERY_MS', 100))
+
+# Background jobs (common.jobs), run by `manage.py run_jobs`. When eager, they
+# run inside the request instead (tests, development without a worker).
+JOBS_EAGER = os.environ.get('JOBS_EAGER', '0') == '1'
+
+# On-demand profiling (common.profiling): staff add ?_profile to any URL,
+# the cProfile / tracemalloc report is written in this directory.
+PROFILE_DIR = Path(os.environ.get('PROFILE_DIR', BASE_DIR / 'db' / 'profiles'))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'common.instrumentation': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
 
 # Markdownx configuration
 # https://neutronx.github.io/django-markdownx/